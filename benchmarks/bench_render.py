@@ -0,0 +1,113 @@
+"""
+Router HTML rendering benchmark
+
+Renders synthetic 500-operation routers and a 100-router chat history,
+cold (cache cleared) and warm (memoized), and reports timings.
+
+Usage:
+    python benchmarks/bench_render.py [--operations 500] [--history 100] [--repeat 5]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from router_render import csv_to_html, clear_render_cache
+
+WORK_CENTERS = [
+    ("SAW", "CUT TO LENGTH", "CUT MATERIAL TO LENGTH PER THE DWG."),
+    ("WATERJT", "CUT OUT", "VETTED S.O. [DATE] CUT OUT PER THE DWG AND DEBURR."),
+    ("CNC-M", "MACHINE PART", "MACHINE PART PER THE DWG AND DEBURR."),
+    ("BEND", "BEND", "BEND PART TO THE DWG."),
+    ("SUB-PL", "SUB PLATING", '"PLATE, OUTSIDE VENDOR, ZINC PLATE"'),
+]
+
+
+def make_router(operations, quantity=50, part_number="Z110001B045"):
+    """Synthetic M2M router CSV with the given number of operations"""
+    lines = [
+        "MAC,,,,,Standard Routing Summary,,,,,Page : 1 of 1",
+        ",,,,,,,,,Date : 10/19/2026",
+        ",,,,,,,,,Time : 10:00:00 AM EST",
+        ",,,,,,,,,",
+        "Facility,Part Number,Rev,Description,Unit of Measure,Standard Process Qty,,,",
+        f"Default,{part_number},0,SLEEVE WIPING CAP <REV B>,EA,{quantity}.00000,,,",
+        ",,,,,,,,,",
+        ",,,,,,,,,",
+        "Op,Work Center,Operation Description,Operation Qty,Setup Hours,Production Hours,"
+        "Move Hours,Sub-Contract Costs,Other Costs,Standard Cost/Operation",
+    ]
+    total_setup = total_run = 0.0
+    for n in range(operations):
+        code, desc, instruction = WORK_CENTERS[n % len(WORK_CENTERS)]
+        setup, run = 0.5, round(quantity * 3 / 60.0, 2)
+        total_setup += setup
+        total_run += run
+        lines.append(f"{(n + 1) * 10},{code},{desc},{quantity}.0000,{setup:.2f},{run:.2f},0.00,0.00,0.00,0.00")
+        lines.append(f",{instruction},,,,,,,,,")
+        lines.append(",,,,,,,,,")
+    lines += [
+        f"Totals,,,,{total_setup:.2f},{total_run:.2f},0.00,0.00,0.00,0.00",
+        f"Totals per Unit,,,,{total_setup / quantity:.2f},{total_run / quantity:.2f},0.00,0.00,0.00,0.00",
+        ",,,,,,,,,",
+        ",,,,,,End of Report,,,",
+        ",,,,,,,,,",
+        ",,,,,,This report was requested by MAC ROUTER GENERATOR,,,",
+    ]
+    return "\n".join(lines)
+
+
+def timed(fn, repeat):
+    """Best-of-N wall time in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, (time.perf_counter() - t0) * 1000)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--operations", type=int, default=500)
+    parser.add_argument("--history", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    big_router = make_router(args.operations)
+
+    def cold_big():
+        clear_render_cache()
+        csv_to_html(big_router)
+
+    # History routers differ by part number so each one is a separate cache entry
+    history = [make_router(4, quantity=10 + n, part_number=f"Z11000{n:04d}") for n in range(args.history)]
+
+    def cold_history():
+        clear_render_cache()
+        for router in history:
+            csv_to_html(router)
+
+    def warm_history():
+        for router in history:
+            csv_to_html(router)
+
+    cold_big_ms = timed(cold_big, args.repeat)
+    csv_to_html(big_router)
+    warm_big_ms = timed(lambda: csv_to_html(big_router), args.repeat)
+    cold_history_ms = timed(cold_history, args.repeat)
+    warm_history_ms = timed(warm_history, args.repeat)
+
+    print(f"{args.operations}-operation router ({len(big_router):,} bytes)")
+    print(f"  cold render : {cold_big_ms:8.2f} ms")
+    print(f"  memoized    : {warm_big_ms:8.3f} ms")
+    print(f"{args.history}-router history")
+    print(f"  cold render : {cold_history_ms:8.2f} ms")
+    print(f"  memoized    : {warm_history_ms:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Cold-start import benchmark
+
+Imports every router module the Streamlit app imports in a fresh interpreter with -X importtime,
+reports import time per module and the heaviest dependencies, and exits non-zero if the cold start
+is over budget or a lazily loaded dependency (the Gemini SDK, PDF libraries) got imported at startup.
+
+Usage:
+    python benchmarks/bench_startup.py [--budget-ms 300] [--repeat 5] [--top 15] [--with-streamlit]
+"""
+
+import argparse
+import ast
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPO_ROOT, "router_generator_app.py")
+DEFAULT_BUDGET_MS = float(os.environ.get("ROUTER_STARTUP_BUDGET_MS", "300"))
+
+# Must only load on first generation / first PDF parse
+LAZY_MODULES = ["google.generativeai", "pypdf", "pypdfium2"]
+
+
+def app_modules(with_streamlit=False):
+    """Top-level modules the app imports (its router_* modules, plus streamlit if asked)"""
+    with open(APP_PATH, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.ImportFrom) and node.module:
+            names = [node.module]
+        elif isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        else:
+            continue
+        for name in names:
+            if name.startswith("router_") or (with_streamlit and name == "streamlit"):
+                if name not in modules:
+                    modules.append(name)
+    return modules
+
+
+def measure(modules):
+    """One cold import in a fresh interpreter: ([(name, self_us, cumulative_us, depth)], lazily loaded found)"""
+    check = "import sys; print(','.join(m for m in %r if m in sys.modules))" % (LAZY_MODULES,)
+    code = f"import {', '.join(modules)}; {check}"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=REPO_ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    loaded = [m for m in result.stdout.strip().split(",") if m]
+    return entries, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--with-streamlit", action="store_true", help="Include streamlit's own import in the budget")
+    args = parser.parse_args()
+
+    modules = app_modules(args.with_streamlit)
+    # Best of several runs - the first one also pays for cold disk cache and .pyc compilation
+    runs = [measure(modules) for _ in range(args.repeat)]
+    entries, loaded = min(runs, key=lambda run: sum(e[2] for e in run[0] if e[3] == 0))
+    total_ms = sum(e[2] for e in entries if e[3] == 0) / 1000.0
+
+    print(f"Cold start: {total_ms:.1f} ms importing {len(modules)} modules (best of {args.repeat})")
+    print()
+    print(f"{'Module':<28}{'Cumulative ms':>15}")
+    cumulative = {name: cum for name, _, cum, _ in entries}
+    for name in sorted(modules, key=lambda m: -cumulative.get(m, 0)):
+        # Modules already pulled in by an earlier import show as 0
+        print(f"{name:<28}{cumulative.get(name, 0) / 1000.0:>15.1f}")
+    print()
+    print(f"Heaviest imports (self time):")
+    for name, self_us, cum_us, depth in sorted(entries, key=lambda e: -e[1])[:args.top]:
+        print(f"  {name:<60}{self_us / 1000.0:>8.1f} ms")
+
+    failed = False
+    if loaded:
+        print(f"\nFAIL: imported at startup but should be lazy: {', '.join(loaded)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"\nFAIL: cold start {total_ms:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if not failed:
+        print(f"\nOK: within the {args.budget_ms:.0f} ms budget")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Golden-set accuracy and latency benchmark
+
+Runs every model over the golden cases - the 14 shop routers in the knowledge base plus any approved
+routers added since - and compares each generated router with the approved one. Reports per model:
+op-sequence accuracy (exact work-center sequence, and edit-distance similarity), mean absolute error
+of total setup and run hours, tokens per part and p50/p95 latency.
+
+Cases live in benchmarks/golden/cases.json; their drawings in benchmarks/golden/drawings, named after
+the part number (Z110001B045.pdf) or as given by a case's "drawing" field. Cases without a drawing
+are skipped against the live model; the fake backend generates from a placeholder drawing instead, which
+times the pipeline and counts tokens but is never scored - accuracy is only reported for real drawings.
+No drawings are checked in yet, so as shipped the golden set measures no accuracy (see golden/README.md).
+Set ROUTER_RECORD_MODE=replay to score recorded responses without calling the API.
+
+Usage:
+    python benchmarks/golden_set.py --fake
+    python benchmarks/golden_set.py --models gemini-3-flash-preview,gemini-2.0-flash --concurrency 4
+    python benchmarks/golden_set.py --add approved/Z110001B050_router.csv --drawing Z110001B050.pdf
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Golden parts are compared one by one - never served a near-duplicate's router
+os.environ.setdefault("ROUTER_SIMILARITY", "0")
+
+from load_test import minimal_pdf
+from router_fake_backend import FakeBackend
+from router_hedging import percentile
+from router_hotfolder import DRAWING_EXTENSIONS
+from router_model import parse_router
+from router_pipeline import GEMINI_MODELS, OUTPUT_FORMAT, generate_router_with_gemini, get_backend
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+CASES_PATH = os.path.join(GOLDEN_DIR, "cases.json")
+DRAWINGS_DIR = os.path.join(GOLDEN_DIR, "drawings")
+
+
+class MeteredBackend:
+    """Wraps a backend and adds up token usage per (model, drawing) across generate and repair calls"""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.name = inner.name
+        self.tokens = {}
+        self._lock = threading.Lock()
+
+    def upload(self, drawing, api_key):
+        return self.inner.upload(drawing, api_key)
+
+    def generate(self, uploaded, prompt, model_name, session_id, fingerprint):
+        raw_text, usage = self.inner.generate(uploaded, prompt, model_name, session_id, fingerprint)
+        key = (model_name, fingerprint.get('drawing_hash'))
+        with self._lock:
+            self.tokens[key] = self.tokens.get(key, 0) + (usage or {}).get('total_tokens', 0)
+        return raw_text, usage
+
+
+def load_cases():
+    with open(CASES_PATH, encoding="utf-8") as f:
+        return json.load(f)['cases']
+
+
+def drawing_path(case):
+    """Path of a case's drawing, or None when it isn't on file yet"""
+    names = [case['drawing']] if case.get('drawing') else [case['part_number'] + ext for ext in DRAWING_EXTENSIONS]
+    for name in names:
+        path = os.path.join(DRAWINGS_DIR, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def add_case(router_path, drawing, quantity=None):
+    """Store an approved router and its drawing as a new golden case (replacing one for the same part)"""
+    with open(router_path, encoding="utf-8") as f:
+        router = parse_router(f.read())
+    if not router['part_number'] or not router['operations']:
+        raise SystemExit(f"{router_path} has no part number or operations")
+    extension = os.path.splitext(drawing)[1].lower()
+    if extension not in DRAWING_EXTENSIONS:
+        raise SystemExit(f"{drawing} isn't a PDF or a TIFF/PNG/JPEG scan")
+    os.makedirs(DRAWINGS_DIR, exist_ok=True)
+    drawing_name = router['part_number'] + extension
+    shutil.copyfile(drawing, os.path.join(DRAWINGS_DIR, drawing_name))
+
+    case = {
+        'part_number': router['part_number'],
+        'description': router['description'],
+        'quantity': quantity or router['quantity'],
+        'drawing': drawing_name,
+        'source': os.path.basename(router_path),
+        'operations': [{key: op[key] for key in ('work_center', 'setup_hours', 'run_hours', 'move_hours')}
+                       for op in router['operations']],
+    }
+    cases = [c for c in load_cases() if c['part_number'] != case['part_number']] + [case]
+    tmp_path = CASES_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({'cases': cases}, f, indent=2)
+        f.write("\n")
+    os.replace(tmp_path, CASES_PATH)
+    return case
+
+
+def sequence_similarity(expected, actual):
+    """1 - normalized edit distance between two work-center sequences"""
+    if not expected and not actual:
+        return 1.0
+    previous = list(range(len(actual) + 1))
+    for i, wc in enumerate(expected, 1):
+        current = [i]
+        for j, other in enumerate(actual, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (wc != other)))
+        previous = current
+    return 1.0 - previous[-1] / max(len(expected), len(actual))
+
+
+def score(case, router_csv):
+    """Comparison of one generated router with its golden case"""
+    expected = [op['work_center'] for op in case['operations']]
+    operations = parse_router(router_csv)['operations']
+    actual = [op['work_center'].upper() for op in operations]
+    return {
+        'exact': expected == actual,
+        'similarity': sequence_similarity(expected, actual),
+        'setup_error': abs(sum(op['setup_hours'] for op in operations)
+                           - sum(op['setup_hours'] for op in case['operations'])),
+        'run_error': abs(sum(op['run_hours'] for op in operations)
+                         - sum(op['run_hours'] for op in case['operations'])),
+        'expected': expected,
+        'actual': actual,
+    }
+
+
+def run_case(case, model_name, backend, api_key, live):
+    """Generate one golden part; returns its result row"""
+    path = drawing_path(case)
+    if path is None and live:
+        return {'part_number': case['part_number'], 'skipped': True}
+    if path is None:
+        drawing = minimal_pdf(f"{case['part_number']} {case['description']}")
+    else:
+        with open(path, "rb") as f:
+            drawing = f.read()
+    t0 = time.perf_counter()
+    router_csv = generate_router_with_gemini(drawing, case['quantity'], api_key, model_name,
+                                             session_id="golden", backend=backend)
+    row = {'part_number': case['part_number'], 'seconds': time.perf_counter() - t0, 'skipped': False,
+           'placeholder': path is None}
+    if router_csv.startswith('Error:'):
+        row['error'] = router_csv.split('\n')[0]
+    elif path is not None:
+        row.update(score(case, router_csv))
+    return row
+
+
+def run_model(model_name, cases, backend, api_key, live, concurrency):
+    """Run every case against one model, at most concurrency at a time; returns the result rows"""
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="golden") as executor:
+        futures = [executor.submit(run_case, case, model_name, backend, api_key, live) for case in cases]
+        return [future.result() for future in futures]
+
+
+def summarize(model_name, rows, tokens):
+    """Per-model report line"""
+    ran = [row for row in rows if not row['skipped']]
+    # A router generated from a placeholder says nothing about accuracy - only real drawings are scored
+    scored = [row for row in ran if 'error' not in row and not row['placeholder']]
+    latencies = [row['seconds'] for row in ran]
+    model_tokens = [count for (model, _), count in tokens.items() if model == model_name]
+    return {
+        'model': model_name,
+        'cases': len(ran),
+        'skipped': len(rows) - len(ran),
+        'errors': sum('error' in row for row in ran),
+        'scored': len(scored),
+        'exact': sum(row['exact'] for row in scored) / len(scored) if scored else None,
+        'similarity': sum(row['similarity'] for row in scored) / len(scored) if scored else None,
+        'setup_mae': sum(row['setup_error'] for row in scored) / len(scored) if scored else None,
+        'run_mae': sum(row['run_error'] for row in scored) / len(scored) if scored else None,
+        'tokens': sum(model_tokens) / len(model_tokens) if model_tokens else 0.0,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+    }
+
+
+def _metric(value, width, spec):
+    return f"{'-':>{width}}" if value is None else f"{value:>{width}{spec}}"
+
+
+def print_report(summaries):
+    print(f"{'model':<24}{'cases':>6}{'errors':>7}{'scored':>7}{'exact ops':>11}{'op sim':>8}"
+          f"{'setup MAE':>11}{'run MAE':>9}{'tokens':>8}{'p50 s':>8}{'p95 s':>8}")
+    for s in summaries:
+        print(f"{s['model']:<24}{s['cases']:>6}{s['errors']:>7}{s['scored']:>7}"
+              f"{_metric(s['exact'], 11, '.0%')}{_metric(s['similarity'], 8, '.0%')}"
+              f"{_metric(s['setup_mae'], 11, '.2f')}{_metric(s['run_mae'], 9, '.2f')}"
+              f"{s['tokens']:>8.0f}{s['p50']:>8.2f}{s['p95']:>8.2f}")
+    if not any(s['scored'] for s in summaries):
+        print("No case was scored against a real drawing, so no accuracy is reported - only latency and tokens."
+              f"\nAdd approved routers with their drawings (--add ROUTER_CSV --drawing PDF) to {DRAWINGS_DIR}")
+
+
+def print_misses(model_name, rows):
+    """Parts whose operation sequence didn't match, so regressions can be traced to a part"""
+    for row in rows:
+        if row.get('error'):
+            print(f"  {model_name} {row['part_number']}: {row['error']}")
+        elif 'exact' in row and not row['exact']:
+            print(f"  {model_name} {row['part_number']}: expected {'/'.join(row['expected'])},"
+                  f" got {'/'.join(row['actual']) or 'nothing'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", default=",".join(GEMINI_MODELS), help="Comma-separated models to run")
+    parser.add_argument("--concurrency", type=int, default=4, help="Golden parts generating at once per model")
+    parser.add_argument("--fake", action="store_true", help="Use the local fake model backend (no API calls)")
+    parser.add_argument("--latency", type=float, default=0.5, help="Fake backend mean latency in seconds")
+    parser.add_argument("--misses", action="store_true", help="List the parts each model got wrong")
+    parser.add_argument("--json", default=None, help="Also write the per-model summary and rows to this file")
+    parser.add_argument("--add", default=None, metavar="ROUTER_CSV", help="Add an approved router as a golden case")
+    parser.add_argument("--drawing", default=None, help="Drawing for --add")
+    parser.add_argument("--quantity", type=int, default=None, help="Quantity for --add (default: the router's)")
+    args = parser.parse_args()
+
+    if args.add:
+        if not args.drawing:
+            parser.error("--add needs --drawing")
+        case = add_case(args.add, args.drawing, args.quantity)
+        print(f"Added {case['part_number']} ({len(case['operations'])} operations, qty {case['quantity']})")
+        return
+
+    api_key = os.environ.get("GEMINI_API_KEY", "")
+    replaying = os.environ.get("ROUTER_RECORD_MODE", "off").strip().lower() == "replay"
+    if not api_key and not (args.fake or replaying):
+        parser.error("Set GEMINI_API_KEY (or use --fake, or ROUTER_RECORD_MODE=replay)")
+    if args.fake:
+        inner = FakeBackend(latency=args.latency, jitter=args.latency / 2, seed=7, compact=OUTPUT_FORMAT == "compact")
+    else:
+        inner = get_backend()
+    backend = MeteredBackend(inner)
+
+    cases = load_cases()
+    models = [m.strip() for m in args.models.split(",") if m.strip()]
+    print(f"{len(cases)} golden cases, {len(models)} models, concurrency {args.concurrency} ({backend.name} backend)")
+    summaries = []
+    results = {}
+    for model_name in models:
+        rows = run_model(model_name, cases, backend, api_key, not args.fake, args.concurrency)
+        results[model_name] = rows
+        summaries.append(summarize(model_name, rows, backend.tokens))
+    print_report(summaries)
+    if args.misses:
+        for model_name in models:
+            print_misses(model_name, results[model_name])
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({'summary': summaries, 'rows': results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Concurrent-session load test
+
+Simulates N planners submitting drawings at once against the local fake model
+backend. Each session runs the real chat handler (generation pipeline, cleanup,
+HTML rendering) and then the non-widget work of a script rerun. Reports
+throughput, end-to-end latency percentiles, rerun time and memory per session
+as concurrency rises.
+
+Usage:
+    python benchmarks/load_test.py --sessions 1,5,10,20 --submissions 3 --latency 1.0
+"""
+
+import argparse
+import io
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# The synthetic drawings all look alike - measure generation, not near-duplicate reuse
+os.environ.setdefault("ROUTER_SIMILARITY", "0")
+
+from router_chat import init_session_state, handle_chat_submission, routers_generated
+from router_fake_backend import FakeBackend
+from router_hedging import percentile
+from router_render import csv_to_html
+
+
+class FakeUpload(io.BytesIO):
+    """Stands in for the UploadedFile objects st.chat_input returns"""
+
+    def __init__(self, data, name):
+        super().__init__(data)
+        self.name = name
+
+
+def minimal_pdf(text, size=12 * 1024):
+    """Small valid one-page PDF showing text (so it passes pre-flight), padded to about size bytes"""
+    stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET\n".encode()
+    stream += b"%" + b"0" * max(size - 600, 0) + b"\n"
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"endstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return out
+
+
+def simulate_rerun(state):
+    """The non-widget work a Streamlit rerun repeats: state init, metrics, history and export render"""
+    init_session_state(state)
+    routers_generated(state)
+    page = [message['content'] for message in state['chat_history']]
+    if state['router_generated'] and state['router_csv']:
+        page.append(csv_to_html(state['router_csv']))
+    return sum(len(part) for part in page)
+
+
+def run_level(sessions, submissions, backend, model_name, shared_drawing):
+    """Run one concurrency level and return its measurements"""
+    states = [{} for _ in range(sessions)]
+    for state in states:
+        init_session_state(state)
+    latencies = []
+    reruns = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(sessions)
+
+    def session(index):
+        state = states[index]
+        barrier.wait()
+        for n in range(submissions):
+            # Distinct drawings per session unless we're deliberately testing coalescing
+            seed = "shared" if shared_drawing else f"session-{index}-{n}"
+            upload = FakeUpload(minimal_pdf(seed), f"drawing_{index}_{n}.pdf")
+            t0 = time.perf_counter()
+            handle_chat_submission(state, f"Generate router for {10 + n} pieces", [upload],
+                                   "fake-key", model_name, backend=backend)
+            t1 = time.perf_counter()
+            simulate_rerun(state)
+            t2 = time.perf_counter()
+            with lock:
+                latencies.append(t2 - t0)
+                reruns.append(t2 - t1)
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'sessions': sessions,
+        'requests': len(latencies),
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'rerun_ms': 1000 * sum(reruns) / len(reruns) if reruns else 0.0,
+        'kb_per_session': (current - baseline) / 1024 / sessions,
+        'peak_kb': (peak - baseline) / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", default="1,5,10,20", help="Comma-separated concurrency levels")
+    parser.add_argument("--submissions", type=int, default=3, help="Drawings submitted per session")
+    parser.add_argument("--latency", type=float, default=1.0, help="Fake model latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument("--tail-probability", type=float, default=0.02)
+    parser.add_argument("--tail-latency", type=float, default=8.0)
+    parser.add_argument("--model", default="gemini-3-flash-preview")
+    parser.add_argument("--shared-drawing", action="store_true", help="Every session submits the same drawing")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    backend = FakeBackend(latency=args.latency, jitter=args.jitter, tail_probability=args.tail_probability,
+                          tail_latency=args.tail_latency, seed=args.seed)
+
+    print(f"{'sessions':>8} {'reqs':>5} {'req/s':>7} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} "
+          f"{'rerun ms':>9} {'KB/sess':>8} {'peak KB':>8}")
+    for level in [int(n) for n in args.sessions.split(",") if n.strip()]:
+        result = run_level(level, args.submissions, backend, args.model, args.shared_drawing)
+        print(f"{result['sessions']:>8} {result['requests']:>5} {result['throughput']:>7.2f} "
+              f"{result['p50']:>7.2f} {result['p95']:>7.2f} {result['p99']:>7.2f} "
+              f"{result['rerun_ms']:>9.2f} {result['kb_per_session']:>8.1f} {result['peak_kb']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+MAC Router Generator - HTTP API
+Local JSON/CSV service so ERP and quoting tools can request routers without the chat UI
+
+    POST /routers?quantity=50[&model=...][&wait=1]   body: the drawing (PDF or TIFF/PNG/JPEG scan)
+        202 {"id": ..., "status": "queued", ...}  (or 200 text/csv with wait=1)
+        422/413 {"error": ...} at once for a file that fails pre-flight (corrupt, encrypted, too big...)
+    GET  /jobs/<id>                                   job status as JSON
+    GET  /jobs/<id>/result                            router CSV once the job is done
+    GET  /health
+
+quantity accepts the same forms as the chat ("50", "10/50/100", "10-100 step 10"); several give a price-break CSV.
+A multi-part drawing package is split per part like in the chat: the result is then a zip with one CSV per part,
+and the job lists its parts with their status.
+
+Usage:
+    GEMINI_API_KEY=... python router_api.py --port 8600
+    python router_api.py --fake          # local fake model backend, no API calls
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+
+from router_fake_backend import FakeBackend
+from router_intake import spool_drawing, DrawingBudgetExceeded
+from router_packages import generate_package_routers, package_routers_to_zip
+from router_pipeline import get_backend
+from router_preflight import PreflightRejected, preflight_drawing
+from router_pricebreaks import parse_quantities, derive_price_breaks, price_breaks_to_csv
+
+DEFAULT_MODEL = "gemini-3-flash-preview"
+# Generations running at once; further jobs queue
+API_WORKERS = int(os.environ.get("ROUTER_API_WORKERS", "8"))
+# Finished jobs are forgotten after this many seconds
+JOB_TTL = int(os.environ.get("ROUTER_API_JOB_TTL", "3600"))
+# Longest a wait=1 request blocks before answering 202 with the job instead
+SYNC_WAIT = 120
+
+
+class Job:
+    """One submitted generation"""
+
+    def __init__(self, quantities, model_name):
+        self.id = uuid.uuid4().hex
+        self.quantities = quantities
+        self.model_name = model_name
+        self.status = 'queued'
+        self.result = None
+        self.content_type = "text/csv; charset=utf-8"
+        # Per-part status when the drawing turned out to be a multi-part package
+        self.parts = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        info = {
+            'id': self.id,
+            'status': self.status,
+            'quantities': self.quantities,
+            'model': self.model_name,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'error': self.error,
+        }
+        if self.parts:
+            info['parts'] = self.parts
+        if self.started_at and self.finished_at:
+            info['seconds'] = round(self.finished_at - self.started_at, 3)
+        if self.status == 'done':
+            info['result_url'] = f"/jobs/{self.id}/result"
+        return info
+
+
+class RouterService:
+    """Job queue over the generation pipeline; one backend (and model client) shared by every request"""
+
+    def __init__(self, api_key="", backend=None, workers=API_WORKERS, job_ttl=JOB_TTL):
+        self.api_key = api_key
+        self.backend = backend or get_backend()
+        self.job_ttl = job_ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="router-api")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, drawing, quantities, model_name, session_id):
+        """Queue a generation for an already-spooled drawing; the job owns (and closes) the drawing"""
+        job = Job(quantities, model_name)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, drawing, session_id)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self):
+        cutoff = time.time() - self.job_ttl
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished_at and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _run(self, job, drawing, session_id):
+        job.status = 'running'
+        job.started_at = time.time()
+        try:
+            with drawing:
+                parts = generate_package_routers(
+                    drawing, job.quantities[-1], self.api_key, job.model_name,
+                    session_id=session_id, backend=self.backend
+                )['parts']
+            for part in parts:
+                if len(job.quantities) > 1 and not part['router_csv'].startswith('Error:'):
+                    part['router_csv'] = price_breaks_to_csv(derive_price_breaks(part['router_csv'], job.quantities))
+            routed = [part for part in parts if not part['router_csv'].startswith('Error:')]
+            if len(parts) > 1:
+                job.parts = [{'part_number': part['part_number'], 'pages': part['pages'],
+                              'status': 'done' if part in routed else 'failed',
+                              'error': None if part in routed else part['router_csv'].split('\n')[0]}
+                             for part in parts]
+            if not routed:
+                job.error = parts[0]['router_csv'].split('\n')[0]
+                job.status = 'failed'
+            elif len(parts) > 1:
+                # Parts that failed are listed on the job and left out of the zip
+                job.result = package_routers_to_zip(routed)
+                job.content_type = "application/zip"
+                job.status = 'done'
+            else:
+                job.result = routed[0]['router_csv']
+                job.status = 'done'
+        except Exception as e:
+            job.error = f"Error: {e}"
+            job.status = 'failed'
+        finally:
+            job.finished_at = time.time()
+            job.done.set()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+class _BodyReader:
+    """File-like view of exactly Content-Length bytes of the request body"""
+
+    def __init__(self, rfile, length):
+        self.rfile = rfile
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b""
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        chunk = self.rfile.read(size)
+        self.remaining -= len(chunk)
+        return chunk
+
+
+class RouterRequestHandler(BaseHTTPRequestHandler):
+    server_version = "MACRouter/1.0"
+    # Keep-alive so ERP clients can reuse one connection for submit + polling
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def _send(self, status, body, content_type="application/json"):
+        if not isinstance(body, (bytes, str)):
+            body = json.dumps(body)
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._send(status, {'error': message})
+
+    def do_GET(self):
+        parts = [p for p in urlparse(self.path).path.split('/') if p]
+        if parts == ['health']:
+            return self._send(200, {'status': 'ok'})
+        if len(parts) in (2, 3) and parts[0] == 'jobs':
+            job = self.service.get(parts[1])
+            if job is None:
+                return self._error(404, "Unknown job")
+            if len(parts) == 2:
+                return self._send(200, job.to_dict())
+            if parts[2] == 'result':
+                if job.status == 'done':
+                    return self._send(200, job.result, job.content_type)
+                if job.status == 'failed':
+                    return self._error(502, job.error)
+                return self._error(409, f"Job is {job.status}")
+        self._error(404, "Not found")
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path.rstrip('/') != '/routers':
+            return self._error(404, "Not found")
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            # The body can't be framed, so the connection can't be reused either
+            self.close_connection = True
+            return self._error(400, "Content-Length must be a number of bytes")
+        if length <= 0:
+            return self._error(400, "Send the drawing (PDF or scan) as the request body")
+
+        quantities = parse_quantities(params.get('quantity', ''))
+        if not quantities:
+            # Drain the body so the keep-alive connection stays usable
+            _BodyReader(self.rfile, length).read()
+            return self._error(400, "quantity is required, e.g. ?quantity=50 or ?quantity=10/50/100")
+
+        # Requests from one client share a rate-limit lane and byte budget, like a chat session
+        session_id = "api:" + (self.headers.get("X-Client-Id") or self.client_address[0])
+        try:
+            drawing = spool_drawing(_BodyReader(self.rfile, length), session_id,
+                                    name=params.get('filename', "drawing.pdf"))
+        except DrawingBudgetExceeded as e:
+            self.close_connection = True
+            return self._error(413, str(e))
+        # Bad files are refused on the request itself rather than as a failed job later
+        try:
+            drawing, _ = preflight_drawing(drawing)
+        except PreflightRejected as e:
+            drawing.close()
+            return self._error(413 if e.reason in ('too-large', 'too-many-pages', 'too-many-pixels') else 422,
+                               str(e))
+
+        job = self.service.submit(drawing, quantities, params.get('model', DEFAULT_MODEL), session_id)
+        if params.get('wait') in ('1', 'true', 'yes'):
+            if job.done.wait(SYNC_WAIT):
+                if job.status == 'done':
+                    return self._send(200, job.result, job.content_type)
+                return self._error(502, job.error)
+        self._send(202, job.to_dict())
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def create_server(host="127.0.0.1", port=8600, api_key="", backend=None, workers=API_WORKERS, verbose=True):
+    """Build (but don't start) the HTTP server; port 0 picks a free port"""
+    server = ThreadingHTTPServer((host, port), RouterRequestHandler)
+    server.daemon_threads = True
+    server.service = RouterService(api_key=api_key, backend=backend, workers=workers)
+    server.verbose = verbose
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--workers", type=int, default=API_WORKERS)
+    parser.add_argument("--fake", action="store_true", help="Use the local fake model backend (no API calls)")
+    args = parser.parse_args()
+
+    api_key = os.environ.get("GEMINI_API_KEY", "")
+    if not api_key and not args.fake:
+        parser.error("Set GEMINI_API_KEY (or use --fake)")
+
+    server = create_server(args.host, args.port, api_key=api_key,
+                           backend=FakeBackend(latency=0.5) if args.fake else None, workers=args.workers)
+    print(f"Router API listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
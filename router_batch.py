@@ -0,0 +1,396 @@
+"""
+MAC Router Generator - Batch Jobs
+Backlog conversions of thousands of drawings through the provider's asynchronous batch interface
+
+Drawings are checked, preprocessed and uploaded locally, then submitted in batches that run at batch
+priority (and batch pricing) instead of spending interactive quota. The manifest of items and batches
+is kept next to the output, so a crashed or interrupted job picks up where it stopped: finished items
+are never resubmitted and batches already submitted are collected rather than sent again.
+Quantities come from filenames or sidecars exactly as in the hot folder.
+
+Usage:
+    python router_batch.py /shared/legacy_drawings --output-dir /shared/routers --batch-size 200
+    python router_batch.py /shared/legacy_drawings --output-dir /shared/routers --no-wait   # submit and exit
+    python router_batch.py /shared/legacy_drawings --output-dir /shared/routers             # resume / collect
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import argparse
+import io
+import json
+import os
+import time
+import uuid
+
+from router_fake_backend import FakeBatchService
+from router_hotfolder import (DRAWING_EXTENSIONS, MAX_ATTEMPTS, BadSidecar, Checkpoint, export_router,
+                              quantities_for)
+from router_intake import spool_drawing
+from router_pipeline import (GENERATION_CONFIG, build_router_prompt, is_valid_router, parse_compact_response,
+                             request_fingerprint, router_csv_from_response)
+from router_preflight import PreflightRejected, preflight_drawing
+from router_scans import preprocess_drawing, scan_stats
+from router_validation import describe_defects, find_defects, payload_from_csv
+
+MANIFEST_NAME = ".router_batch_manifest.json"
+BATCHES_NAME = ".router_batch_jobs.json"
+# Requests per submitted batch - small enough that one failed batch doesn't hold up the whole backlog
+BATCH_SIZE = int(os.environ.get("ROUTER_BATCH_SIZE", "200"))
+# Drawings checked and uploaded in parallel while a batch is being assembled
+UPLOAD_WORKERS = int(os.environ.get("ROUTER_BATCH_UPLOAD_WORKERS", "8"))
+# Batch states that end a batch without results
+_DEAD_STATES = {'failed', 'cancelled', 'expired'}
+
+
+def load_genai():
+    """The google-genai SDK (batch jobs), imported on first use; None when it isn't installed"""
+    try:
+        from google import genai
+    except ImportError:
+        return None
+    return genai
+
+
+def _camel(key):
+    head, *rest = key.split('_')
+    return head + ''.join(part.title() for part in rest)
+
+
+# ==========================================
+# Provider Batch Service
+# ==========================================
+class GeminiBatchService:
+    """Gemini Batch API: requests written to a JSONL file, submitted as one job and read back when it finishes"""
+
+    name = "gemini-batch"
+
+    # Provider job states -> the states BatchJob works with
+    STATES = {
+        'JOB_STATE_PENDING': 'pending',
+        'JOB_STATE_QUEUED': 'pending',
+        'JOB_STATE_RUNNING': 'running',
+        'JOB_STATE_SUCCEEDED': 'succeeded',
+        'JOB_STATE_FAILED': 'failed',
+        'JOB_STATE_CANCELLED': 'cancelled',
+        'JOB_STATE_EXPIRED': 'expired',
+    }
+
+    def __init__(self, api_key):
+        genai = load_genai()
+        if genai is None:
+            raise RuntimeError("Batch jobs need the google-genai package (pip install -r requirements.txt)")
+        self.client = genai.Client(api_key=api_key)
+
+    def upload(self, drawing, api_key):
+        # On the client that submits the batch - batch requests reference the file by URI
+        uploaded = self.client.files.upload(
+            file=drawing.reader(),
+            config={'mime_type': drawing.mime_type, 'display_name': drawing.name},
+        )
+        return {'uri': uploaded.uri, 'mime_type': uploaded.mime_type}
+
+    def submit(self, requests, model_name, api_key, display_name):
+        """Submit {'key', 'uploaded', 'prompt', 'fingerprint'} requests as one batch job; returns its id"""
+        generation_config = {_camel(key): value for key, value in GENERATION_CONFIG.items()}
+        lines = []
+        for request in requests:
+            lines.append(json.dumps({
+                'key': request['key'],
+                'request': {
+                    'contents': [{'role': 'user', 'parts': [
+                        {'file_data': {'file_uri': request['uploaded']['uri'],
+                                       'mime_type': request['uploaded']['mime_type']}},
+                        {'text': request['prompt']},
+                    ]}],
+                    'generation_config': generation_config,
+                },
+            }))
+        source = self.client.files.upload(
+            file=io.BytesIO("\n".join(lines).encode('utf-8')),
+            config={'display_name': display_name, 'mime_type': 'jsonl'},
+        )
+        job = self.client.batches.create(model=model_name, src=source.name, config={'display_name': display_name})
+        return job.name
+
+    def find(self, display_name):
+        """Job id submitted under display_name (a submit that crashed before we saved its id), or None"""
+        for job in self.client.batches.list():
+            if getattr(job, 'display_name', None) == display_name:
+                return job.name
+        return None
+
+    def status(self, batch_id):
+        state = self.client.batches.get(name=batch_id).state
+        return self.STATES.get(getattr(state, 'name', str(state)), 'running')
+
+    def results(self, batch_id):
+        """{key: {'text', 'usage'} or {'error'}} for a finished job"""
+        job = self.client.batches.get(name=batch_id)
+        content = self.client.files.download(file=job.dest.file_name)
+        results = {}
+        for line in content.decode('utf-8').splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get('response') or {}
+            if record.get('error') or not response.get('candidates'):
+                results[record['key']] = {'error': str(record.get('error') or "No candidates in response")}
+                continue
+            parts = response['candidates'][0].get('content', {}).get('parts', [])
+            usage = response.get('usageMetadata', {})
+            results[record['key']] = {
+                'text': "".join(part.get('text', '') for part in parts),
+                'usage': {
+                    'prompt_tokens': usage.get('promptTokenCount', 0),
+                    'output_tokens': usage.get('candidatesTokenCount', 0),
+                    'total_tokens': usage.get('totalTokenCount', 0),
+                },
+            }
+        return results
+
+
+# ==========================================
+# Batch Job
+# ==========================================
+class BatchJob:
+    """
+    Resumable batch conversion of a drawing folder
+    Items go pending -> submitting -> submitted -> done, or failed (resubmitted up to MAX_ATTEMPTS times),
+    rejected (pre-flight) or skipped (no quantity). Every transition is written to the manifest first
+    """
+
+    def __init__(self, input_dir, output_dir=None, service=None, api_key="", model_name="gemini-3-flash-preview",
+                 batch_size=BATCH_SIZE, poll_interval=60.0, default_quantity=None, log=print):
+        self.input_dir = input_dir
+        self.output_dir = output_dir or input_dir
+        self.service = service or GeminiBatchService(api_key)
+        self.api_key = api_key
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.default_quantity = default_quantity
+        self.log = log
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.items = Checkpoint(os.path.join(self.output_dir, MANIFEST_NAME))
+        self.batches = Checkpoint(os.path.join(self.output_dir, BATCHES_NAME))
+
+    def _output_path(self, name):
+        return os.path.join(self.output_dir, f"{os.path.splitext(name)[0]}_router.csv")
+
+    def discover(self):
+        """Add new drawings to the manifest (and reset re-saved ones); returns how many were added"""
+        updates = {}
+        for name in sorted(os.listdir(self.input_dir)):
+            if not name.lower().endswith(DRAWING_EXTENSIONS):
+                continue
+            stat = os.stat(os.path.join(self.input_dir, name))
+            entry = self.items.get(name)
+            if entry.get('size') == stat.st_size and entry.get('mtime') == stat.st_mtime:
+                continue
+            if entry.get('status') in ('submitting', 'submitted'):
+                # Changed while in a batch - picked up again once that batch is collected
+                continue
+            fields = {'size': stat.st_size, 'mtime': stat.st_mtime, 'attempts': 0, 'status': 'pending',
+                      'batch': None, 'error': None}
+            try:
+                quantities = quantities_for(os.path.join(self.input_dir, name))
+            except BadSidecar as e:
+                quantities = []
+                fields.update(status='skipped', error=str(e))
+            quantities = quantities or ([self.default_quantity] if self.default_quantity else [])
+            fields['quantities'] = quantities
+            if not quantities and fields['status'] == 'pending':
+                fields.update(status='skipped', error="No quantity in filename or sidecar")
+            updates[name] = fields
+        if updates:
+            self.items.update_many(updates)
+        return len(updates)
+
+    def recover(self):
+        """Settle batches a crash left half-submitted: adopt them if the provider has them, else requeue"""
+        for batch_key, batch in self.batches.items():
+            if batch.get('status') != 'submitting':
+                continue
+            batch_id = self.service.find(batch_key)
+            members = [name for name, entry in self.items.items() if entry.get('batch') == batch_key]
+            if batch_id:
+                self.batches.update(batch_key, status='submitted', id=batch_id)
+                self.items.update_many({name: {'status': 'submitted'} for name in members})
+                self.log(f"[recover] {batch_key}: found as {batch_id}, {len(members)} items")
+            else:
+                self.batches.update(batch_key, status='abandoned')
+                self.items.update_many({name: {'status': 'pending', 'batch': None,
+                                               'attempts': self.items.get(name).get('attempts', 1) - 1}
+                                        for name in members})
+                self.log(f"[recover] {batch_key}: never reached the provider, {len(members)} items requeued")
+
+    def _prepare(self, name, entry):
+        """Check, preprocess and upload one drawing; returns a batch request or raises PreflightRejected"""
+        quantity = entry['quantities'][-1]
+        with open(os.path.join(self.input_dir, name), "rb") as f:
+            drawing = spool_drawing(f, "batch", name=name)
+        try:
+            drawing, _ = preflight_drawing(drawing)
+            drawing, scan = preprocess_drawing(drawing)
+            if scan is not None:
+                scan_stats.record(scan)
+            uploaded = self.service.upload(drawing, self.api_key)
+            fingerprint = request_fingerprint(drawing.digest, quantity, self.model_name)
+        finally:
+            drawing.close()
+        return {'key': name, 'uploaded': uploaded, 'prompt': build_router_prompt(quantity),
+                'fingerprint': fingerprint}
+
+    def submit_pending(self):
+        """Upload pending drawings and submit them in batches of batch_size; returns how many were submitted"""
+        pending = [(name, entry) for name, entry in self.items.items()
+                   if entry.get('status') == 'pending'
+                   or (entry.get('status') == 'failed' and entry.get('attempts', 0) < MAX_ATTEMPTS)]
+        submitted = 0
+        with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="router-batch") as executor:
+            for start in range(0, len(pending), self.batch_size):
+                chunk = pending[start:start + self.batch_size]
+                futures = [(name, executor.submit(self._prepare, name, entry)) for name, entry in chunk]
+                requests = []
+                updates = {}
+                for name, future in futures:
+                    try:
+                        requests.append(future.result())
+                    except PreflightRejected as e:
+                        updates[name] = {'status': 'rejected', 'error': str(e)}
+                        self.log(f"[reject] {name}: {e}")
+                    except Exception as e:
+                        attempts = self.items.get(name).get('attempts', 0) + 1
+                        updates[name] = {'status': 'failed', 'attempts': attempts, 'error': f"Upload: {e}"}
+                        self.log(f"[fail] {name} (attempt {attempts}/{MAX_ATTEMPTS}): upload: {e}")
+                if updates:
+                    self.items.update_many(updates)
+                if not requests:
+                    continue
+
+                # Recorded before the call: if we crash mid-submit, recover() asks the provider by this name
+                batch_key = f"router-batch-{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+                self.batches.update(batch_key, status='submitting', model=self.model_name, size=len(requests),
+                                    created_at=datetime.now().isoformat(timespec='seconds'))
+                self.items.update_many({r['key']: {'status': 'submitting', 'batch': batch_key,
+                                                   'attempts': self.items.get(r['key']).get('attempts', 0) + 1}
+                                        for r in requests})
+                batch_id = self.service.submit(requests, self.model_name, self.api_key, display_name=batch_key)
+                self.batches.update(batch_key, status='submitted', id=batch_id)
+                self.items.update_many({r['key']: {'status': 'submitted'} for r in requests})
+                submitted += len(requests)
+                self.log(f"[submit] {batch_key} -> {batch_id}: {len(requests)} drawings")
+        return submitted
+
+    def _finish(self, name, entry, result):
+        """Item fields for one batch result, writing its router when it's usable"""
+        if 'error' in result:
+            return {'status': 'failed', 'error': result['error']}
+        quantity = entry['quantities'][-1]
+        router_csv = router_csv_from_response(result['text'], quantity)
+        if not is_valid_router(router_csv):
+            return {'status': 'failed', 'error': "Response had no usable operations"}
+        # No round trip for repairs in batch mode - defects are flagged for review instead
+        payload = parse_compact_response(result['text']) or payload_from_csv(result['text'], quantity)
+        warnings = describe_defects(find_defects(payload, quantity)) if payload else []
+        output_path = self._output_path(name)
+        export_router(router_csv, entry['quantities'], output_path)
+        return {'status': 'done', 'output': output_path, 'error': None, 'warnings': warnings,
+                'tokens': result.get('usage', {}).get('total_tokens', 0),
+                'finished_at': datetime.now().isoformat(timespec='seconds')}
+
+    def collect(self):
+        """Poll submitted batches once, writing routers for the finished ones; returns batches still running"""
+        running = 0
+        for batch_key, batch in self.batches.items():
+            if batch.get('status') != 'submitted':
+                continue
+            state = self.service.status(batch['id'])
+            members = {name: entry for name, entry in self.items.items()
+                       if entry.get('batch') == batch_key and entry.get('status') == 'submitted'}
+            if state in _DEAD_STATES:
+                self.items.update_many({name: {'status': 'failed', 'batch': None, 'error': f"Batch {state}"}
+                                        for name in members})
+                self.batches.update(batch_key, status=state)
+                self.log(f"[fail] {batch_key}: batch {state}, {len(members)} items will be resubmitted")
+                continue
+            if state != 'succeeded':
+                running += 1
+                continue
+
+            results = self.service.results(batch['id'])
+            updates = {}
+            for name, entry in members.items():
+                fields = self._finish(name, entry, results.get(name, {'error': "Missing from batch results"}))
+                fields['batch'] = None
+                updates[name] = fields
+                if fields['status'] == 'done':
+                    note = f", {len(fields['warnings'])} rows to review" if fields['warnings'] else ""
+                    self.log(f"[done] {name} -> {fields['output']}{note}")
+                else:
+                    self.log(f"[fail] {name} (attempt {entry.get('attempts', 0)}/{MAX_ATTEMPTS}): {fields['error']}")
+            self.items.update_many(updates)
+            self.batches.update(batch_key, status='collected',
+                                collected_at=datetime.now().isoformat(timespec='seconds'))
+        return running
+
+    def summary(self):
+        """Item counts by status"""
+        counts = {}
+        for _, entry in self.items.items():
+            counts[entry.get('status')] = counts.get(entry.get('status'), 0) + 1
+        return counts
+
+    def run(self, wait=True):
+        """Discover, recover, submit and collect - until nothing is left to do when wait is set"""
+        self.log(f"Batch job over {os.path.abspath(self.input_dir)} ({self.service.name}, {self.model_name})")
+        self.discover()
+        self.recover()
+        while True:
+            self.submit_pending()
+            running = self.collect()
+            retry = any(entry.get('status') == 'failed' and entry.get('attempts', 0) < MAX_ATTEMPTS
+                        for _, entry in self.items.items())
+            if not wait or (not running and not retry):
+                break
+            if running:
+                time.sleep(self.poll_interval)
+        self.log("Items: " + ", ".join(f"{status} {count}" for status, count in sorted(self.summary().items())))
+        return self.summary()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input_dir")
+    parser.add_argument("--output-dir", default=None, help="Write routers and the job manifest here")
+    parser.add_argument("--model", default="gemini-3-flash-preview")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Drawings per submitted batch")
+    parser.add_argument("--poll", type=float, default=60.0, help="Seconds between batch status checks")
+    parser.add_argument("--default-quantity", type=int, default=None)
+    parser.add_argument("--no-wait", action="store_true", help="Submit what's pending, collect what's done, and exit")
+    parser.add_argument("--fake", action="store_true", help="Use the local fake batch service (no API calls)")
+    args = parser.parse_args()
+
+    api_key = os.environ.get("GEMINI_API_KEY", "")
+    if not api_key and not args.fake:
+        parser.error("Set GEMINI_API_KEY (or use --fake)")
+
+    if args.fake:
+        service = FakeBatchService(os.path.join(args.output_dir or args.input_dir, ".router_fake_batches"))
+        poll = min(args.poll, 1.0)
+    else:
+        service = GeminiBatchService(api_key)
+        poll = args.poll
+    job = BatchJob(
+        args.input_dir, output_dir=args.output_dir, service=service, api_key=api_key, model_name=args.model,
+        batch_size=args.batch_size, poll_interval=poll, default_quantity=args.default_quantity
+    )
+    try:
+        job.run(wait=not args.no_wait)
+    except KeyboardInterrupt:
+        print("Interrupted - run again to resume; submitted batches are collected, not resubmitted")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+MAC Router Generator - Model Circuit Breakers
+Per-model health tracking that stops sending requests to a degraded model and probes it back to health
+"""
+
+from collections import deque
+from contextlib import contextmanager
+import os
+import threading
+import time
+
+from router_hedging import percentile
+
+# Consecutive failed or slow calls that open a model's circuit
+FAILURE_THRESHOLD = int(os.environ.get("ROUTER_BREAKER_FAILURES", "3"))
+# A call slower than this counts against the model even if it succeeded
+SLOW_CALL_SECONDS = float(os.environ.get("ROUTER_BREAKER_SLOW_SECONDS", "30"))
+# Seconds an open circuit fails fast before letting a probe request through
+OPEN_SECONDS = float(os.environ.get("ROUTER_BREAKER_OPEN_SECONDS", "30"))
+# Models tried, in order, when the selected model's circuit is open (the hedge model is always tried first)
+FALLBACK_MODELS = [m.strip() for m in os.environ.get("ROUTER_FALLBACK_MODELS", "").split(",") if m.strip()]
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+# Errors that say nothing about the model's health - local queueing, quota, a hedge that lost the race
+_NEUTRAL_ERRORS = {'QuotaExceeded', 'RateLimitTimeout', 'ResourceExhausted', 'HedgeCancelled'}
+
+
+class CircuitOpen(Exception):
+    """The model's circuit is open - the request was refused without calling it"""
+
+
+class CircuitBreaker:
+    """Closed -> open after repeated failures -> half-open single probe -> closed again"""
+
+    def __init__(self, model_name, failure_threshold=FAILURE_THRESHOLD, slow_call_seconds=SLOW_CALL_SECONDS,
+                 open_seconds=OPEN_SECONDS, window=50):
+        self.model_name = model_name
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self.times_opened = 0
+        self._probing = False
+        # Recent (ok, seconds) outcomes for the health summary
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def _retry_in(self, now):
+        return max(self.open_seconds - (now - self.opened_at), 0.0)
+
+    def allow(self):
+        """Admit a call or raise CircuitOpen; returns True when the call is the half-open probe"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN and self._retry_in(now) <= 0:
+                self.state = HALF_OPEN
+            if self.state == CLOSED:
+                return False
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            raise self._refusal(now)
+
+    def _refusal(self, now):
+        if self.state == OPEN:
+            when = f"retrying in {self._retry_in(now):.0f}s"
+        else:
+            when = "a recovery probe is in progress"
+        return CircuitOpen(
+            f"{self.model_name} is unavailable after {self.consecutive_failures} failed or slow calls"
+            f" (last: {self.last_error or 'unknown'}); {when}"
+        )
+
+    def _open(self, now):
+        if self.state != OPEN:
+            self.times_opened += 1
+        self.state = OPEN
+        self.opened_at = now
+
+    def record_success(self, seconds, probe=False):
+        with self._lock:
+            now = time.monotonic()
+            if probe:
+                self._probing = False
+            slow = seconds > self.slow_call_seconds
+            self._recent.append((not slow, seconds))
+            if slow:
+                self.last_error = f"slow response ({seconds:.0f}s)"
+                self.consecutive_failures += 1
+                if probe or self.consecutive_failures >= self.failure_threshold:
+                    self._open(now)
+                return
+            self.consecutive_failures = 0
+            if probe or self.state == HALF_OPEN:
+                self.state = CLOSED
+                self.opened_at = None
+
+    def record_failure(self, error, seconds, probe=False):
+        with self._lock:
+            now = time.monotonic()
+            if probe:
+                self._probing = False
+            self._recent.append((False, seconds))
+            self.last_error = type(error).__name__
+            self.consecutive_failures += 1
+            # A failed probe re-opens straight away; otherwise only after the threshold
+            if probe or self.consecutive_failures >= self.failure_threshold:
+                self._open(now)
+
+    def release(self, probe):
+        """The call ended without telling us anything about the model - free the probe slot"""
+        if probe:
+            with self._lock:
+                self._probing = False
+
+    @contextmanager
+    def call(self):
+        """Guard one model call: refuse it while open, and record how it went"""
+        probe = self.allow()
+        t0 = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            if type(e).__name__ in _NEUTRAL_ERRORS:
+                self.release(probe)
+            else:
+                self.record_failure(e, time.monotonic() - t0, probe)
+            raise
+        except BaseException:
+            self.release(probe)
+            raise
+        self.record_success(time.monotonic() - t0, probe)
+
+    def available(self):
+        """True if a call would currently be let through (without claiming the probe slot)"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                return self._retry_in(time.monotonic()) <= 0
+            return not self._probing
+
+    def refuse(self):
+        """CircuitOpen explaining why the model is being skipped"""
+        with self._lock:
+            return self._refusal(time.monotonic())
+
+    def snapshot(self):
+        """Plain dict of the breaker's state and recent health for display"""
+        with self._lock:
+            now = time.monotonic()
+            recent = list(self._recent)
+            state = self.state
+            if state == OPEN and self._retry_in(now) <= 0:
+                state = HALF_OPEN
+            return {
+                'model': self.model_name,
+                'state': state,
+                'consecutive_failures': self.consecutive_failures,
+                'last_error': self.last_error,
+                'retry_in': self._retry_in(now) if state == OPEN else 0.0,
+                'times_opened': self.times_opened,
+                'calls': len(recent),
+                'success_rate': sum(1 for ok, _ in recent if ok) / len(recent) if recent else None,
+                'p50': percentile([seconds for ok, seconds in recent if ok], 50),
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(model_name):
+    """Process-wide circuit breaker for a model"""
+    with _breakers_lock:
+        if model_name not in _breakers:
+            _breakers[model_name] = CircuitBreaker(model_name)
+        return _breakers[model_name]
+
+
+def route_models(model_name, hedge_model=None, fallbacks=None):
+    """
+    (primary, hedge) to actually use: the selected model while it's healthy, otherwise the first healthy
+    fallback (hedge model first); a hedge model whose circuit is open is dropped
+    Raises CircuitOpen when no candidate is available
+    """
+    if hedge_model and not get_breaker(hedge_model).available():
+        hedge_model = None
+    if get_breaker(model_name).available():
+        return model_name, hedge_model
+    candidates = ([hedge_model] if hedge_model else []) + list(FALLBACK_MODELS if fallbacks is None else fallbacks)
+    for candidate in candidates:
+        if candidate != model_name and get_breaker(candidate).available():
+            return candidate, None
+    # Nothing healthy to route to - fail fast with the selected model's reason
+    raise get_breaker(model_name).refuse()
@@ -0,0 +1,216 @@
+"""
+MAC Router Generator - Work Center Load
+Columnar (NumPy) rollup of setup/run hours per work center across many routers, with queue-days at shift capacity
+
+Usage:
+    python router_capacity.py /shared/routers --hours-per-shift 8 --shifts 2 --machines CNC-L=2,WELD=3
+"""
+
+from collections import OrderedDict
+import argparse
+import glob
+import os
+import threading
+
+import numpy as np
+
+from router_model import parse_router
+from router_render import router_hash
+
+# Display order; work centers not listed here are appended as they're seen
+WORK_CENTERS = ['SAW', 'WATERJT', 'CNC-L', 'CNC-M', 'BEND', 'WELD', 'PAINT', 'SUB-PL']
+HOURS_PER_SHIFT = 8.0
+SHIFTS_PER_DAY = 1
+TOP_CONTRIBUTORS = 3
+
+# Parsed operations per router content hash - history reruns only parse routers they haven't seen
+_PARSE_CACHE_SIZE = 20000
+_parse_cache = OrderedDict()
+_parse_lock = threading.Lock()
+
+
+def _router_rows(csv_text):
+    """(part number, [(work center, setup, run), ...]) for one router, memoized by content"""
+    key = router_hash(csv_text)
+    with _parse_lock:
+        cached = _parse_cache.get(key)
+        if cached is not None:
+            _parse_cache.move_to_end(key)
+            return cached
+    router = parse_router(csv_text)
+    rows = (router['part_number'],
+            [(op['work_center'].upper(), op['setup_hours'], op['run_hours']) for op in router['operations']])
+    with _parse_lock:
+        _parse_cache[key] = rows
+        if len(_parse_cache) > _PARSE_CACHE_SIZE:
+            _parse_cache.popitem(last=False)
+    return rows
+
+
+class OperationTable:
+    """Operations as parallel arrays: part index, work center index, setup hours, run hours"""
+
+    def __init__(self):
+        self.parts = []
+        self.work_centers = list(WORK_CENTERS)
+        self._part_index = {}
+        self._wc_index = {wc: i for i, wc in enumerate(self.work_centers)}
+        self._part_col = []
+        self._wc_col = []
+        self._setup_col = []
+        self._run_col = []
+        self._arrays = None
+
+    def __len__(self):
+        return len(self._wc_col)
+
+    def add_router(self, csv_text):
+        """Append a router's operations; returns how many were added"""
+        part_number, rows = _router_rows(csv_text)
+        if not rows:
+            return 0
+        part_number = part_number or f"UNNAMED {len(self.parts) + 1}"
+        part = self._part_index.get(part_number)
+        if part is None:
+            part = self._part_index[part_number] = len(self.parts)
+            self.parts.append(part_number)
+        for work_center, setup, run in rows:
+            wc = self._wc_index.get(work_center)
+            if wc is None:
+                wc = self._wc_index[work_center] = len(self.work_centers)
+                self.work_centers.append(work_center)
+            self._part_col.append(part)
+            self._wc_col.append(wc)
+            self._setup_col.append(setup)
+            self._run_col.append(run)
+        self._arrays = None
+        return len(rows)
+
+    @classmethod
+    def from_routers(cls, csv_texts):
+        table = cls()
+        for csv_text in csv_texts:
+            table.add_router(csv_text)
+        return table
+
+    def arrays(self):
+        """(part, work center, setup, run) NumPy columns, built once per batch of additions"""
+        if self._arrays is None:
+            self._arrays = (
+                np.asarray(self._part_col, dtype=np.int32),
+                np.asarray(self._wc_col, dtype=np.int32),
+                np.asarray(self._setup_col, dtype=np.float64),
+                np.asarray(self._run_col, dtype=np.float64),
+            )
+        return self._arrays
+
+
+def capacity_rollup(table, hours_per_shift=HOURS_PER_SHIFT, shifts_per_day=SHIFTS_PER_DAY, machines=None,
+                    top_n=TOP_CONTRIBUTORS):
+    """
+    Per-work-center load: [{'work_center', 'operations', 'setup_hours', 'run_hours', 'total_hours',
+    'queue_days', 'top_contributors': [(part number, hours), ...]}, ...], busiest first
+    machines maps work center -> machines running in parallel (default 1)
+    """
+    if not len(table):
+        return []
+    part, wc, setup, run = table.arrays()
+    n_wc = len(table.work_centers)
+    n_parts = len(table.parts)
+
+    ops = np.bincount(wc, minlength=n_wc)
+    setup_totals = np.bincount(wc, weights=setup, minlength=n_wc)
+    run_totals = np.bincount(wc, weights=run, minlength=n_wc)
+    totals = setup_totals + run_totals
+
+    machines = machines or {}
+    machine_counts = np.array([max(machines.get(name, 1), 1) for name in table.work_centers], dtype=np.float64)
+    daily_capacity = hours_per_shift * shifts_per_day * machine_counts
+    queue_days = np.divide(totals, daily_capacity, out=np.zeros(n_wc), where=daily_capacity > 0)
+
+    # Hours per (work center, part) in one pass, then the top parts per work center
+    by_part = np.bincount(wc * n_parts + part, weights=setup + run, minlength=n_wc * n_parts).reshape(n_wc, n_parts)
+    k = min(top_n, n_parts)
+
+    rollup = []
+    for i in np.argsort(-queue_days, kind='stable'):
+        if ops[i] == 0:
+            continue
+        row = by_part[i]
+        top = np.argpartition(-row, k - 1)[:k] if k else []
+        top = sorted(top, key=lambda p: -row[p])
+        rollup.append({
+            'work_center': table.work_centers[i],
+            'operations': int(ops[i]),
+            'setup_hours': float(setup_totals[i]),
+            'run_hours': float(run_totals[i]),
+            'total_hours': float(totals[i]),
+            'queue_days': float(queue_days[i]),
+            'top_contributors': [(table.parts[p], float(row[p])) for p in top if row[p] > 0],
+        })
+    return rollup
+
+
+def rollup_rows(rollup):
+    """Flatten a rollup for a table widget"""
+    return [{
+        'Work Center': item['work_center'],
+        'Ops': item['operations'],
+        'Setup Hrs': round(item['setup_hours'], 2),
+        'Run Hrs': round(item['run_hours'], 2),
+        'Total Hrs': round(item['total_hours'], 2),
+        'Queue Days': round(item['queue_days'], 2),
+        'Top Contributors': ", ".join(f"{p} ({h:.1f}h)" for p, h in item['top_contributors']),
+    } for item in rollup]
+
+
+def routers_from_history(chat_history):
+    """Every router generated in a chat session (split packages contribute each part)"""
+    if hasattr(chat_history, 'routers'):
+        # Store-backed history - one query over the router column
+        return chat_history.routers()
+    routers = []
+    for message in chat_history:
+        routers.extend(message.get('routers', []))
+    return routers
+
+
+def routers_from_directory(directory):
+    """Router CSVs in a folder (hot-folder output, exports); price-break summaries are skipped"""
+    routers = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.csv"))):
+        with open(path, encoding="utf-8") as f:
+            csv_text = f.read()
+        if "Standard Routing Summary" in csv_text.split('\n', 1)[0]:
+            routers.append(csv_text)
+    return routers
+
+
+def _parse_machines(text):
+    machines = {}
+    for item in filter(None, (text or "").split(',')):
+        name, _, count = item.partition('=')
+        machines[name.strip().upper()] = int(count)
+    return machines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory")
+    parser.add_argument("--hours-per-shift", type=float, default=HOURS_PER_SHIFT)
+    parser.add_argument("--shifts", type=int, default=SHIFTS_PER_DAY)
+    parser.add_argument("--machines", default="", help="Parallel machines per work center, e.g. CNC-L=2,WELD=3")
+    parser.add_argument("--top", type=int, default=TOP_CONTRIBUTORS)
+    args = parser.parse_args()
+
+    table = OperationTable.from_routers(routers_from_directory(args.directory))
+    rollup = capacity_rollup(table, args.hours_per_shift, args.shifts, _parse_machines(args.machines), args.top)
+    print(f"{len(table)} operations across {len(table.parts)} parts")
+    print(f"{'Work Center':<12}{'Ops':>7}{'Setup':>10}{'Run':>10}{'Total':>10}{'Days':>8}  Top contributors")
+    for row in rollup_rows(rollup):
+        print(f"{row['Work Center']:<12}{row['Ops']:>7}{row['Setup Hrs']:>10.2f}{row['Run Hrs']:>10.2f}"
+              f"{row['Total Hrs']:>10.2f}{row['Queue Days']:>8.2f}  {row['Top Contributors']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+MAC Router Generator - Chat Handler
+Session state setup and chat submission handling, independent of the Streamlit widgets
+"""
+
+import html
+import re
+
+from router_intake import DrawingBudgetExceeded, spool_drawing
+from router_packages import generate_package_routers, is_drawing_package, package_timing_rows
+from router_preflight import PreflightRejected, preflight_drawing
+from router_pricebreaks import parse_quantities, derive_price_breaks, price_break_rows
+from router_render import csv_to_html, price_breaks_to_html
+from router_scans import savings_text
+from router_sessions import new_session_id
+from router_similarity import SIMILARITY_ENABLED, drawing_features, get_drawing_index
+
+# "fresh" / "regenerate" in the message skips near-duplicate reuse
+_FRESH_REQUEST = re.compile(r'\b(fresh|regenerate)\b', re.IGNORECASE)
+# Accepts a pending near-duplicate offer
+_ACCEPT_REUSE = re.compile(r'\b(?:use (?:it|that|previous|prior|the previous)|reuse)\b', re.IGNORECASE)
+
+
+# Session values saved with a persisted chat history so a refresh or restart picks up where it left off
+PERSISTED_KEYS = ('router_generated', 'router_csv', 'quantity', 'price_breaks', 'router_base_csv',
+                  'router_edit_rows', 'router_message_index', 'package_routers', 'reuse_offer')
+
+
+def init_session_state(state, store=None, session_id=None):
+    """
+    Fill in session defaults (works on st.session_state or a plain dict)
+    With a session store the history lives in the store and saved values are restored
+    """
+    if 'session_id' not in state:
+        state['session_id'] = session_id or new_session_id()
+    if 'chat_history' not in state:
+        if store is not None:
+            state['chat_history'] = store.history(state['session_id'])
+            saved = state['chat_history'].load_state() or {}
+            for key in PERSISTED_KEYS:
+                if key in saved:
+                    state[key] = saved[key]
+            # JSON turns the quantity keys into strings
+            if 'price_breaks' in saved:
+                state['price_breaks'] = {int(q): csv_text for q, csv_text in saved['price_breaks'].items()}
+        else:
+            state['chat_history'] = []
+    if 'router_generated' not in state:
+        state['router_generated'] = False
+    if 'router_csv' not in state:
+        state['router_csv'] = ""
+    if 'quantity' not in state:
+        state['quantity'] = 50
+    if 'price_breaks' not in state:
+        state['price_breaks'] = {}
+    if 'router_base_csv' not in state:
+        state['router_base_csv'] = ""
+    if 'router_edit_rows' not in state:
+        state['router_edit_rows'] = None
+    if 'router_message_index' not in state:
+        state['router_message_index'] = None
+    if 'package_routers' not in state:
+        state['package_routers'] = []
+    if 'reuse_offer' not in state:
+        state['reuse_offer'] = None
+
+
+def persist_session(state):
+    """Save the session's router state when its history is store-backed (no-op for a plain list)"""
+    history = state['chat_history']
+    if hasattr(history, 'save_state'):
+        history.save_state({key: state[key] for key in PERSISTED_KEYS})
+
+
+def clear_conversation(state):
+    state['chat_history'].clear()
+    state['router_generated'] = False
+    state['router_csv'] = ""
+    state['price_breaks'] = {}
+    state['router_base_csv'] = ""
+    state['router_edit_rows'] = None
+    state['router_message_index'] = None
+    state['package_routers'] = []
+    state['reuse_offer'] = None
+    persist_session(state)
+
+
+def package_timing_html(result):
+    """Per-part timing table for a split drawing package"""
+    rows = "".join(
+        f"<tr><td>{html.escape(row['Part Number'])}</td><td>{row['Pages']}</td>"
+        f"<td>{row['Queued (s)']:.2f}</td><td>{row['Generation (s)']:.2f}</td><td>{row['Status']}</td></tr>"
+        for row in package_timing_rows(result)
+    )
+    return (
+        "<table><tr><th>Part Number</th><th>Pages</th><th>Queued (s)</th><th>Generation (s)</th><th>Status</th></tr>"
+        f"{rows}</table>"
+        f"<br>Split in {result['split_seconds']:.2f}s, all parts done in {result['total_seconds']:.1f}s"
+    )
+
+
+def routers_generated(state):
+    """Number of assistant replies in the conversation"""
+    history = state['chat_history']
+    if hasattr(history, 'count_role'):
+        # Store-backed history counts with a query instead of loading every message
+        return history.count_role('assistant')
+    return len([m for m in history if m['role'] == 'assistant'])
+
+
+def apply_router_edit(state, csv_text, edit_rows=None):
+    """
+    Store a locally edited router and refresh its chat message - no model call
+    edit_rows ({'source': editor source hash, 'rows': grid rows}) is kept so the grid reopens with the edits
+    """
+    state['router_csv'] = csv_text
+    if edit_rows is not None:
+        state['router_edit_rows'] = edit_rows
+    index = state.get('router_message_index')
+    history = state['chat_history']
+    if index is not None and index < len(history):
+        message = dict(history[index])
+        message['content'] = f"<strong>Router Updated (edited locally)</strong><br><br>{csv_to_html(csv_text)}"
+        message['routers'] = [csv_text]
+        # Assign back rather than mutating in place so a store-backed history saves the edit
+        history[index] = message
+    persist_session(state)
+
+
+def _show_routers(state, parts, quantities, note, title, result=None):
+    """Store a new router (a package's parts, price breaks or a single router) and add its chat message"""
+    history = state['chat_history']
+    router_csv = parts[0]['router_csv']
+    state['router_csv'] = router_csv
+    state['router_generated'] = True
+    state['price_breaks'] = {}
+    state['router_base_csv'] = ""
+    state['router_edit_rows'] = None
+    state['package_routers'] = []
+
+    if len(parts) > 1:
+        state['package_routers'] = parts
+        sections = "".join(
+            f"<br><br><strong>{html.escape(part['part_number'])}</strong> (pages "
+            f"{', '.join(str(p) for p in part['pages'])})<br><br>{csv_to_html(part['router_csv'])}"
+            for part in parts
+        )
+        history.append({
+            'role': 'assistant',
+            'content': f"<strong>Drawing Package Split into {len(parts)} Parts</strong><br><br>"
+                       f"{package_timing_html(result)}{sections}",
+            'routers': [part['router_csv'] for part in parts if not part['router_csv'].startswith('Error:')]
+        })
+        return
+
+    if len(quantities) > 1 and not router_csv.startswith('Error:'):
+        price_breaks = derive_price_breaks(router_csv, quantities)
+        state['price_breaks'] = price_breaks
+        state['router_csv'] = price_breaks[quantities[0]]
+        html_output = price_breaks_to_html(price_break_rows(price_breaks))
+        history.append({
+            'role': 'assistant',
+            'content': f"<strong>Price-Break Routers Generated</strong><br><br>{note}{html_output}",
+            # Work-center load counts the generated (largest) quantity
+            'routers': [router_csv]
+        })
+        return
+
+    html_output = csv_to_html(router_csv)
+    if not router_csv.startswith('Error:'):
+        # Editable copy for the operations grid; the message index lets edits refresh it in place
+        state['router_base_csv'] = router_csv
+        state['router_message_index'] = len(history)
+    history.append({
+        'role': 'assistant',
+        'content': f"<strong>{title}</strong><br><br>{note}{html_output}",
+        'routers': [] if router_csv.startswith('Error:') else [router_csv]
+    })
+
+
+def accept_reuse_offer(state):
+    """Use the near-duplicate router offered for the last upload (routed at the same quantity)"""
+    offer = state.get('reuse_offer')
+    if not offer:
+        return False
+    state['reuse_offer'] = None
+    quantities = offer['quantities']
+    router_csv = offer['router_csv']
+    note = (
+        f"Starting point from {html.escape(offer['part_number'] or 'a previous drawing')} "
+        f"({offer['score']:.0%} match, routed {offer['created_at']} at {offer['quantity']} pcs)<br><br>"
+    )
+    state['chat_history'].append({'role': 'user', 'content': "Use the previous router"})
+    _show_routers(state, [{'router_csv': router_csv}], quantities, note, "Prior Router Reused")
+    persist_session(state)
+    return True
+
+
+def handle_chat_submission(state, user_text, files, api_key, model_name,
+                           hedge_model=None, hedge_policy=None, backend=None, require_api_key=True):
+    """Process one chat submission - appends user/assistant messages and stores the router"""
+    _handle_submission(state, user_text, files, api_key, model_name,
+                       hedge_model, hedge_policy, backend, require_api_key)
+    persist_session(state)
+
+
+def _handle_submission(state, user_text, files, api_key, model_name,
+                       hedge_model, hedge_policy, backend, require_api_key):
+    history = state['chat_history']
+    quantities = parse_quantities(user_text)
+    quantity = quantities[-1] if quantities else None
+
+    if files and quantity:
+        # User uploaded PDF AND provided quantity (or a list of price-break quantities)
+        pdf_file = files[0]
+        quantity_label = " / ".join(str(q) for q in quantities)
+        history.append({
+            'role': 'user',
+            'content': f"Uploaded: **{pdf_file.name}** | Quantit{'ies' if len(quantities) > 1 else 'y'}: **{quantity_label}**"
+        })
+
+        # Check if API key is configured
+        if require_api_key and not api_key:
+            history.append({
+                'role': 'assistant',
+                'content': "Please enter your Gemini API key in the sidebar to generate routers."
+            })
+            return
+
+        # Checked once here, before anything else reads the file; the pipeline reuses the report
+        state['reuse_offer'] = None
+        try:
+            drawing = spool_drawing(pdf_file, state['session_id'], name=getattr(pdf_file, 'name', None))
+        except DrawingBudgetExceeded as e:
+            _show_routers(state, [{'router_csv': f"Error: {e}"}], quantities, "", "Router Generated Successfully")
+            return
+        try:
+            drawing, _ = preflight_drawing(drawing)
+        except PreflightRejected as e:
+            drawing.close()
+            _show_routers(state, [{'router_csv': f"Error: {e}"}], quantities, "", "Router Generated Successfully")
+            return
+
+        # A near-duplicate of a drawing routed before (typically a new revision) is offered, not swapped in
+        # Features come from the spooled drawing - its hash and the page text pre-flight already parsed
+        features = drawing_features(drawing) if SIMILARITY_ENABLED else None
+        match = None
+        if features and not _FRESH_REQUEST.search(user_text):
+            match = get_drawing_index().find(features)
+            # A different quantity is a new request, not a repeat; and a package could match one earlier
+            # part while the others must still be generated
+            if match and (match['quantity'] != quantity or is_drawing_package(drawing)):
+                match = None
+        if match:
+            drawing.close()
+            state['reuse_offer'] = {
+                'router_csv': match['router_csv'],
+                'quantities': quantities,
+                'part_number': match['part_number'],
+                'score': match['score'],
+                'created_at': match['created_at'],
+                'quantity': match['quantity'],
+            }
+            history.append({
+                'role': 'assistant',
+                'content': (
+                    f"<strong>{match['score']:.0%} match</strong> with "
+                    f"{html.escape(match['part_number'] or 'a previous drawing')} (routed {match['created_at']} at "
+                    f"{match['quantity']} pcs). Reply \"use previous\" to start from that router, or attach the "
+                    "drawing again with \"fresh\" in your message for a full generation."
+                ),
+            })
+            return
+
+        # Generate once at the largest quantity (least rounding in run hours), derive the rest locally
+        # Multi-part packages are split per part and generated in parallel
+        result = generate_package_routers(
+            drawing, quantity, api_key, model_name,
+            hedge_model=hedge_model, hedge_policy=hedge_policy,
+            session_id=state['session_id'], backend=backend
+        )
+        parts = result['parts']
+        router_csv = parts[0]['router_csv']
+        note = ""
+        if result.get('scan'):
+            note = f"Scan preprocessed before upload: {html.escape(savings_text(result['scan']))}<br><br>"
+        if features and len(parts) == 1 and not router_csv.startswith('Error:'):
+            get_drawing_index().add(features, router_csv, quantity, model_name)
+        _show_routers(state, parts, quantities, note, "Router Generated Successfully", result)
+
+    elif files and not quantity:
+        # Has file but no quantity
+        history.append({
+            'role': 'user',
+            'content': f"Uploaded: **{files[0].name}**"
+        })
+        history.append({
+            'role': 'assistant',
+            'content': "Please include the production quantity in your message (e.g., 'Generate router for 50 pieces')."
+        })
+
+    elif state.get('reuse_offer') and _ACCEPT_REUSE.search(user_text or ""):
+        accept_reuse_offer(state)
+
+    else:
+        # Normal message or request
+        history.append({
+            'role': 'user',
+            'content': user_text
+        })
+        history.append({
+            'role': 'assistant',
+            'content': "Please attach an engineering drawing (PDF or TIFF/PNG/JPEG scan) and include the quantity in your message. For example: 'Generate router for 50 pieces' (then attach the PDF)."
+        })
@@ -0,0 +1,133 @@
+"""
+MAC Router Generator - Model Client Pool
+Gemini clients kept per API key (own configuration, own warm connections) and model objects per key + model
+"""
+
+from collections import OrderedDict
+import hashlib
+import os
+import threading
+import warnings
+
+from router_deps import load_sdk
+
+# Distinct API keys kept warm at once; the least recently used key's clients are dropped past this
+MAX_POOLED_KEYS = int(os.environ.get("ROUTER_CLIENT_POOL_KEYS", "32"))
+
+_per_key = None
+_shared_key = None
+_shared_lock = threading.Lock()
+
+
+class SharedClientOnly(RuntimeError):
+    """A second API key was used while the SDK can only be configured process-wide"""
+
+
+def per_key_clients():
+    """
+    True when the installed SDK lets each API key have its own clients
+    That needs the SDK's private client manager and GenerativeModel._client - google-generativeai is pinned
+    in requirements.txt to the versions that have both
+    """
+    global _per_key
+    if _per_key is None:
+        genai, genai_client, _ = load_sdk()
+        _per_key = (hasattr(genai_client, '_ClientManager')
+                    and hasattr(genai.GenerativeModel("gemini-2.0-flash"), '_client'))
+        if not _per_key:
+            warnings.warn(
+                "google-generativeai has no per-key clients in this version - falling back to the process-wide "
+                "genai.configure(), so only one API key can be used per process. Install the version pinned in "
+                "requirements.txt.",
+                RuntimeWarning,
+            )
+    return _per_key
+
+
+def _configure_shared(genai, api_key):
+    """Configure the SDK's process-wide default - once, and for one key only"""
+    global _shared_key
+    key = hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+    with _shared_lock:
+        if _shared_key is None:
+            genai.configure(api_key=api_key)
+            _shared_key = key
+        elif _shared_key != key:
+            raise SharedClientOnly(
+                "This process is already using another API key and the installed google-generativeai can't keep "
+                "keys apart - install the version pinned in requirements.txt or restart with a single key"
+            )
+
+
+class KeyClient:
+    """
+    Clients for one API key - configured once, shared by every session and rerun using that key
+    Without per-key SDK support it uses the process-wide default client, and a second key is refused
+    """
+
+    def __init__(self, api_key, generation_config):
+        genai, genai_client, file_types = load_sdk()
+        self._genai = genai
+        self._file_types = file_types
+        self._generation_config = generation_config
+        self._lock = threading.Lock()
+        self._models = {}
+        self._generative_client = None
+        self._file_client = None
+        if not per_key_clients():
+            _configure_shared(genai, api_key)
+            return
+        # A private client manager instead of genai.configure(), so keys never overwrite each other
+        self._manager = genai_client._ClientManager()
+        self._manager.configure(api_key=api_key)
+        # Created up front - the manager's lazy creation isn't thread-safe
+        self._generative_client = self._manager.get_default_client("generative")
+        self._file_client = self._manager.get_default_client("file")
+
+    def upload(self, handle, mime_type, display_name=None):
+        """Upload a file-like drawing on this key's file client"""
+        if self._file_client is None:
+            return self._genai.upload_file(handle, mime_type=mime_type, display_name=display_name)
+        response = self._file_client.create_file(path=handle, mime_type=mime_type, display_name=display_name)
+        return self._file_types.File(response)
+
+    def model(self, model_name):
+        """GenerativeModel for this key, built once per model name"""
+        with self._lock:
+            model = self._models.get(model_name)
+            if model is None:
+                model = self._genai.GenerativeModel(model_name, generation_config=self._generation_config)
+                if self._generative_client is not None:
+                    # Bind to this key's client rather than the SDK's process-wide default
+                    model._client = self._generative_client
+                self._models[model_name] = model
+            return model
+
+
+class ClientPool:
+    """Thread-safe LRU of KeyClients keyed by a hash of the API key"""
+
+    def __init__(self, generation_config, max_keys=MAX_POOLED_KEYS):
+        self.generation_config = generation_config
+        self.max_keys = max_keys
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+
+    def for_key(self, api_key):
+        key = hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._clients.move_to_end(key)
+                return client
+            client = KeyClient(api_key, self.generation_config)
+            self._clients[key] = client
+            self.created += 1
+            if len(self._clients) > self.max_keys:
+                self._clients.popitem(last=False)
+            return client
+
+    def __len__(self):
+        with self._lock:
+            return len(self._clients)
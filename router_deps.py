@@ -0,0 +1,50 @@
+"""
+MAC Router Generator - Optional Dependencies
+Heavy or optional libraries imported on first use, so startup stays fast; imports no router module
+"""
+
+import threading
+
+_sdk = None
+_sdk_lock = threading.Lock()
+_preload_started = False
+
+
+def load_sdk():
+    """Import the Gemini SDK on first use (about half a second) - returns (genai, client, file_types)"""
+    global _sdk
+    with _sdk_lock:
+        if _sdk is None:
+            import google.generativeai as genai
+            from google.generativeai import client as genai_client
+            from google.generativeai.types import file_types
+            _sdk = (genai, genai_client, file_types)
+        return _sdk
+
+
+def preload_sdk():
+    """Import the SDK on a background thread (once per process) so the first generation doesn't wait on it"""
+    global _preload_started
+    with _sdk_lock:
+        if _preload_started or _sdk is not None:
+            return
+        _preload_started = True
+    threading.Thread(target=load_sdk, name="router-sdk-preload", daemon=True).start()
+
+
+def load_pypdf():
+    """pypdf, imported on first use; None when it isn't installed (every upload is then a single part)"""
+    try:
+        import pypdf
+    except ImportError:
+        return None
+    return pypdf
+
+
+def load_pdfium():
+    """pypdfium2, imported on first use; None when it isn't installed (text-only matching)"""
+    try:
+        import pypdfium2
+    except ImportError:
+        return None
+    return pypdfium2
@@ -0,0 +1,184 @@
+"""
+MAC Router Generator - Operations Editor
+Grid rows for a generated router and local, incremental recomputation when a planner edits them
+"""
+
+from collections import Counter
+import hashlib
+import json
+
+from router_model import parse_router, synthesize_router_csv, default_instruction
+from router_render import router_hash
+
+# Grid columns shown to the planner
+SEQ = "Seq"
+WORK_CENTER = "Work Center"
+DESCRIPTION = "Operation Description"
+SETUP = "Setup Hours"
+MINUTES = "Minutes per Piece"
+INSTRUCTION = "Instruction"
+GRID_COLUMNS = [SEQ, WORK_CENTER, DESCRIPTION, SETUP, MINUTES, INSTRUCTION]
+
+
+def _number(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    # Empty grid cells come back as NaN
+    return 0.0 if number != number else number
+
+
+def _text(value):
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+    return str(value).strip()
+
+
+class RouterEditor:
+    """Holds one generated router and applies grid edits to it without calling the model"""
+
+    def __init__(self, csv_text):
+        self.source_hash = router_hash(csv_text)
+        self.router = parse_router(csv_text)
+        self.quantity = self.router['quantity'] or 1
+        # Totals are kept in hundredths of an hour so incremental updates never drift
+        self._keys = []
+        self._ops_by_key = {}
+        self._setup_cents = 0
+        self._run_cents = 0
+        # Seed the cache with the generated operations so untouched rows keep their exact hours
+        keys = []
+        for row, op in zip(self.base_rows(), self.router['operations']):
+            key = self._key_from_row(row)
+            self._ops_by_key.setdefault(key, dict(op, instruction=key[4]))
+            keys.append(key)
+        self._apply_keys(keys)
+        self.csv_text = csv_text
+        self.rows_changed = 0
+
+    def base_rows(self):
+        """Grid rows for the router as generated"""
+        rows = []
+        for index, op in enumerate(self.router['operations']):
+            rows.append({
+                SEQ: (index + 1) * 10,
+                WORK_CENTER: op['work_center'],
+                DESCRIPTION: op['description'],
+                SETUP: round(op['setup_hours'], 2),
+                MINUTES: round(op['run_hours'] * 60.0 / self.quantity, 2),
+                INSTRUCTION: op['instruction'],
+            })
+        return rows
+
+    def _key_from_row(self, row):
+        work_center = _text(row.get(WORK_CENTER)).upper()
+        # Blank instruction picks up the same default the cleanup pipeline uses
+        instruction = _text(row.get(INSTRUCTION)) or default_instruction(work_center)
+        return (work_center, _text(row.get(DESCRIPTION)).upper(), round(_number(row.get(SETUP)), 2),
+                round(_number(row.get(MINUTES)), 4), instruction)
+
+    def _operation(self, key):
+        """Derived operation for a row key (cached - unchanged rows are never recomputed)"""
+        op = self._ops_by_key.get(key)
+        if op is None:
+            work_center, description, setup, minutes, instruction = key
+            op = {
+                'work_center': work_center,
+                'description': description,
+                'setup_hours': setup,
+                'run_hours': round(minutes * self.quantity / 60.0, 2),
+                'move_hours': 0.0,
+                'instruction': instruction,
+            }
+            self._ops_by_key[key] = op
+        return op
+
+    def _cents(self, key):
+        op = self._operation(key)
+        return int(round(op['setup_hours'] * 100)), int(round(op['run_hours'] * 100))
+
+    def _apply_keys(self, keys):
+        """Adjust totals by only the rows that were added or removed; returns how many changed"""
+        old, new = Counter(self._keys), Counter(keys)
+        changed = 0
+        for key, count in (old - new).items():
+            setup, run = self._cents(key)
+            self._setup_cents -= setup * count
+            self._run_cents -= run * count
+            changed += count
+        for key, count in (new - old).items():
+            setup, run = self._cents(key)
+            self._setup_cents += setup * count
+            self._run_cents += run * count
+            changed += count
+        self._keys = keys
+        return changed
+
+    def row_keys(self, rows):
+        """Operations the grid rows describe, in router order - equal keys mean the same router"""
+        # Rows without a work center are half-added grid lines; order by Seq, keeping grid order for ties
+        kept = [row for row in rows if _text(row.get(WORK_CENTER))]
+        ordered = sorted(enumerate(kept), key=lambda item: (_number(item[1].get(SEQ)) or float('inf'), item[0]))
+        return [self._key_from_row(row) for _, row in ordered]
+
+    def apply(self, rows):
+        """Apply the edited grid rows and return the refreshed router CSV"""
+        keys = self.row_keys(rows)
+        if keys == self._keys:
+            return self.csv_text
+
+        self.rows_changed = self._apply_keys(keys)
+        operations = []
+        for index, key in enumerate(keys):
+            # Op numbers are always renumbered 10, 20, 30... in grid order
+            operations.append(dict(self._operation(key), op=(index + 1) * 10))
+        self.router = dict(self.router, operations=operations)
+        self.csv_text = synthesize_router_csv(self.router, totals=self.totals())
+        return self.csv_text
+
+    def totals(self):
+        """(total setup, total run, setup per unit, run per unit) from the running totals"""
+        total_setup = self._setup_cents / 100.0
+        total_run = self._run_cents / 100.0
+        return total_setup, total_run, total_setup / self.quantity, total_run / self.quantity
+
+
+def editor_for(state):
+    """Session's editor for the router as generated, rebuilt only when a new router arrives"""
+    base_csv = state['router_base_csv']
+    editor = state.get('router_editor')
+    if editor is None or editor.source_hash != router_hash(base_csv):
+        editor = RouterEditor(base_csv)
+        state['router_editor'] = editor
+    return editor
+
+
+def clean_rows(rows):
+    """Grid rows as plain values that survive JSON (the grid hands back NaN and numpy numbers)"""
+    cleaned = []
+    for row in rows:
+        seq = _number(row.get(SEQ))
+        cleaned.append({
+            SEQ: int(seq) if seq == int(seq) else seq,
+            WORK_CENTER: _text(row.get(WORK_CENTER)),
+            DESCRIPTION: _text(row.get(DESCRIPTION)),
+            SETUP: _number(row.get(SETUP)),
+            MINUTES: _number(row.get(MINUTES)),
+            INSTRUCTION: _text(row.get(INSTRUCTION)),
+        })
+    return cleaned
+
+
+def grid_rows_for(state, editor):
+    """Rows the grid starts from: the session's saved edits to this router, else the router as generated"""
+    saved = state.get('router_edit_rows') or {}
+    if saved.get('source') == editor.source_hash:
+        return saved['rows']
+    return editor.base_rows()
+
+
+def grid_key(editor, rows):
+    """Widget key for the grid - a new one whenever its starting rows change, so edits are never applied twice"""
+    rows_hash = hashlib.sha256(json.dumps(rows, sort_keys=True).encode('utf-8')).hexdigest()
+    return f"operations_editor_{editor.source_hash[:12]}_{rows_hash[:12]}"
@@ -0,0 +1,237 @@
+"""
+MAC Router Generator - Fake Model Backend
+Local stand-ins for Gemini (interactive calls and the batch service) that return realistic raw router text
+"""
+
+from datetime import datetime
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+# Where the fake batch service keeps its jobs, so they survive a restart of the submitting process
+FAKE_BATCH_DIR = os.environ.get("ROUTER_FAKE_BATCH_DIR", ".router_fake_batches")
+
+# Operation plans the fake picks from, keyed off the drawing hash so a drawing always gets the same router
+FAKE_PLANS = [
+    [("SAW", "CUT TO LENGTH", 0.25, 0.5, "CUT MATERIAL TO LENGTH PER THE DWG."),
+     ("CNC-L", "MACHINE PART", 2.00, 2.0, "MACHINE PART PER THE DWG AND DEBURR.")],
+    [("WATERJT", "CUT OUT", 0.50, 3.0, "VETTED S.O. 04/08/25 CUT OUT PER THE DWG AND DEBURR."),
+     ("BEND", "BEND", 0.50, 0.76, "BEND PART TO THE DWG.")],
+    [("WATERJT", "CUT OUT", 0.50, 15.0, "VETTED S.O. 04/08/25 CUT OUT PER THE DWG AND DEBURR."),
+     ("CNC-M", "MACHINE PART", 2.00, 7.5, "MACHINE PART PER THE DWG AND DEBURR.")],
+    [("WELD", "WELD", 3.00, 20.0, "VETTED S.O. 04/08/25 WELD PARTS PER DRAWING."),
+     ("SUB-PL", "SUB PLATING", 0.00, 0.0, "PLATE, OUTSIDE VENDOR, ZINC PLATE")],
+]
+
+
+def fake_router_text(drawing_hash, quantity, fenced=True):
+    """Raw model-style router text for a drawing (wrapped in a code fence like real responses often are)"""
+    plan = FAKE_PLANS[int(drawing_hash[:8], 16) % len(FAKE_PLANS)] if drawing_hash else FAKE_PLANS[0]
+    now = datetime.now()
+    lines = [
+        "MAC,,,,,Standard Routing Summary,,,,,Page : 1 of 1",
+        f",,,,,,,,,Date : {now.strftime('%m/%d/%Y')}",
+        f",,,,,,,,,Time : {now.strftime('%I:%M:%S %p')} EST",
+        ",,,,,,,,,",
+        "Facility,Part Number,Rev,Description,Unit of Measure,Standard Process Qty,,,",
+        f"Default,FAKE{(drawing_hash or '0' * 8)[:8].upper()},0,FAKE TEST PART,EA,{quantity}.00000,,,",
+        ",,,,,,,,,",
+        ",,,,,,,,,",
+        "Op,Work Center,Operation Description,Operation Qty,Setup Hours,Production Hours,Move Hours,Sub-Contract Costs,Other Costs,Standard Cost/Operation",
+    ]
+    for n, (code, desc, setup, minutes, instruction) in enumerate(plan):
+        run = minutes * quantity / 60.0
+        lines.append(f"{(n + 1) * 10},{code},{desc},{quantity}.0000,{setup:.2f},{run:.2f},0.00,0.00,0.00,0.00")
+        lines.append(f",{instruction},,,,,,,,,")
+        lines.append(",,,,,,,,,")
+    # Totals deliberately left at 0.00 - the cleanup pipeline recomputes them
+    lines += [
+        "Totals,,,,0.00,0.00,0.00,0.00,0.00,0.00",
+        "Totals per Unit,,,,0.00,0.00,0.00,0.00,0.00,0.00",
+        ",,,,,,,,,",
+        ",,,,,,End of Report,,,,,",
+        ",,,,,,,,,",
+        ",,,,,,This report was requested by MAC ROUTER GENERATOR,,,,,",
+    ]
+    text = "\n".join(lines)
+    return f"```csv\n{text}\n```" if fenced else text
+
+
+def _fake_operations(plan):
+    return [
+        {'work_center': code, 'description': desc, 'setup_hours': setup, 'minutes_per_piece': minutes,
+         'instruction': instruction}
+        for code, desc, setup, minutes, instruction in plan
+    ]
+
+
+def fake_router_payload(drawing_hash, quantity, defective=False):
+    """Compact JSON response (the structured output format) for a drawing, optionally with a bad row"""
+    plan = FAKE_PLANS[int(drawing_hash[:8], 16) % len(FAKE_PLANS)] if drawing_hash else FAKE_PLANS[0]
+    operations = _fake_operations(plan)
+    if defective:
+        operations[0]['minutes_per_piece'] = "TBD"
+    return json.dumps({
+        'part_number': f"FAKE{(drawing_hash or '0' * 8)[:8].upper()}",
+        'rev': "0",
+        'description': "FAKE TEST PART",
+        'operations': operations,
+    })
+
+
+def fake_repair_payload(drawing_hash):
+    """Repair response correcting every operation of the drawing's plan"""
+    plan = FAKE_PLANS[int(drawing_hash[:8], 16) % len(FAKE_PLANS)] if drawing_hash else FAKE_PLANS[0]
+    operations = [dict(op, index=index) for index, op in enumerate(_fake_operations(plan))]
+    return json.dumps({'part_number': f"FAKE{(drawing_hash or '0' * 8)[:8].upper()}", 'operations': operations})
+
+
+class FakeBackend:
+    """Model backend that never touches the network - for load tests, benchmarks and service tests"""
+
+    name = "fake"
+
+    def __init__(self, latency=1.0, jitter=0.5, tail_probability=0.0, tail_latency=10.0,
+                 failure_rate=0.0, seed=None, compact=False, defect_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        # A small fraction of slow calls mimics provider tail latency
+        self.tail_probability = tail_probability
+        self.tail_latency = tail_latency
+        self.failure_rate = failure_rate
+        # Answer with the compact JSON payload instead of full CSV text
+        self.compact = compact
+        # Fraction of compact responses with a non-numeric run time, to exercise the repair re-prompt
+        self.defect_rate = defect_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.calls = 0
+
+    def _draw(self):
+        with self._lock:
+            self.calls += 1
+            if self._random.random() < self.tail_probability:
+                delay = self.tail_latency
+            else:
+                delay = max(self.latency + self._random.uniform(-self.jitter, self.jitter), 0.0)
+            fail = self._random.random() < self.failure_rate
+            defective = self._random.random() < self.defect_rate
+        return delay, fail, defective
+
+    def upload(self, drawing, api_key):
+        with self._lock:
+            self.uploads += 1
+        return {'size': drawing.size, 'digest': drawing.digest}
+
+    def generate(self, uploaded, prompt, model_name, session_id, fingerprint):
+        delay, fail, defective = self._draw()
+        time.sleep(delay)
+        if fail:
+            raise RuntimeError(f"Fake backend failure on {model_name}")
+        if fingerprint.get('repair'):
+            raw_text = fake_repair_payload(fingerprint.get('drawing_hash'))
+        elif self.compact:
+            raw_text = fake_router_payload(fingerprint.get('drawing_hash'), fingerprint.get('quantity', 1), defective)
+        else:
+            raw_text = fake_router_text(fingerprint.get('drawing_hash'), fingerprint.get('quantity', 1))
+        usage = {
+            'prompt_tokens': len(prompt) // 4,
+            'output_tokens': len(raw_text) // 4,
+            'total_tokens': (len(prompt) + len(raw_text)) // 4,
+        }
+        return raw_text, usage
+
+
+class FakeBatchService:
+    """
+    Stand-in for the provider's asynchronous batch interface: jobs are JSON files in a directory,
+    pending then running then succeeded as time passes, with optional per-item failures
+    """
+
+    name = "fake-batch"
+
+    def __init__(self, directory=FAKE_BATCH_DIR, turnaround=5.0, failure_rate=0.0, compact=True, seed=0):
+        self.directory = directory
+        self.turnaround = turnaround
+        self.failure_rate = failure_rate
+        self.compact = compact
+        self.seed = seed
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.submitted = 0
+
+    def _path(self, batch_id):
+        return os.path.join(self.directory, batch_id.split("/")[-1] + ".json")
+
+    def _load(self, batch_id):
+        with open(self._path(batch_id), encoding="utf-8") as f:
+            return json.load(f)
+
+    def upload(self, drawing, api_key):
+        with self._lock:
+            self.uploads += 1
+        return {'size': drawing.size, 'digest': drawing.digest}
+
+    def submit(self, requests, model_name, api_key, display_name):
+        """Accept a batch of {'key', 'uploaded', 'prompt', 'fingerprint'} requests; returns the batch id"""
+        batch_id = f"batches/fake-{uuid.uuid4().hex[:12]}"
+        job = {
+            'id': batch_id,
+            'display_name': display_name,
+            'model': model_name,
+            'created': time.time(),
+            'items': [{'key': r['key'], 'fingerprint': r['fingerprint'], 'prompt_chars': len(r['prompt'])}
+                      for r in requests],
+        }
+        tmp_path = self._path(batch_id) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f)
+        os.replace(tmp_path, self._path(batch_id))
+        with self._lock:
+            self.submitted += len(requests)
+        return batch_id
+
+    def find(self, display_name):
+        """Batch id submitted under display_name, or None"""
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                job = self._load(name[:-len(".json")])
+                if job['display_name'] == display_name:
+                    return job['id']
+        return None
+
+    def status(self, batch_id):
+        elapsed = time.time() - self._load(batch_id)['created']
+        if elapsed < self.turnaround / 2:
+            return 'pending'
+        if elapsed < self.turnaround:
+            return 'running'
+        return 'succeeded'
+
+    def results(self, batch_id):
+        """{key: {'text', 'usage'} or {'error'}} for a finished batch"""
+        results = {}
+        for item in self._load(batch_id)['items']:
+            fingerprint = item['fingerprint']
+            # Failures are decided per item, so a resubmitted item can succeed the next time
+            if random.Random(f"{self.seed}:{batch_id}:{item['key']}").random() < self.failure_rate:
+                results[item['key']] = {'error': "Fake batch item failure"}
+                continue
+            if self.compact:
+                text = fake_router_payload(fingerprint.get('drawing_hash'), fingerprint.get('quantity', 1))
+            else:
+                text = fake_router_text(fingerprint.get('drawing_hash'), fingerprint.get('quantity', 1))
+            results[item['key']] = {
+                'text': text,
+                'usage': {
+                    'prompt_tokens': item['prompt_chars'] // 4,
+                    'output_tokens': len(text) // 4,
+                    'total_tokens': (item['prompt_chars'] + len(text)) // 4,
+                },
+            }
+        return results
@@ -4,12 +4,32 @@ Ultra-clean ChatGPT-style interface with MAC Products branding
 """
 
 import streamlit as st
-import google.generativeai as genai
+from contextlib import nullcontext
 from datetime import datetime
 import base64
-import io
 import os
-import csv
+
+from router_chat import (
+    init_session_state, clear_conversation, routers_generated, handle_chat_submission, apply_router_edit,
+    accept_reuse_offer
+)
+from router_editor import (
+    editor_for, clean_rows, grid_key, grid_rows_for, SEQ, WORK_CENTER, DESCRIPTION, SETUP, MINUTES, INSTRUCTION
+)
+from router_pricebreaks import price_breaks_to_csv
+from router_packages import package_routers_to_zip
+from router_capacity import OperationTable, capacity_rollup, rollup_rows, routers_from_history
+from router_deps import preload_sdk
+from router_sessions import get_session_store, new_session_id, PAGE_SIZE
+from router_pipeline import GEMINI_MODELS
+from router_replay import RECORD_MODE
+from router_hedging import HedgePolicy, hedge_stats
+from router_ratelimit import get_rate_limiter
+from router_breaker import get_breaker, CLOSED, OPEN, FALLBACK_MODELS
+from router_singleflight import generation_flights
+from router_scans import scan_stats
+from router_preflight import preflight_stats
+from router_profiling import profiling_enabled, set_profiling_enabled, PROFILE_DIR
 
 # ==========================================
 # Page Configuration
@@ -448,14 +468,19 @@ st.markdown(f"""
 # ==========================================
 # Session State Initialization
 # ==========================================
-if 'chat_history' not in st.session_state:
-    st.session_state.chat_history = []
-if 'router_generated' not in st.session_state:
-    st.session_state.router_generated = False
-if 'router_csv' not in st.session_state:
-    st.session_state.router_csv = ""
-if 'quantity' not in st.session_state:
-    st.session_state.quantity = 50
+# The session id lives in the URL so a browser refresh reopens the same stored conversation. It is the only
+# protection on that conversation, so it is always a random token the store issued - an unknown or made-up
+# id in the URL (a link someone crafted) gets a fresh session instead of adopting it
+session_store = get_session_store()
+if 'session_id' not in st.session_state:
+    session_id = st.query_params.get('session')
+    if not session_store.has_session(session_id):
+        session_id = new_session_id()
+    st.query_params['session'] = session_id
+    st.session_state.session_id = session_id
+init_session_state(st.session_state, store=session_store)
+if 'history_pages' not in st.session_state:
+    st.session_state.history_pages = 1
 
 # ==========================================
 # Sidebar with MAC Logo
@@ -486,24 +511,21 @@ with st.sidebar:
         placeholder="Enter your API key..."
     )
     
-    if api_key:
+    if RECORD_MODE == "replay":
+        st.info("Replay mode - serving recorded responses, no API calls")
+    elif api_key:
         st.success("API Key configured")
     else:
         st.warning("Please enter API key")
+    if RECORD_MODE == "record":
+        st.caption("Recording raw model responses to the fixture store")
     
     st.markdown("---")
     
     st.markdown("### Model Settings")
     
     # Gemini model selector
-    gemini_models = [
-        "gemini-3-flash-preview",
-        "gemini-3-pro", 
-        "gemini-2.0-flash-exp",
-        "gemini-2.0-flash",
-        "gemini-1.5-pro",
-        "gemini-1.5-flash"
-    ]
+    gemini_models = GEMINI_MODELS
     
     selected_model = st.selectbox(
         "Select Gemini Model",
@@ -512,674 +534,139 @@ with st.sidebar:
         help="Choose the Gemini model for router generation"
     )
     
-    st.info(f"**{selected_model}**\n\nFREE for 1,500 requests/day")
+    # Remaining quota comes from the shared limiter, so it reflects every session on this server
+    rate_limiter = get_rate_limiter(selected_model)
+    quota_text = f"**{selected_model}**\n\n{rate_limiter.remaining_today():,} of {rate_limiter.requests_per_day:,} requests left today"
+    queued = rate_limiter.queue_depth()
+    if queued:
+        quota_text += f"\n\n{queued} request(s) waiting for a slot"
+    st.info(quota_text)
+
+    # Circuit breaker state for the selected model - shared by every session on this server
+    health = get_breaker(selected_model).snapshot()
+    health_text = "**Model status:** "
+    if health['state'] == CLOSED:
+        health_text += "Healthy"
+        if health['p50'] is not None:
+            health_text += f" - median {health['p50']:.1f}s over {health['calls']} recent calls"
+        st.success(health_text)
+    elif health['state'] == OPEN:
+        health_text += f"Unavailable ({health['last_error']}) - retrying in {health['retry_in']:.0f}s"
+        if FALLBACK_MODELS:
+            health_text += f"\n\nRequests go to {', '.join(FALLBACK_MODELS)} meanwhile"
+        st.error(health_text)
+    else:
+        health_text += "Recovering - next request probes the model"
+        st.warning(health_text)
+
+    # Hedging - race a backup model when the primary is slower than usual
+    hedge_enabled = st.checkbox(
+        "Hedge slow requests",
+        value=False,
+        help="If the selected model hasn't returned a valid router within its usual latency, also ask a backup model and keep whichever finishes first"
+    )
+    hedge_model = None
+    hedge_policy = None
+    if hedge_enabled:
+        hedge_model = st.selectbox(
+            "Backup Model",
+            [m for m in gemini_models if m != selected_model],
+            index=0,
+            help="Model raced against the primary once the hedge delay passes"
+        )
+        hedge_percentile = st.slider(
+            "Hedge After Latency Percentile",
+            min_value=50,
+            max_value=99,
+            value=90,
+            help="Launch the backup once the primary is slower than this percentile of its recent latencies"
+        )
+        hedge_policy = HedgePolicy(percentile=hedge_percentile)
     
     st.markdown("---")
     
     st.markdown("### Session Statistics")
-    st.metric("Routers Generated", len([m for m in st.session_state.chat_history if m['role'] == 'assistant']))
+    st.metric("Routers Generated", routers_generated(st.session_state))
     st.metric("Total Cost", "$0.00", delta="FREE Tier")
+
+    hedge_snapshot = hedge_stats.snapshot()
+    if hedge_snapshot['hedges_fired']:
+        st.metric(
+            "Hedges Fired",
+            f"{hedge_snapshot['hedges_fired']} / {hedge_snapshot['requests']}",
+            delta=f"{hedge_snapshot['hedge_wins']} won by backup",
+            delta_color="off"
+        )
+        if hedge_snapshot['p99_cut'] is not None:
+            st.metric("p99 Latency Cut", f"{hedge_snapshot['p99_cut']:.1f}s")
+
+    if generation_flights.coalesced:
+        st.metric(
+            "Coalesced Requests",
+            generation_flights.coalesced,
+            help="Duplicate submissions that shared an identical generation already in progress"
+        )
+
+    preflight = preflight_stats.snapshot()
+    if preflight['rejected_total']:
+        reasons = ", ".join(f"{reason}: {count}" for reason, count in sorted(preflight['rejected'].items()))
+        st.metric(
+            "Rejected Before Upload",
+            f"{preflight['rejected_total']} / {preflight['checked']}",
+            delta=f"avg check {preflight['avg_ms']:.0f} ms",
+            delta_color="off",
+            help=f"Drawings turned away by the local pre-flight check - {reasons}"
+        )
+        st.caption(reasons)
+    if preflight['fixed']:
+        st.caption("Auto-fixed: " + ", ".join(f"{fix}: {count}" for fix, count in sorted(preflight['fixed'].items())))
+
+    scans = scan_stats.snapshot()
+    if scans['files']:
+        st.metric(
+            "Scan Upload Savings",
+            f"{scans['saved_bytes'] / (1024 * 1024):.1f} MB",
+            delta=f"{scans['files']} scan(s) preprocessed",
+            delta_color="off",
+            help="Bytes not uploaded thanks to local deskew, crop, grayscale and downscaling of image drawings"
+        )
     
     st.markdown("---")
     
     if st.button("Clear Conversation", use_container_width=True):
-        st.session_state.chat_history = []
-        st.session_state.router_generated = False
-        st.session_state.router_csv = ""
+        clear_conversation(st.session_state)
+        st.session_state.history_pages = 1
         st.rerun()
     
     st.markdown("---")
     
+    with st.expander("Diagnostics"):
+        profile_on = st.checkbox(
+            "Profile generations",
+            value=profiling_enabled(),
+            help="Write cProfile, tracemalloc and collapsed-stack artifacts for every generation and render (applies to all sessions)"
+        )
+        if profile_on != profiling_enabled():
+            set_profiling_enabled(profile_on)
+        if profile_on:
+            st.caption(f"Writing profiles to `{os.path.abspath(PROFILE_DIR)}`")
+    
     with st.expander("Help & Documentation"):
         st.markdown("""
         **How to Use:**
         1. Enter your Gemini API key above
-        2. Upload an engineering drawing (PDF)
-        3. Adjust quantity if needed (default: 50)
+        2. Upload an engineering drawing (PDF, or a TIFF/PNG/JPEG scan)
+        3. Type the quantity (e.g. 50), or several for price breaks (e.g. 10/50/100/500 or 10-50 step 10)
         4. Click Generate Router
         5. Download or copy the result
         
         **Tips:**
-        - PDFs work best
+        - PDFs work best; scans are straightened, cropped and shrunk before upload
+        - Multi-part drawing packages are split per part automatically
         - Clear drawings produce better results
         - Review times before using in production
         """)
 
-# ==========================================
-# Knowledge Base
-# ==========================================
-KNOWLEDGE_BASE = """
-⚠️ CRITICAL: MOST MAC PARTS USE ONLY 2 OPERATIONS ⚠️
-Review the 14 real examples below - notice that simple parts rarely need more than 2 operations!
-
-REAL ROUTER EXAMPLES FROM THE SHOP:
-
-MACHINED PARTS (Simple Lathe - THE BASELINE):
-1. Z110001B045 - Sleeve Wiping Cap (115 pcs) - 2 OPERATIONS
-   Op 10: SAW - Setup: 0.25 hrs, Run: 0.03 hrs (0.5 min/pc)
-   Op 20: CNC-L - Setup: 2.00 hrs, Run: 3.83 hrs (2 min/pc)
-   Instruction: "CUT MATERIAL TO 36" / "MACHINE PART PER THE DWG AND DEBURR."
-
-2. Z110001B046 - Sleeve Wiping Tube (23 pcs) - 2 OPERATIONS
-   Op 10: SAW - Setup: 0.25 hrs, Run: 0.77 hrs (2 min/pc)
-   Op 20: CNC-L - Setup: 2.00 hrs, Run: 0.77 hrs (2 min/pc)
-   Instruction: "CUT MATERIAL TO LENGTH PER THE DWG." / "MACHINE PART PER THE DWG AND DEBURR."
-
-3. Z110001B037 - Sleeve Disc (550 pcs) - 3 OPERATIONS (Complex with plating)
-   Op 10: SAW - Setup: 0.25 hrs, Run: 4.58 hrs (0.5 min/pc)
-   Op 20: CNC-L - Setup: 2.00 hrs, Run: 18.33 hrs (2 min/pc)
-   Op 30: SUB-PL - "SUB PLATING" - Setup: 0.00 hrs, Run: 0.00 hrs
-   Instruction: "CUT MATERIAL TO LENGTH PER THE DWG." / "MACHINE PART PER THE DWG AND DEBURR." / "PLATE, OUTSIDE VENDOR, ZINC PLATE"
-
-SHEET METAL (Simple - 2 Operations):
-4. Z005002A019 - Position Holder Bracket (30 pcs) - 2 OPERATIONS
-   Op 10: WATERJT - Setup: 0.50 hrs, Run: 1.50 hrs (3 min/pc)
-   Op 20: BEND - Setup: 0.50 hrs, Run: 0.38 hrs (0.76 min/pc)
-   Instruction: "VETTED S.O. 04/08/25 CUT OUT PER THE DWG AND DEBURR." / "BEND PART TO THE DWG."
-
-5. Z005002C026 - Side Door (10 pcs) - 2 OPERATIONS
-   Op 10: WATERJT - Setup: 0.50 hrs, Run: 2.00 hrs (12 min/pc - larger part)
-   Op 20: BEND - Setup: 2.00 hrs (complex bends), Run: 0.50 hrs (3 min/pc)
-
-6. Z110001D007 - Clamp Swivel (50 pcs) - 2 OPERATIONS
-   Op 10: WATERJT - Setup: 0.50 hrs, Run: 12.50 hrs (15 min/pc - thick stainless)
-   Op 20: CNC-M - Setup: 2.00 hrs, Run: 6.25 hrs (7.5 min/pc)
-
-7. Z110001D005 - Latch Receiver (30 pcs) - 2 OPERATIONS
-   Op 10: WATERJT - Setup: 0.50 hrs, Run: 6.00 hrs (12 min/pc)
-   Op 20: CNC-M - Setup: 1.50 hrs, Run: 2.00 hrs (4 min/pc)
-
-8. TS01000B072-1 - Slide Plate (40 pcs) - 2 OPERATIONS
-   Op 10: WATERJT - Setup: 0.50 hrs, Run: 3.33 hrs (5 min/pc)
-   Op 20: CNC-M - Setup: 1.50 hrs, Run: 3.33 hrs (5 min/pc)
-
-SHEET METAL (Single Operation):
-9. Z005002A017 - Lifting Plate (20 pcs) - 1 OPERATION ONLY
-   Op 10: WATERJT - Setup: 0.50 hrs, Run: 1.00 hrs (3 min/pc)
-   Instruction: "VETTED S.O. 04/08/25 CUT OUT PER THE DWG AND DEBURR."
-
-10. Z110001B034 - Gasket (200 pcs) - 1 OPERATION ONLY
-    Op 10: WATERJT - Setup: 0.50 hrs, Run: 10.00 hrs (3 min/pc)
-
-WELDMENTS (Simple - 2 Operations):
-11. TS01000B086 - Spray Manifold Weldment (12 pcs) - 2 OPERATIONS
-    Op 10: WELD - Setup: 3.00 hrs, Run: 4.00 hrs (20 min/pc)
-    Op 20: SUB-PL - "SUB PLATING" - Setup: 0.00 hrs, Run: 0.00 hrs
-    Instruction: "VETTED S.O. [DATE] WELD PARTS PER DRAWING." / "PLATE, OUTSIDE VENDOR, ZINC PLATE"
-
-12. TS01000C047 - Control Panel Door (6 pcs) - 2 OPERATIONS
-    Op 10: WELD - Setup: 1.00 hrs, Run: 2.00 hrs (20 min/pc)
-    Op 20: PAINT - Setup: 0.50 hrs, Run: 0.00 hrs, Move: 4.00 hrs - PAINT PARTS PER THE DWG.
-
-COMPLEX PARTS (3+ Operations - RARE):
-13. Z110001A030 - Contact Plate (200 pcs) - 3 OPERATIONS
-    Op 10: WATERJT - Setup: 0.50 hrs, Run: 13.33 hrs (4 min/pc)
-    Op 20: ASSY-PP - "ASSY POWER PROP." - Setup: 0.50 hrs, Run: 6.67 hrs (2 min/pc)
-    Op 30: SUB-PL - "SUB PLATING" - Setup: 0.00 hrs, Run: 0.00 hrs
-    Instruction: "VETTED S.O. [DATE] CUT OUT PER THE DWG AND DEBURR." / "TAP HOLES PER THE DWG." / "PLATE, OUTSIDE VENDOR, TIN PLATE"
-
-14. 2651C2858-1 - Complex Weldment Assembly (1 pc) - 4 OPERATIONS
-    Op 10: WELD - Setup: 3.00 hrs, Run: 5.00 hrs (5 hrs for 1 pc)
-    Op 20: CNC-M - Setup: 2.00 hrs, Run: 2.00 hrs (2 hrs for 1 pc)
-    Op 30: WELD - Setup: 3.00 hrs, Run: 3.00 hrs (3 hrs for 1 pc)
-    Op 40: PAINT - Setup: 1.00 hrs, Run: 0.00 hrs, Move: 4.00 hrs
-
-SETUP TIMES (Standard - Use These Exactly):
-- SAW: 0.25 hrs (ALWAYS)
-- WATERJT: 0.50 hrs (ALWAYS)
-- BEND: 0.50 hrs (simple), 2.00 hrs (complex)
-- CNC-L: 2.00 hrs (ALWAYS 2.00, NEVER 1.00)
-- CNC-M: 1.50-2.00 hrs
-- WELD: 0.50-3.00 hrs
-- PAINT: 0.50-1.00 hrs + 4.00 hrs move time (dry time)
-- SUB-PL: 0.00 hrs (outside vendor)
-
-RUN TIMES PER PIECE (Typical):
-- SAW: 0.5-2 min/piece
-- WATERJET (simple flat): 3-5 min/piece
-- WATERJET (complex/thick): 10-15 min/piece
-- BEND (simple): 0.5-1 min/piece
-- BEND (complex): 2-3 min/piece
-- CNC-L (simple turning): 2-3 min/piece ← IF YOU GO OVER 5 MIN, YOU'RE WRONG!
-- CNC-M (drilling/tapping): 2-7.5 min/piece
-- WELD: 5-40 min/piece
-
-INSTRUCTIONS (Copy These Formats Exactly):
-- Waterjet: "VETTED S.O. [DATE] CUT OUT PER THE DWG AND DEBURR."
-- Saw: "CUT MATERIAL TO LENGTH PER THE DWG."
-- CNC-L: "MACHINE PART PER THE DWG AND DEBURR."
-- CNC-M: "MACHINE PART PER THE DWG AND DEBURR."
-- Bend: "BEND PART TO THE DWG."
-- Weld: "VETTED S.O. [DATE] WELD PARTS PER DRAWING."
-- Paint: "PAINT PARTS PER THE DWG."
-- Plating (SUB-PL): Operation Description = "SUB PLATING", Instruction = "PLATE, OUTSIDE VENDOR, [TYPE] PLATE" (e.g., ZINC PLATE, TIN PLATE)
-
-HOW TO SELECT OPERATIONS:
-1. **Simple lathe part?** → SAW + CNC-L (2 operations) - See examples Z110001B045, Z110001B046
-2. **Simple sheet metal?** → WATERJET + BEND (2 operations) - See example Z005002A019
-3. **Flat waterjet only?** → WATERJET (1 operation) - See examples Z005002A017, Z110001B034
-4. **Complex machining?** → WATERJET + CNC-M (2 operations) - See example Z110001D007
-5. **DO NOT add unnecessary operations!** Most parts need 2 or fewer operations.
-"""
-
-# ==========================================
-# Router Generation Function
-# ==========================================
-def generate_router_with_gemini(pdf_file, quantity, api_key, model_name="gemini-3-flash-preview"):
-    """Call Gemini API to generate router"""
-    try:
-        genai.configure(api_key=api_key)
-        pdf_bytes = pdf_file.read()
-        
-        prompt = f"""You are a manufacturing engineer creating a router for Made2Manage ERP.
-
-{KNOWLEDGE_BASE}
-
-TASK: Analyze this drawing and generate a router for {quantity} pieces.
-
-CRITICAL RULES:
-1. **MATCH THE EXAMPLES - MOST PARTS USE ONLY 2 OPERATIONS**
-   - Simple lathe: 2 ops (SAW + CNC-L) - see examples Z110001B045, Z110001B046
-   - Simple sheet metal: 2 ops (WATERJET + BEND) - see example Z005002A019
-   - Only complex weldments or very intricate parts need 3+ operations
-   - DO NOT add extra machining steps unless the drawing clearly shows complex features
-2. CNC-L setup = 2.00 hrs ALWAYS (not 1.00)
-3. Simple lathe parts = 2-3 min/piece MAX (if >5 min YOU'RE WRONG)
-4. Use examples as baseline for times - reference the most similar example in your reasoning
-5. Match instruction templates exactly
-6. DESCRIPTION FORMATTING: Always put the complete description in the Description field (e.g., "SLEEVE WIPING CAP" as one entry, not split)
-
-OUTPUT: Generate M2M Standard Routing Summary in CSV format.
-
-⚠️ CRITICAL CSV OUTPUT RULES - READ CAREFULLY:
-- Output PURE CSV TEXT ONLY - NO CODE, NO HTML, NO XML, NO FORMATTING
-- DO NOT include ANY HTML/XML tags like <td>, <tr>, <strong>, <div>, etc.
-- DO NOT include ANY code operators like <, >, ==, !=, &&, ||
-- DO NOT include ANY programming syntax or logic
-- Each field must contain ONLY: letters, numbers, spaces, periods, dollar signs, hyphens
-- Use ONLY commas to separate fields
-- The last column should contain ONLY "0.00" - nothing else
-- If you accidentally generate code or HTML, the output will be REJECTED
-
-CSV STRUCTURE (output EXACTLY this format):
-Line 1: MAC,,,,,Standard Routing Summary,,,,,Page : 1 of 1
-Line 2: ,,,,,,,,,Date : {datetime.now().strftime('%m/%d/%Y')}
-Line 3: ,,,,,,,,,Time : {datetime.now().strftime('%I:%M:%S %p')} EST
-Line 4: ,,,,,,,,,
-Line 5: Facility,Part Number,Rev,Description,Unit of Measure,Standard Process Qty,,,
-Line 6: Default,[PART# from drawing],0,[COMPLETE DESCRIPTION - combine all description words into single field separated by spaces],EA,{quantity}.00000,,,
-Line 7-8: Empty rows (just commas)
-Line 9: Op,Work Center,Operation Description,Operation Qty,Setup Hours,Production Hours,Move Hours,Sub-Contract Costs,Other Costs,Standard Cost/Operation
-Then for each operation (2 lines):
-  Data row: [OP#],[CODE],[DESC],{quantity}.0000,[SETUP],[RUN],0.00,0.00,0.00,0.00
-  Instruction row: ,[INSTRUCTION],,,,,,,,,
-  Empty row: ,,,,,,,,,
-
-  IMPORTANT FOR SUB-PL OPERATIONS:
-  - Work Center: SUB-PL
-  - Operation Description: "SUB PLATING" (not "PLATE TIN" or "PLATE OUTSIDE VENDOR")
-  - Instruction row (CRITICAL - must be complete): "PLATE, OUTSIDE VENDOR, ZINC PLATE" or "PLATE, OUTSIDE VENDOR, TIN PLATE"
-  - DO NOT abbreviate the instruction - include "PLATE, OUTSIDE VENDOR, [TYPE] PLATE" in full
-After all operations:
-  Totals,,,,[TOTAL SETUP],[TOTAL RUN],0.00,0.00,0.00,0.00
-  Totals per Unit,,,,[SETUP÷{quantity}],[RUN÷{quantity}],0.00,0.00,0.00,0.00
-
-  ⚠️ CRITICAL: TOTALS MUST BE CALCULATED CORRECTLY!
-  - Add up ALL Setup Hours from all operations for [TOTAL SETUP]
-  - Add up ALL Production Hours from all operations for [TOTAL RUN]
-  - Divide totals by quantity for "Totals per Unit"
-  - DO NOT put 0.00 in Totals unless all operations actually have 0 hours!
-
-  Empty rows
-  ,,,,,,End of Report,,,,,
-  Empty row
-  ,,,,,,This report was requested by MAC ROUTER GENERATOR,,,,,
-
-EXAMPLE OPERATION WITH INSTRUCTION (copy this format EXACTLY):
-10,SAW,CUT TO LENGTH,1.0000,0.25,0.01,0.00,0.00,0.00,0.00
-,CUT MATERIAL TO LENGTH PER THE DWG.,,,,,,,,,
-,,,,,,,,,
-20,CNC-L,MACHINE PART,1.0000,2.00,0.05,0.00,0.00,0.00,0.00
-,MACHINE PART PER THE DWG AND DEBURR.,,,,,,,,,
-,,,,,,,,,
-30,SUB-PL,SUB PLATING,1.0000,0.00,0.00,0.00,0.00,0.00,0.00
-,PLATE, OUTSIDE VENDOR, ZINC PLATE,,,,,,,,,
-,,,,,,,,,
-
-EXAMPLE TOTALS ROWS (copy this format EXACTLY - count the commas!):
-Totals,,,,2.25,0.06,0.00,0.00,0.00,0.00
-Totals per Unit,,,,0.03,0.07,0.00,0.00,0.00,0.00
-
-CRITICAL: Both Totals rows MUST have the same number of commas and columns!
-- Start with "Totals" or "Totals per Unit"
-- Then 3 empty fields (,,,)
-- Then 6 numeric values separated by commas
-
-⚠️ CRITICAL STRUCTURE RULES:
-1. EVERY operation row MUST be followed by an instruction row (starts with comma)
-2. EVERY instruction row MUST be followed by an empty row
-3. Pattern: Operation → Instruction → Empty Row → (repeat) → Totals
-
-Remember:
-- Read part number and description from the drawing title block
-- IMPORTANT: The Description field must contain the COMPLETE description as a single entry (e.g., "SLEEVE WIPING CAP" not split across fields)
-- Unit of Measure must be "EA"
-- Standard Process Qty must be the quantity value {quantity}.00000
-- Calculate run hours: (minutes per piece × {quantity}) ÷ 60
-- Keep operations simple and realistic
-- FOR SUB-PL OPERATIONS: Use "SUB PLATING" in description, and full instruction "PLATE, OUTSIDE VENDOR, ZINC PLATE" (not just "PLATE")
-- Output ONLY the CSV (no markdown, no code blocks, no explanation, NO HTML TAGS)
-"""
-        
-        model = genai.GenerativeModel(
-            model_name,
-            generation_config={
-                "temperature": 0.1,
-                "top_p": 0.95,
-                "top_k": 40,
-                "max_output_tokens": 8192,
-            }
-        )
-        
-        uploaded = genai.upload_file(io.BytesIO(pdf_bytes), mime_type='application/pdf')
-        response = model.generate_content([uploaded, prompt], request_options={"timeout": 60})
-
-        csv_text = response.text.strip()
-        if '```' in csv_text:
-            csv_text = csv_text.split('```csv')[-1].split('```')[0].strip()
-
-        # AGGRESSIVE CLEANING - Remove any malformed HTML/XML/code
-        import re
-
-        # Step 1: Remove HTML/XML tags
-        csv_text = re.sub(r'<[^>]+>', '', csv_text)
-
-        # Step 2: Remove any lines that contain code-like patterns (but keep valid CSV)
-        lines = csv_text.split('\n')
-        cleaned_lines = []
-        for line in lines:
-            # Skip lines with obvious code patterns: <, >, ==, !=, <=, >=, etc. in operations column
-            # But allow normal CSV commas and decimals
-            if not any([
-                ' < ' in line and ' > ' in line,  # Code comparison operators
-                '<td' in line.lower(),
-                '<tr' in line.lower(),
-                '</td' in line.lower(),
-                '</tr' in line.lower(),
-                '<strong' in line.lower(),
-                'colspan' in line.lower(),
-                '&&' in line,
-                '||' in line,
-                ' == ' in line,
-                ' != ' in line,
-                '</' in line,  # Any closing tag
-                ' />' in line,  # Self-closing tag
-            ]):
-                cleaned_lines.append(line)
-        csv_text = '\n'.join(cleaned_lines)
-
-        # Step 3: Clean up extra whitespace
-        csv_text = re.sub(r'\s{2,}', ' ', csv_text)
-
-        # Step 4: Validate each line has proper CSV structure (but be less aggressive)
-        lines = csv_text.split('\n')
-        validated_lines = []
-        for i, line in enumerate(lines):
-            # Always keep empty lines
-            if not line.strip():
-                validated_lines.append(line)
-                continue
-
-            # Check if line has reasonable structure (not too many problematic characters)
-            # Valid CSV should mostly be: alphanumeric, spaces, commas, periods, $, -, :, /
-            clean_chars = sum(1 for c in line if c.isalnum() or c in ' ,.:-$/()\'\"')
-            total_chars = len(line)
-
-            # Be more permissive - allow 70% valid chars instead of 80%
-            # This helps preserve instruction rows and other valid content
-            if total_chars > 0 and (clean_chars / total_chars) > 0.70:
-                validated_lines.append(line)
-            else:
-                # Only skip lines that are REALLY malformed
-                continue
-
-        csv_text = '\n'.join(validated_lines)
-
-        # Step 5: Fix malformed Totals per Unit rows (ensure same structure as Totals row)
-        lines = csv_text.split('\n')
-        for i in range(len(lines)):
-            # If line starts with "Totals per Unit" but has too few commas
-            if lines[i].startswith('Totals per Unit'):
-                parts = lines[i].split(',')
-                # Should have at least 10 parts (label + 3 empty + 6 values)
-                if len(parts) < 10:
-                    # Pad with empty strings to match structure
-                    while len(parts) < 10:
-                        parts.insert(1, '')  # Insert empty fields after label
-                    lines[i] = ','.join(parts)
-        csv_text = '\n'.join(lines)
-
-        # Step 6: Fix operation rows - ensure all have 10 fields (including final 0.00)
-        lines = csv_text.split('\n')
-        fixed_lines = []
-        for line in lines:
-            # Check if this is an operation data row (starts with a number like "10" or "20")
-            if line and line[0].isdigit() and ',' in line:
-                parts = line.split(',')
-                # Operation rows should have exactly 10 parts: Op, Work Center, Desc, Qty, Setup, Run, Move, Sub, Other, Cost
-                # Ensure it has 10 parts, padding with "0.00" if needed
-                while len(parts) < 10:
-                    parts.append('0.00')
-                # Ensure the last 6 columns (hours and costs) are properly formatted
-                for j in range(4, 10):  # Columns 4-9 (Setup through Standard Cost)
-                    if not parts[j] or parts[j].strip() == '':
-                        parts[j] = '0.00'
-                    else:
-                        # Normalize "0" to "0.00" and ensure proper decimal format
-                        try:
-                            val = float(parts[j].strip())
-                            parts[j] = f'{val:.2f}'
-                        except ValueError:
-                            parts[j] = '0.00'
-                fixed_lines.append(','.join(parts))
-            else:
-                fixed_lines.append(line)
-
-        csv_text = '\n'.join(fixed_lines)
-
-        # Step 6.5: Ensure instruction rows exist after each operation row
-        lines = csv_text.split('\n')
-        operation_fixed_lines = []
-        i = 0
-        while i < len(lines):
-            line = lines[i]
-            # Check if this is an operation data row (starts with a number)
-            if line and line[0].isdigit() and ',' in line:
-                # Add the operation row
-                operation_fixed_lines.append(line)
-
-                # Parse operation row to check work center
-                parts = line.split(',')
-                work_center = parts[1] if len(parts) > 1 else ""
-
-                # Check if NEXT line is an instruction row (starts with comma and has text)
-                if i + 1 < len(lines):
-                    next_line = lines[i + 1]
-                    if next_line.startswith(',') and len(next_line.split(',')) > 1 and next_line.split(',')[1].strip():
-                        # Instruction row exists - validate for SUB-PL operations
-                        if work_center.strip() == 'SUB-PL':
-                            # For SUB-PL, check if instruction contains "OUTSIDE VENDOR" in the ENTIRE line (not just first column)
-                            if 'OUTSIDE VENDOR' not in next_line:
-                                # Replace with proper instruction - Gemini generated incomplete instruction
-                                # IMPORTANT: Quote the instruction so comma doesn't split it into multiple cells
-                                operation_fixed_lines.append(',"PLATE, OUTSIDE VENDOR",,,,,,,,,')
-                            else:
-                                # Good instruction exists, but ensure it's properly quoted to prevent CSV splitting
-                                # Extract the instruction text (after first comma)
-                                inst_parts = next_line.split(',', 1)  # Split on first comma only
-                                if len(inst_parts) > 1:
-                                    inst_text = inst_parts[1].rstrip(',')  # Get instruction part, remove trailing commas
-                                    # If instruction contains commas and isn't already quoted, quote it
-                                    if ',' in inst_text and not (inst_text.startswith('"') and inst_text.endswith('"')):
-                                        # Remove existing commas and quote the whole instruction
-                                        operation_fixed_lines.append(f',"{inst_text.strip()}",,,,,,,,,')
-                                    else:
-                                        # Already quoted or no commas, keep as-is
-                                        operation_fixed_lines.append(next_line)
-                                else:
-                                    operation_fixed_lines.append(next_line)
-                        else:
-                            # Good - instruction row exists for other operations
-                            operation_fixed_lines.append(next_line)
-
-                        i += 2  # Skip both operation and instruction rows
-
-                        # Now ensure empty row after instruction
-                        if i < len(lines) and lines[i].strip() and not lines[i].strip() == ',,,,,,,,,':
-                            operation_fixed_lines.append(',,,,,,,,,')
-                        elif i < len(lines):
-                            operation_fixed_lines.append(lines[i])
-                            i += 1
-                    else:
-                        # Missing instruction row - add operation-specific placeholder
-                        if work_center.strip() == 'SUB-PL':
-                            # For plating operations, use generic instruction (no plating type specified)
-                            # IMPORTANT: Quote the instruction so comma doesn't split it into multiple cells
-                            operation_fixed_lines.append(',"PLATE, OUTSIDE VENDOR",,,,,,,,,')
-                        elif work_center.strip() == 'SAW':
-                            operation_fixed_lines.append(',CUT MATERIAL TO LENGTH PER THE DWG.,,,,,,,,,')
-                        elif work_center.strip() == 'CNC-L':
-                            operation_fixed_lines.append(',MACHINE PART PER THE DWG AND DEBURR.,,,,,,,,,')
-                        elif work_center.strip() == 'CNC-M':
-                            operation_fixed_lines.append(',MACHINE PART PER THE DWG AND DEBURR.,,,,,,,,,')
-                        elif work_center.strip() == 'WATERJT':
-                            operation_fixed_lines.append(',VETTED S.O. [DATE] CUT OUT PER THE DWG AND DEBURR.,,,,,,,,,')
-                        elif work_center.strip() == 'BEND':
-                            operation_fixed_lines.append(',BEND PART TO THE DWG.,,,,,,,,,')
-                        elif work_center.strip() == 'WELD':
-                            operation_fixed_lines.append(',VETTED S.O. [DATE] WELD PARTS PER DRAWING.,,,,,,,,,')
-                        elif work_center.strip() == 'PAINT':
-                            operation_fixed_lines.append(',PAINT PARTS PER THE DWG.,,,,,,,,,')
-                        else:
-                            operation_fixed_lines.append(',INSTRUCTIONS NOT PROVIDED IN OUTPUT,,,,,,,,,')
-                        operation_fixed_lines.append(',,,,,,,,,')
-                        i += 1
-                else:
-                    # End of file, add operation-specific placeholder
-                    if work_center.strip() == 'SUB-PL':
-                        # IMPORTANT: Quote the instruction so comma doesn't split it into multiple cells
-                        operation_fixed_lines.append(',"PLATE, OUTSIDE VENDOR",,,,,,,,,')
-                    elif work_center.strip() == 'SAW':
-                        operation_fixed_lines.append(',CUT MATERIAL TO LENGTH PER THE DWG.,,,,,,,,,')
-                    elif work_center.strip() == 'CNC-L':
-                        operation_fixed_lines.append(',MACHINE PART PER THE DWG AND DEBURR.,,,,,,,,,')
-                    elif work_center.strip() == 'CNC-M':
-                        operation_fixed_lines.append(',MACHINE PART PER THE DWG AND DEBURR.,,,,,,,,,')
-                    elif work_center.strip() == 'WATERJT':
-                        operation_fixed_lines.append(',VETTED S.O. [DATE] CUT OUT PER THE DWG AND DEBURR.,,,,,,,,,')
-                    elif work_center.strip() == 'BEND':
-                        operation_fixed_lines.append(',BEND PART TO THE DWG.,,,,,,,,,')
-                    elif work_center.strip() == 'WELD':
-                        operation_fixed_lines.append(',VETTED S.O. [DATE] WELD PARTS PER DRAWING.,,,,,,,,,')
-                    elif work_center.strip() == 'PAINT':
-                        operation_fixed_lines.append(',PAINT PARTS PER THE DWG.,,,,,,,,,')
-                    else:
-                        operation_fixed_lines.append(',INSTRUCTIONS NOT PROVIDED IN OUTPUT,,,,,,,,,')
-                    operation_fixed_lines.append(',,,,,,,,,')
-                    i += 1
-            else:
-                # Not an operation row, just add it
-                operation_fixed_lines.append(line)
-                i += 1
-
-        csv_text = '\n'.join(operation_fixed_lines)
-
-        # Step 6.6: Calculate Totals from operations (DETERMINISTIC - don't rely on Gemini)
-        lines = csv_text.split('\n')
-
-        # Extract all operation hours - this is now the SINGLE SOURCE OF TRUTH for totals
-        total_setup = 0.0
-        total_run = 0.0
-        quantity_value = quantity  # Use the quantity parameter
-
-        for line in lines:
-            # Check if line starts with a number (operation row like "10,WATERJT,...")
-            if line and ',' in line:
-                parts = line.split(',')
-                # Check if first part (after strip) looks like an operation number (10, 20, 30, etc.)
-                if len(parts) > 0 and parts[0].strip() and parts[0].strip().isdigit():
-                    try:
-                        # Extract setup and run hours from columns 4 and 5
-                        setup_hours = float(parts[4].strip()) if len(parts) > 4 and parts[4].strip() else 0.0
-                        run_hours = float(parts[5].strip()) if len(parts) > 5 and parts[5].strip() else 0.0
-                        total_setup += setup_hours
-                        total_run += run_hours
-                    except (ValueError, IndexError) as e:
-                        # Skip malformed rows
-                        continue
-
-        # Calculate per-unit totals
-        per_unit_setup = total_setup / quantity_value if quantity_value > 0 else 0.0
-        per_unit_run = total_run / quantity_value if quantity_value > 0 else 0.0
-
-        # Now find and replace Totals rows if they exist
-        fixed_totals_lines = []
-        for i, line in enumerate(lines):
-            if line.startswith('Totals') and not line.startswith('Totals per Unit'):
-                # Replace with calculated values
-                fixed_totals_lines.append(f'Totals,,,,{total_setup:.2f},{total_run:.2f},0.00,0.00,0.00,0.00')
-            elif line.startswith('Totals per Unit'):
-                # Replace with calculated values
-                fixed_totals_lines.append(f'Totals per Unit,,,,{per_unit_setup:.2f},{per_unit_run:.2f},0.00,0.00,0.00,0.00')
-            else:
-                # Not a totals row, keep as-is
-                fixed_totals_lines.append(line)
-
-        csv_text = '\n'.join(fixed_totals_lines)
-
-        # Step 7: Ensure proper spacing before Totals rows
-        lines = csv_text.split('\n')
-        spaced_lines = []
-        for i, line in enumerate(lines):
-            # Check if NEXT line is Totals and current line is NOT already empty
-            if i < len(lines) - 1 and lines[i + 1].startswith('Totals'):
-                # Add current line
-                spaced_lines.append(line)
-                # If current line is NOT empty (more robust check), add empty row for spacing
-                # Consider a line empty if it's blank or contains only commas
-                stripped = line.strip().replace(',', '')
-                if stripped:  # If there's ANY content beyond commas
-                    spaced_lines.append(',,,,,,,,,')
-            else:
-                # Normal line - just add it
-                spaced_lines.append(line)
-
-        csv_text = '\n'.join(spaced_lines)
-
-        # Step 8: Final validation - ensure we have ALL critical sections
-        # Check each required section individually and add if missing
-        lines = csv_text.split('\n')
-
-        # Check for "Totals" row (must appear first)
-        # Use the CALCULATED totals from Step 6.6 (not 0.00!)
-        has_totals = any('Totals' in line and not 'Totals per Unit' in line for line in lines)
-        if not has_totals:
-            csv_text += f'\n,,,,,,,,,\nTotals,,,,{total_setup:.2f},{total_run:.2f},0.00,0.00,0.00,0.00'
-
-        # Check for "Totals per Unit" row
-        has_totals_per_unit = any('Totals per Unit' in line for line in lines)
-        if not has_totals_per_unit:
-            csv_text += f'\nTotals per Unit,,,,{per_unit_setup:.2f},{per_unit_run:.2f},0.00,0.00,0.00,0.00'
-
-        # Check for "End of Report"
-        has_end_of_report = any('End of Report' in line for line in lines)
-        if not has_end_of_report:
-            csv_text += '\n,,,,,,,,,\n,,,,,,End of Report,,,'
-
-        # Check for footer message
-        has_footer = any('MAC ROUTER GENERATOR' in line or 'This report was requested' in line for line in lines)
-        if not has_footer:
-            csv_text += '\n,,,,,,,,,\n,,,,,,This report was requested by MAC ROUTER GENERATOR,,,'
-
-        return csv_text
-        
-    except Exception as e:
-        return f"Error: {str(e)}\n\nPlease check:\n- API key is valid\n- PDF is readable\n- Network connection is stable"
-
-def csv_to_html(csv_text):
-    """Convert CSV to HTML table for display - M2M Format"""
-    # Use csv.reader to properly parse quoted fields
-    lines_raw = csv_text.strip().split('\n')
-    lines = list(csv.reader(lines_raw))
-
-    html = '<div class="router-output">'
-    in_operations_table = False
-
-    for i, parts in enumerate(lines):
-        # Get original line for string matching
-        line_str = lines_raw[i] if i < len(lines_raw) else ""
-
-        # Header line - MAC logo, title, page info (collect all 3 lines for header)
-        if i == 0:
-            page_info = parts[10] if len(parts) > 10 else (parts[9] if len(parts) > 9 else "")
-            # Get date and time from lines 1 and 2
-            date_info = ""
-            time_info = ""
-            if len(lines) > 1 and len(lines[1]) > 9:
-                date_info = lines[1][9]
-            if len(lines) > 2 and len(lines[2]) > 9:
-                time_info = lines[2][9]
-
-            html += f'''
-            <div class="router-header">
-                <div class="router-logo">{parts[0]}</div>
-                <div class="router-title">{parts[5] if len(parts) > 5 else ""}</div>
-                <div class="router-info">{page_info}<br>{date_info}<br>{time_info}</div>
-            </div>
-            '''
-        # Skip date and time lines (already processed in header)
-        elif i in [1, 2]:
-            continue
-
-        # Part info table header
-        elif 'Facility' in line_str and 'Part Number' in line_str:
-            html += '<table class="part-info-table"><thead><tr>'
-            for cell in parts[:6]:
-                if cell.strip():
-                    html += f'<th>{cell}</th>'
-            html += '</tr></thead><tbody>'
-
-        # Operations table header
-        elif 'Op' in line_str and 'Work Center' in line_str:
-            html += '</tbody></table><table class="operations-table"><thead><tr>'
-            for cell in parts[:11]:  # Now 11 columns instead of 10
-                if cell.strip():
-                    html += f'<th>{cell}</th>'
-            html += '</tr></thead><tbody>'
-            in_operations_table = True
-
-        # Totals rows
-        elif line_str.startswith('Totals'):
-            html += '<tr class="totals-row">'
-            # Ensure we always have 11 columns, padding with empty cells if needed
-            padded_parts = parts + [''] * (11 - len(parts))  # Pad to 11 columns
-            for j in range(11):
-                cell = padded_parts[j] if j < len(padded_parts) else ''
-                if cell.strip():
-                    html += f'<td><strong>{cell}</strong></td>'
-                else:
-                    html += '<td></td>'
-            html += '</tr>'
-
-        # End of Report
-        elif 'End of Report' in line_str:
-            html += '</tbody></table>'
-            html += '<div class="footer-line"></div>'
-            html += '<div class="footer"><strong>End of Report</strong></div>'
-
-        # Footer message (last line)
-        elif i == len(lines) - 1 and len(parts) > 5:
-            footer_msg = parts[5] if parts[5] else ""
-            if footer_msg:
-                html += f'<div class="footer-text">{footer_msg}</div>'
-
-        # Data rows
-        elif parts and parts[0] and parts[0].strip() and not line_str.startswith(','):
-            html += '<tr>'
-            for cell in parts[:11 if in_operations_table else 6]:  # Now 11 columns for operations
-                html += f'<td>{cell}</td>'
-            html += '</tr>'
-
-        # Instruction rows (start with comma)
-        elif line_str.startswith(',') and len(parts) > 1 and parts[1].strip():
-            html += '<tr class="instruction-row">'
-            colspan = "11" if in_operations_table else "6"  # Now colspan 11
-            html += f'<td colspan="{colspan}">{parts[1]}</td>'
-            html += '</tr>'
-
-    html += '</div>'
-    return html
-
 # ==========================================
 # Main Interface
 # ==========================================
@@ -1205,7 +692,15 @@ def load_logo_as_base64():
 # Display chat history using st.chat_message
 logo_b64 = load_logo_as_base64()
 
-for message in st.session_state.chat_history:
+# Only the most recent pages are loaded from the session store
+history = st.session_state.chat_history
+visible = PAGE_SIZE * st.session_state.history_pages
+if len(history) > visible:
+    if st.button("Load earlier messages"):
+        st.session_state.history_pages += 1
+        st.rerun()
+
+for message in history.tail(visible):
     # Use MAC logo for both user and assistant if available
     if logo_b64:
         with st.chat_message(message['role'], avatar=logo_b64):
@@ -1214,88 +709,78 @@ for message in st.session_state.chat_history:
         with st.chat_message(message['role']):
             st.markdown(message['content'], unsafe_allow_html=True)
 
+# A near-duplicate is only offered - the planner decides whether to start from it
+if st.session_state.reuse_offer:
+    if st.button("Use Previous Router", help="Start from the matched router, generated for the same quantity"):
+        accept_reuse_offer(st.session_state)
+        st.rerun()
+
 # Chat input with file attachment
-if prompt := st.chat_input("Attach a PDF drawing and enter quantity...", key="chat_input", accept_file=True):
+if prompt := st.chat_input("Attach a drawing (PDF or scan) and enter quantity...", key="chat_input", accept_file=True):
     
     # Check if user attached a file
-    has_file = hasattr(prompt, 'files') and prompt.files
+    files = prompt.files if hasattr(prompt, 'files') and prompt.files else []
     user_text = prompt.text if hasattr(prompt, 'text') else str(prompt)
     
-    # Extract quantity from text
-    quantity = None
-    try:
-        import re
-        numbers = re.findall(r'\d+', user_text)
-        if numbers:
-            quantity = int(numbers[0])
-    except:
-        pass
+    with st.spinner("Analyzing drawing and generating router...") if files else nullcontext():
+        handle_chat_submission(
+            st.session_state, user_text, files, api_key, selected_model,
+            hedge_model=hedge_model, hedge_policy=hedge_policy,
+            require_api_key=RECORD_MODE != "replay"
+        )
     
-    if has_file and quantity:
-        # User uploaded PDF AND provided quantity
-        pdf_file = prompt.files[0]
-        pdf_name = pdf_file.name
-        
-        # Check if API key is configured
-        if not api_key:
-            st.session_state.chat_history.append({
-                'role': 'user',
-                'content': f"Uploaded: **{pdf_name}** | Quantity: **{quantity}**"
-            })
-            st.session_state.chat_history.append({
-                'role': 'assistant',
-                'content': "Please enter your Gemini API key in the sidebar to generate routers."
-            })
+    st.rerun()
+
+# Editable operations grid - edits recompute totals locally, no model call
+if st.session_state.router_base_csv and not st.session_state.price_breaks:
+    with st.expander("Edit Operations"):
+        editor = editor_for(st.session_state)
+        # Saved edits survive a refresh or restart - the grid reopens on them, not on the generated rows
+        grid_rows = grid_rows_for(st.session_state, editor)
+        edited = st.data_editor(
+            grid_rows,
+            num_rows="dynamic",
+            use_container_width=True,
+            key=grid_key(editor, grid_rows),
+            column_config={
+                SEQ: st.column_config.NumberColumn(SEQ, help="Change to reorder - ops are renumbered 10, 20, 30...", step=1),
+                WORK_CENTER: st.column_config.TextColumn(WORK_CENTER, help="SAW, WATERJT, CNC-L, CNC-M, BEND, WELD, PAINT, SUB-PL"),
+                DESCRIPTION: st.column_config.TextColumn(DESCRIPTION),
+                SETUP: st.column_config.NumberColumn(SETUP, min_value=0.0, step=0.25, format="%.2f"),
+                MINUTES: st.column_config.NumberColumn(MINUTES, min_value=0.0, step=0.25, format="%.2f"),
+                INSTRUCTION: st.column_config.TextColumn(INSTRUCTION, help="Leave blank for the work center's default instruction"),
+            }
+        )
+        edited_rows = clean_rows(edited.to_dict('records') if hasattr(edited, 'to_dict') else list(edited))
+        edited_csv = editor.apply(edited_rows)
+        # Compared by rows, not CSV text - the regenerated CSV carries a fresh timestamp
+        if editor.row_keys(edited_rows) != editor.row_keys(grid_rows):
+            apply_router_edit(st.session_state, edited_csv,
+                              {'source': editor.source_hash, 'rows': edited_rows})
+            # History is drawn above this point, so rerun once to show the edited router
             st.rerun()
-        
-        # Add user message
-        st.session_state.chat_history.append({
-            'role': 'user',
-            'content': f"Uploaded: **{pdf_name}** | Quantity: **{quantity}**"
-        })
-        
-        # Generate router
-        with st.spinner("Analyzing drawing and generating router..."):
-            router_csv = generate_router_with_gemini(pdf_file, quantity, api_key, selected_model)
-            st.session_state.router_csv = router_csv
-            st.session_state.router_generated = True
-            
-            html_output = csv_to_html(router_csv)
-            
-            st.session_state.chat_history.append({
-                'role': 'assistant',
-                'content': f"<strong>Router Generated Successfully</strong><br><br>{html_output}"
-            })
-        
-        st.rerun()
-    
-    elif has_file and not quantity:
-        # Has file but no quantity
-        st.session_state.chat_history.append({
-            'role': 'user',
-            'content': f"Uploaded: **{prompt.files[0].name}**"
-        })
-        
-        st.session_state.chat_history.append({
-            'role': 'assistant',
-            'content': "Please include the production quantity in your message (e.g., 'Generate router for 50 pieces')."
-        })
-        
-        st.rerun()
-    
-    else:
-        # Normal message or request
-        st.session_state.chat_history.append({
-            'role': 'user',
-            'content': user_text
-        })
-        
-        st.session_state.chat_history.append({
-            'role': 'assistant',
-            'content': "Please attach a PDF engineering drawing and include the quantity in your message. For example: 'Generate router for 50 pieces' (then attach the PDF)."
-        })
-        
-        st.rerun()
+        total_setup, total_run, per_unit_setup, per_unit_run = editor.totals()
+        st.caption(
+            f"Totals: {total_setup:.2f} setup hrs, {total_run:.2f} run hrs  •  "
+            f"Per unit: {per_unit_setup:.2f} / {per_unit_run:.2f}"
+        )
+
+# Work-center load across every router generated this session
+session_routers = routers_from_history(st.session_state.chat_history)
+if session_routers:
+    with st.expander("Work Center Load"):
+        load_col1, load_col2 = st.columns(2)
+        with load_col1:
+            hours_per_shift = st.number_input("Hours per Shift", min_value=1.0, max_value=24.0, value=8.0, step=0.5)
+        with load_col2:
+            shifts_per_day = st.number_input("Shifts per Day", min_value=1, max_value=3, value=1, step=1)
+        load_table = OperationTable.from_routers(session_routers)
+        st.dataframe(
+            rollup_rows(capacity_rollup(load_table, hours_per_shift, shifts_per_day)),
+            use_container_width=True,
+            hide_index=True
+        )
+        st.caption(f"{len(load_table)} operations across {len(load_table.parts)} parts")
 
 # Download buttons
 if st.session_state.router_generated and st.session_state.router_csv:
@@ -1304,18 +789,36 @@ if st.session_state.router_generated and st.session_state.router_csv:
     
     col1, col2, col3 = st.columns(3)
     
+    # Price-break requests export every quantity together in one file
+    if st.session_state.price_breaks:
+        export_csv = price_breaks_to_csv(st.session_state.price_breaks)
+        export_name = f"router_price_breaks_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    else:
+        export_csv = st.session_state.router_csv
+        export_name = f"router_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    
     with col1:
-        st.download_button(
-            label="Download CSV",
-            data=st.session_state.router_csv,
-            file_name=f"router_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-            mime="text/csv",
-            use_container_width=True
-        )
+        # Split packages download as a zip with one router per part
+        if st.session_state.package_routers:
+            st.download_button(
+                label="Download All Parts (ZIP)",
+                data=package_routers_to_zip(st.session_state.package_routers),
+                file_name=f"routers_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+                mime="application/zip",
+                use_container_width=True
+            )
+        else:
+            st.download_button(
+                label="Download CSV",
+                data=export_csv,
+                file_name=export_name,
+                mime="text/csv",
+                use_container_width=True
+            )
     
     with col2:
         if st.button("View Raw CSV", use_container_width=True):
-            st.code(st.session_state.router_csv, language="csv")
+            st.code(export_csv, language="csv")
     
     with col3:
         st.button("Export to Excel", use_container_width=True, disabled=True, help="Coming in Phase 2")
@@ -1329,3 +832,6 @@ st.markdown("""
     <strong>MAC Products</strong> • Router Generator v1.0 • Powered by Google Gemini 3 Flash Preview
 </div>
 """, unsafe_allow_html=True)
+
+# The page is drawn - warm up the Gemini SDK in the background so the first generation doesn't pay its import
+preload_sdk()
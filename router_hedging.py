@@ -0,0 +1,200 @@
+"""
+MAC Router Generator - Hedged Requests
+Races a backup model against a slow primary and keeps the first valid router
+"""
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
+import math
+import threading
+import time
+
+# Shared worker pool for generation attempts - lives for the whole process so reruns reuse it
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="router-hedge")
+
+
+class HedgeCancelled(Exception):
+    """Raised inside an attempt that lost the race - before it starts or at one of its checkpoints"""
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (pct in 0-100)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class LatencyTracker:
+    """Rolling window of successful generation latencies per model"""
+
+    def __init__(self, window=200):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, model_name, seconds):
+        with self._lock:
+            if model_name not in self._samples:
+                self._samples[model_name] = deque(maxlen=self.window)
+            self._samples[model_name].append(seconds)
+
+    def count(self, model_name):
+        with self._lock:
+            return len(self._samples.get(model_name, ()))
+
+    def percentile(self, model_name, pct):
+        with self._lock:
+            values = list(self._samples.get(model_name, ()))
+        return percentile(values, pct)
+
+
+class HedgePolicy:
+    """Decides how long to wait on the primary model before launching the backup"""
+
+    def __init__(self, percentile=90, min_samples=5, default_delay=20.0, min_delay=2.0, max_delay=60.0):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+
+    def delay_for(self, model_name, tracker):
+        """Hedge delay in seconds - the model's latency percentile once we have enough samples"""
+        if tracker.count(model_name) < self.min_samples:
+            delay = self.default_delay
+        else:
+            delay = tracker.percentile(model_name, self.percentile)
+        return min(max(delay, self.min_delay), self.max_delay)
+
+
+class HedgeStats:
+    """Process-wide counters for how often hedging fired and how much tail latency it cut"""
+
+    def __init__(self, window=500):
+        self.requests = 0
+        self.hedges_fired = 0
+        self.hedge_wins = 0
+        # End-to-end latency the user actually waited
+        self._delivered = deque(maxlen=window)
+        # Latency the primary model alone would have taken (recorded even when it lost the race)
+        self._primary = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record_request(self, seconds, hedged, hedge_won):
+        with self._lock:
+            self.requests += 1
+            self._delivered.append(seconds)
+            if hedged:
+                self.hedges_fired += 1
+            if hedge_won:
+                self.hedge_wins += 1
+
+    def record_primary(self, seconds):
+        with self._lock:
+            self._primary.append(seconds)
+
+    def snapshot(self):
+        """Plain dict of the current counters for display"""
+        with self._lock:
+            delivered = list(self._delivered)
+            primary = list(self._primary)
+            requests = self.requests
+            fired = self.hedges_fired
+            wins = self.hedge_wins
+        p99_delivered = percentile(delivered, 99)
+        p99_primary = percentile(primary, 99)
+        p99_cut = None
+        if p99_delivered is not None and p99_primary is not None:
+            p99_cut = max(p99_primary - p99_delivered, 0.0)
+        return {
+            "requests": requests,
+            "hedges_fired": fired,
+            "hedge_wins": wins,
+            "hedge_rate": fired / requests if requests else 0.0,
+            "p99_primary": p99_primary,
+            "p99_delivered": p99_delivered,
+            "p99_cut": p99_cut,
+        }
+
+
+# Process-wide instances shared by every session
+latency_tracker = LatencyTracker()
+hedge_stats = HedgeStats()
+
+
+def _succeeded(future, is_valid):
+    """True if a finished attempt returned a router that passes validation"""
+    if future.cancelled() or future.exception() is not None:
+        return False
+    return is_valid(future.result())
+
+
+def run_hedged(attempt, primary_model, hedge_model, policy, is_valid, tracker=None, stats=None):
+    """
+    Run attempt(primary_model, checkpoint); if no valid router arrives within the policy delay,
+    race attempt(hedge_model, checkpoint) against it and return whichever validates first
+    checkpoint() raises HedgeCancelled once the race is over - attempts call it between model calls
+    so a loser already in flight stops before spending more quota (a repair re-prompt, say)
+    """
+    policy = policy or HedgePolicy()
+    tracker = tracker or latency_tracker
+    stats = stats or hedge_stats
+    cancelled = threading.Event()
+    start = time.monotonic()
+
+    def timed(model_name):
+        def checkpoint():
+            if cancelled.is_set():
+                raise HedgeCancelled(model_name)
+
+        # The loser is skipped outright if it never got a worker before the race ended
+        checkpoint()
+        t0 = time.monotonic()
+        result = attempt(model_name, checkpoint)
+        tracker.record(model_name, time.monotonic() - t0)
+        return result
+
+    def primary_done(future):
+        # Only a primary that ran to the end says how long it would have taken - not one abandoned mid-race
+        if future.cancelled() or isinstance(future.exception(), HedgeCancelled):
+            return
+        stats.record_primary(time.monotonic() - start)
+
+    primary = _executor.submit(timed, primary_model)
+    primary.add_done_callback(primary_done)
+
+    if not hedge_model or hedge_model == primary_model:
+        try:
+            return primary.result()
+        finally:
+            stats.record_request(time.monotonic() - start, hedged=False, hedge_won=False)
+
+    delay = policy.delay_for(primary_model, tracker)
+    done, _ = wait([primary], timeout=delay)
+    if primary in done and _succeeded(primary, is_valid):
+        stats.record_request(time.monotonic() - start, hedged=False, hedge_won=False)
+        return primary.result()
+
+    # Primary is slow or came back unusable - launch the backup model
+    backup = _executor.submit(timed, hedge_model)
+    pending = {backup} if primary in done else {primary, backup}
+    winner = None
+    while pending and winner is None:
+        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in finished:
+            if _succeeded(future, is_valid):
+                winner = future
+                break
+
+    # Cancel the loser - one not started never runs, one in flight stops at its next checkpoint
+    cancelled.set()
+    for future in pending:
+        future.cancel()
+
+    stats.record_request(time.monotonic() - start, hedged=True, hedge_won=winner is backup)
+    if winner is not None:
+        return winner.result()
+    # Neither attempt produced a valid router - surface the primary outcome (or its exception)
+    return primary.result()
@@ -0,0 +1,304 @@
+"""
+MAC Router Generator - Hot-Folder Service
+Watches a directory for released drawings (PDFs or TIFF/PNG/JPEG scans) and writes router CSVs using the same pipeline as the app
+
+Quantity comes from the filename (Z110001B045_qty50.pdf, Z110001B045 Q50.pdf, Z110001B045-50pcs.pdf)
+or a sidecar next to the drawing (Z110001B045.qty containing "50" or "10/50/100", or Z110001B045.json
+with {"quantity": 50}). Several quantities produce a price-break CSV. A multi-part drawing package is split
+at title-block part number changes like in the app, and each part gets its own CSV
+(PACKAGE_qty10_Z110001B045_router.csv); the drawing only counts as done once every part has a router.
+
+Usage:
+    python router_hotfolder.py /shared/released --output-dir /shared/routers --workers 4
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import argparse
+import json
+import os
+import re
+import threading
+import time
+
+from router_fake_backend import FakeBackend
+from router_packages import generate_package_routers
+from router_pricebreaks import parse_quantities, derive_price_breaks, price_breaks_to_csv
+from router_scans import savings_text
+
+CHECKPOINT_NAME = ".router_hotfolder_checkpoint.json"
+# Give up on a drawing after this many failed generations
+MAX_ATTEMPTS = 3
+DRAWING_EXTENSIONS = (".pdf", ".tif", ".tiff", ".png", ".jpg", ".jpeg")
+
+_FILENAME_QUANTITY = [
+    re.compile(r'(?:^|[_\s-])(?:qty|q)[\s_-]*(\d+)(?=$|[_\s.-])', re.IGNORECASE),
+    re.compile(r'(?:^|[_\s-])(\d+)[\s_-]*(?:pcs|pc|ea)(?=$|[_\s.-])', re.IGNORECASE),
+]
+
+
+class BadSidecar(Exception):
+    """A quantity sidecar that can't be read"""
+
+
+def quantities_for(pdf_path):
+    """
+    Quantities for a drawing from its sidecar file, else its filename; [] when none given
+    Raises BadSidecar when a sidecar exists but isn't valid
+    """
+    try:
+        return _quantities_for(pdf_path)
+    except (OSError, ValueError, TypeError, AttributeError) as e:
+        raise BadSidecar(f"Unreadable quantity sidecar for {os.path.basename(pdf_path)}: {e}")
+
+
+def _quantities_for(pdf_path):
+    stem = os.path.splitext(pdf_path)[0]
+    sidecar = stem + ".qty"
+    if os.path.exists(sidecar):
+        with open(sidecar, encoding="utf-8") as f:
+            return parse_quantities(f.read())
+    sidecar = stem + ".json"
+    if os.path.exists(sidecar):
+        with open(sidecar, encoding="utf-8") as f:
+            data = json.load(f)
+        value = data.get('quantities') or data.get('quantity')
+        if isinstance(value, list):
+            return sorted(set(int(q) for q in value if int(q) > 0))
+        return parse_quantities(str(value or ""))
+    name = os.path.basename(stem)
+    for pattern in _FILENAME_QUANTITY:
+        match = pattern.search(name)
+        if match:
+            return [int(match.group(1))]
+    return []
+
+
+def export_router(router_csv, quantities, output_path):
+    """Write a generated router (or its price-break CSV for several quantities) atomically"""
+    if len(quantities) > 1:
+        router_csv = price_breaks_to_csv(derive_price_breaks(router_csv, quantities))
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        f.write(router_csv)
+    os.replace(tmp_path, output_path)
+
+
+class Checkpoint:
+    """Per-drawing progress persisted as JSON so a restart skips finished work"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def get(self, key):
+        with self._lock:
+            return dict(self.entries.get(key, {}))
+
+    def update(self, key, **fields):
+        self.update_many({key: fields})
+
+    def update_many(self, updates):
+        """Apply {key: fields} for several entries with a single write"""
+        with self._lock:
+            for key, fields in updates.items():
+                self.entries.setdefault(key, {}).update(fields)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+    def items(self):
+        with self._lock:
+            return [(key, dict(entry)) for key, entry in self.entries.items()]
+
+
+class HotFolderService:
+    """Polls a folder, generating routers for new drawings (PDFs and scans) on a bounded worker pool"""
+
+    def __init__(self, watch_dir, output_dir=None, api_key="", model_name="gemini-3-flash-preview",
+                 workers=4, poll_interval=5.0, settle_seconds=2.0, default_quantity=None, backend=None,
+                 log=print):
+        self.watch_dir = watch_dir
+        self.output_dir = output_dir
+        self.api_key = api_key
+        self.model_name = model_name
+        self.poll_interval = poll_interval
+        # A file must be unchanged this long before we pick it up (still being copied otherwise)
+        self.settle_seconds = settle_seconds
+        self.default_quantity = default_quantity
+        self.backend = backend
+        self.log = log
+        checkpoint_dir = output_dir or watch_dir
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        self.checkpoint = Checkpoint(os.path.join(checkpoint_dir, CHECKPOINT_NAME))
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="router-hotfolder")
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _output_path(self, pdf_path, part_number=None):
+        stem = os.path.splitext(os.path.basename(pdf_path))[0]
+        if part_number:
+            stem += "_" + re.sub(r'[^A-Za-z0-9_-]', '_', part_number)
+        directory = self.output_dir or os.path.dirname(pdf_path)
+        return os.path.join(directory, f"{stem}_router.csv")
+
+    def pending(self):
+        """Drawings that are settled and not yet done (or failed fewer than MAX_ATTEMPTS times)"""
+        found = []
+        now = time.time()
+        for name in sorted(os.listdir(self.watch_dir)):
+            if not name.lower().endswith(DRAWING_EXTENSIONS):
+                continue
+            path = os.path.join(self.watch_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime < self.settle_seconds:
+                continue
+            entry = self.checkpoint.get(name)
+            # A re-saved drawing (new size or mtime) is processed again
+            same_file = entry.get('size') == stat.st_size and entry.get('mtime') == stat.st_mtime
+            if same_file and (entry.get('status') == 'done' or entry.get('attempts', 0) >= MAX_ATTEMPTS):
+                continue
+            with self._lock:
+                if name in self._in_flight:
+                    continue
+            found.append((name, path, stat, entry if same_file else {}))
+        return found
+
+    def process(self, name, path, stat, entry):
+        """Generate and write the router for one drawing, recording the outcome"""
+        attempts = entry.get('attempts', 0) + 1
+        try:
+            quantities = quantities_for(path) or ([self.default_quantity] if self.default_quantity else [])
+        except BadSidecar as e:
+            # Retrying won't fix the sidecar - skipped until the drawing is re-saved after the sidecar is fixed
+            self.checkpoint.update(name, size=stat.st_size, mtime=stat.st_mtime, status='skipped',
+                                   attempts=MAX_ATTEMPTS, error=str(e))
+            self.log(f"[skip] {name}: {e}")
+            return
+        if not quantities:
+            self.checkpoint.update(name, size=stat.st_size, mtime=stat.st_mtime, status='skipped',
+                                   attempts=MAX_ATTEMPTS, error="No quantity in filename or sidecar")
+            self.log(f"[skip] {name}: no quantity in filename or sidecar")
+            return
+
+        self.checkpoint.update(name, size=stat.st_size, mtime=stat.st_mtime, status='running', attempts=attempts)
+        t0 = time.monotonic()
+        with open(path, "rb") as pdf_file:
+            result = generate_package_routers(
+                pdf_file, quantities[-1], self.api_key, self.model_name,
+                session_id="hotfolder", backend=self.backend
+            )
+        elapsed = time.monotonic() - t0
+        parts = result['parts']
+
+        errors = [(part['part_number'], part['router_csv'].split('\n')[0])
+                  for part in parts if part['router_csv'].startswith('Error:')]
+        if errors:
+            # Nothing is written until every part has a router - the retry generates the package again
+            error = "; ".join(f"{part_number}: {text}" if part_number else text for part_number, text in errors)
+            self.checkpoint.update(name, status='failed', error=error, seconds=elapsed)
+            self.log(f"[fail] {name} (attempt {attempts}/{MAX_ATTEMPTS}): {error}")
+            return
+
+        outputs = []
+        for part in parts:
+            output_path = self._output_path(path, part['part_number'] if len(parts) > 1 else None)
+            export_router(part['router_csv'], quantities, output_path)
+            outputs.append(output_path)
+        output = outputs[0] if len(outputs) == 1 else outputs
+        self.checkpoint.update(name, status='done', output=output, quantities=quantities, error=None,
+                               seconds=elapsed, finished_at=datetime.now().isoformat(timespec='seconds'))
+        scan_note = f", scan {savings_text(result['scan'])}" if result.get('scan') else ""
+        package_note = f", {len(parts)} parts" if len(parts) > 1 else ""
+        self.log(f"[done] {name} -> {', '.join(outputs)} ({elapsed:.1f}s{package_note}{scan_note})")
+
+    def _run_one(self, name, path, stat, entry):
+        try:
+            self.process(name, path, stat, entry)
+        except Exception as e:
+            # Size, mtime and the attempt are recorded too, so MAX_ATTEMPTS still applies to this drawing
+            attempts = max(self.checkpoint.get(name).get('attempts', 0), entry.get('attempts', 0) + 1)
+            self.checkpoint.update(name, size=stat.st_size, mtime=stat.st_mtime, status='failed',
+                                   attempts=attempts, error=str(e))
+            self.log(f"[fail] {name}: {e}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(name)
+
+    def scan_once(self):
+        """Queue every pending drawing, never more than the pool can start plus one batch waiting"""
+        queued = 0
+        for name, path, stat, entry in self.pending():
+            with self._lock:
+                if len(self._in_flight) >= self.workers * 2:
+                    break
+                self._in_flight.add(name)
+            self._executor.submit(self._run_one, name, path, stat, entry)
+            queued += 1
+        return queued
+
+    def wait_idle(self):
+        while True:
+            with self._lock:
+                if not self._in_flight:
+                    return
+            time.sleep(0.1)
+
+    def run(self, once=False):
+        self.log(f"Watching {os.path.abspath(self.watch_dir)} with {self.workers} workers")
+        try:
+            while not self._stop.is_set():
+                self.scan_once()
+                if once:
+                    self.wait_idle()
+                    if not self.pending():
+                        break
+                    continue
+                self._stop.wait(self.poll_interval)
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def stop(self):
+        self._stop.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("watch_dir")
+    parser.add_argument("--output-dir", default=None, help="Write routers here instead of next to each PDF")
+    parser.add_argument("--model", default="gemini-3-flash-preview")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--poll", type=float, default=5.0, help="Seconds between folder scans")
+    parser.add_argument("--settle", type=float, default=2.0, help="Seconds a file must be unchanged before pickup")
+    parser.add_argument("--default-quantity", type=int, default=None)
+    parser.add_argument("--once", action="store_true", help="Process what's there now and exit")
+    parser.add_argument("--fake", action="store_true", help="Use the local fake model backend (no API calls)")
+    args = parser.parse_args()
+
+    api_key = os.environ.get("GEMINI_API_KEY", "")
+    if not api_key and not args.fake:
+        parser.error("Set GEMINI_API_KEY (or use --fake)")
+
+    service = HotFolderService(
+        args.watch_dir, output_dir=args.output_dir, api_key=api_key, model_name=args.model,
+        workers=args.workers, poll_interval=args.poll, settle_seconds=args.settle,
+        default_quantity=args.default_quantity, backend=FakeBackend(latency=0.5) if args.fake else None
+    )
+    try:
+        service.run(once=args.once)
+    except KeyboardInterrupt:
+        service.stop()
+
+
+if __name__ == "__main__":
+    main()
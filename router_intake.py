@@ -0,0 +1,195 @@
+"""
+MAC Router Generator - Drawing Intake
+Streams uploads into spooled temp files (hashed on the way in) under per-session and per-process byte budgets
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+
+from router_deps import load_pypdf
+
+# Uploads stay in RAM up to this size, then spill to a temp file on disk
+SPOOL_THRESHOLD = int(os.environ.get("ROUTER_SPOOL_THRESHOLD", str(8 * 1024 * 1024)))
+# Bytes of drawings one session / the whole process may hold at once
+SESSION_BYTE_BUDGET = int(os.environ.get("ROUTER_SESSION_BYTE_BUDGET", str(100 * 1024 * 1024)))
+PROCESS_BYTE_BUDGET = int(os.environ.get("ROUTER_PROCESS_BYTE_BUDGET", str(1024 * 1024 * 1024)))
+CHUNK_SIZE = 1024 * 1024
+
+
+# Leading bytes of each drawing format we accept
+_MAGIC_NUMBERS = [
+    (b'%PDF', 'application/pdf'),
+    (b'II*\x00', 'image/tiff'),
+    (b'MM\x00*', 'image/tiff'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+]
+
+
+def sniff_mime_type(head, default='application/pdf'):
+    """MIME type from a file's first bytes (PDF when unrecognised, as uploads always were)"""
+    for magic, mime_type in _MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return mime_type
+    return default
+
+
+class DrawingBudgetExceeded(Exception):
+    """An upload would push a session or the process over its byte budget"""
+
+
+class ByteBudget:
+    """Tracks bytes held per session and for the process, refusing reservations over either limit"""
+
+    def __init__(self, per_session=SESSION_BYTE_BUDGET, per_process=PROCESS_BYTE_BUDGET):
+        self.per_session = per_session
+        self.per_process = per_process
+        self._sessions = {}
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, session_id, nbytes):
+        with self._lock:
+            held = self._sessions.get(session_id, 0)
+            if held + nbytes > self.per_session:
+                raise DrawingBudgetExceeded(
+                    f"Drawing uploads for this session exceed {self.per_session // (1024 * 1024)} MB"
+                )
+            if self._total + nbytes > self.per_process:
+                raise DrawingBudgetExceeded(
+                    "The server is holding too many drawings right now - please try again shortly"
+                )
+            self._sessions[session_id] = held + nbytes
+            self._total += nbytes
+
+    def release(self, session_id, nbytes):
+        with self._lock:
+            held = self._sessions.get(session_id, 0) - nbytes
+            if held > 0:
+                self._sessions[session_id] = held
+            else:
+                self._sessions.pop(session_id, None)
+            self._total = max(self._total - nbytes, 0)
+
+    def held(self, session_id=None):
+        with self._lock:
+            if session_id is None:
+                return self._total
+            return self._sessions.get(session_id, 0)
+
+
+# Process-wide budget shared by every session
+drawing_budget = ByteBudget()
+
+
+class SpooledDrawing:
+    """One uploaded drawing: a single file handle shared by hashing, preprocessing and provider upload"""
+
+    def __init__(self, handle, size, digest, name, mime_type, session_id, budget):
+        self.handle = handle
+        self.size = size
+        self.digest = digest
+        self.name = name
+        self.mime_type = mime_type
+        # Report from router_preflight once the drawing has been checked
+        self.preflight = None
+        self.session_id = session_id
+        self.budget = budget
+        # Parsed once and shared by pre-flight, package splitting and near-duplicate matching
+        self._pdf = None
+        self._page_texts = None
+
+    def pdf(self):
+        """pypdf reader over the spooled file, opened on first use; None for scans or PDFs pypdf can't read"""
+        if self._pdf is None and self.mime_type == 'application/pdf':
+            pypdf = load_pypdf()
+            if pypdf is not None:
+                try:
+                    self._pdf = pypdf.PdfReader(self.reader())
+                except Exception:
+                    self._pdf = None
+        return self._pdf
+
+    def keep_pdf(self, reader):
+        """Adopt a reader already opened over this drawing's handle (pre-flight's) instead of parsing again"""
+        self._pdf = reader
+
+    def page_texts(self):
+        """Upper-cased text of every page, extracted once; [] when the drawing can't be read as a PDF"""
+        if self._page_texts is None:
+            texts = []
+            reader = self.pdf()
+            try:
+                if reader is not None and not reader.is_encrypted:
+                    texts = [(page.extract_text() or "").upper() for page in reader.pages]
+            except Exception:
+                texts = []
+            self._page_texts = texts
+        return self._page_texts
+
+    def reader(self):
+        """The underlying handle rewound to the start"""
+        self.handle.seek(0)
+        return self.handle
+
+    def read_bytes(self):
+        """Whole drawing as bytes - only for code paths that can't take a file handle"""
+        return self.reader().read()
+
+    def close(self):
+        self._pdf = None
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+            self.budget.release(self.session_id, self.size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def spool_drawing(source, session_id="default", name=None, mime_type=None, budget=None):
+    """
+    Copy an upload (file object or bytes) into a spooled temp file, hashing and budgeting chunk by chunk
+    The MIME type is taken from the first bytes unless given
+    """
+    budget = budget or drawing_budget
+    if isinstance(source, (bytes, bytearray)):
+        read = iter([bytes(source)]).__next__
+        name = name or "drawing.pdf"
+    else:
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        read = lambda: source.read(CHUNK_SIZE)
+        name = name or getattr(source, 'name', "drawing.pdf")
+
+    handle = tempfile.SpooledTemporaryFile(max_size=SPOOL_THRESHOLD, prefix="router_drawing_")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        while True:
+            try:
+                chunk = read()
+            except StopIteration:
+                break
+            if not chunk:
+                break
+            # Reserve before buffering so an oversize upload fails before it's fully copied
+            budget.reserve(session_id, len(chunk))
+            if not size and mime_type is None:
+                mime_type = sniff_mime_type(chunk)
+            size += len(chunk)
+            digest.update(chunk)
+            handle.write(chunk)
+    except BaseException:
+        handle.close()
+        budget.release(session_id, size)
+        raise
+
+    handle.seek(0)
+    return SpooledDrawing(handle, size, digest.hexdigest(), name, mime_type or 'application/pdf', session_id, budget)
@@ -0,0 +1,145 @@
+"""
+MAC Router Generator - Router Model
+Parse M2M router CSV into plain dicts and synthesize the full CSV back from them
+"""
+
+from datetime import datetime
+import csv
+
+OPERATIONS_HEADER = ("Op,Work Center,Operation Description,Operation Qty,Setup Hours,Production Hours,"
+                     "Move Hours,Sub-Contract Costs,Other Costs,Standard Cost/Operation")
+PART_INFO_HEADER = "Facility,Part Number,Rev,Description,Unit of Measure,Standard Process Qty,,,"
+EMPTY_ROW = ",,,,,,,,,"
+
+# Instruction used when an operation has none (same templates the knowledge base teaches)
+DEFAULT_INSTRUCTIONS = {
+    'SUB-PL': "PLATE, OUTSIDE VENDOR",
+    'SAW': "CUT MATERIAL TO LENGTH PER THE DWG.",
+    'CNC-L': "MACHINE PART PER THE DWG AND DEBURR.",
+    'CNC-M': "MACHINE PART PER THE DWG AND DEBURR.",
+    'WATERJT': "VETTED S.O. [DATE] CUT OUT PER THE DWG AND DEBURR.",
+    'BEND': "BEND PART TO THE DWG.",
+    'WELD': "VETTED S.O. [DATE] WELD PARTS PER DRAWING.",
+    'PAINT': "PAINT PARTS PER THE DWG.",
+}
+MISSING_INSTRUCTION = "INSTRUCTIONS NOT PROVIDED IN OUTPUT"
+
+
+def csv_field(text):
+    """Quote a field if it contains a comma or quote so it stays in one cell"""
+    text = str(text)
+    if ',' in text or '"' in text:
+        return '"' + text.replace('"', '""') + '"'
+    return text
+
+
+def default_instruction(work_center):
+    """Default instruction text for a work center"""
+    return DEFAULT_INSTRUCTIONS.get(work_center.strip(), MISSING_INSTRUCTION)
+
+
+def _float(value):
+    try:
+        return float(str(value).strip())
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def parse_router(csv_text):
+    """
+    Parse a cleaned router CSV into
+    {'part_number', 'rev', 'description', 'quantity', 'date', 'time', 'operations': [...]}
+    where each operation is {'op', 'work_center', 'description', 'setup_hours', 'run_hours',
+    'move_hours', 'instruction'}
+    """
+    rows = list(csv.reader(csv_text.strip().split('\n')))
+    router = {
+        'part_number': '',
+        'rev': '0',
+        'description': '',
+        'quantity': 0,
+        'date': '',
+        'time': '',
+        'operations': [],
+    }
+    if len(rows) > 1 and len(rows[1]) > 9:
+        router['date'] = rows[1][9]
+    if len(rows) > 2 and len(rows[2]) > 9:
+        router['time'] = rows[2][9]
+
+    operations = router['operations']
+    last_op_index = -2
+    for i, parts in enumerate(rows):
+        if not parts:
+            continue
+        first = parts[0].strip()
+        if first == 'Facility' and i + 1 < len(rows):
+            info = rows[i + 1] + [''] * 6
+            router['part_number'] = info[1].strip()
+            router['rev'] = info[2].strip() or '0'
+            router['description'] = info[3].strip()
+            router['quantity'] = int(round(_float(info[5])))
+        elif first.isdigit():
+            fields = parts + [''] * 10
+            operations.append({
+                'op': int(first),
+                'work_center': fields[1].strip(),
+                'description': fields[2].strip(),
+                'setup_hours': _float(fields[4]),
+                'run_hours': _float(fields[5]),
+                'move_hours': _float(fields[6]),
+                'instruction': '',
+            })
+            last_op_index = i
+        elif i == last_op_index + 1 and first == '' and len(parts) > 1:
+            # Instruction row directly below its operation
+            operations[-1]['instruction'] = parts[1].strip()
+    return router
+
+
+def router_totals(operations, quantity):
+    """(total setup, total run, setup per unit, run per unit) computed from the operations"""
+    total_setup = sum(op['setup_hours'] for op in operations)
+    total_run = sum(op['run_hours'] for op in operations)
+    per_unit_setup = total_setup / quantity if quantity > 0 else 0.0
+    per_unit_run = total_run / quantity if quantity > 0 else 0.0
+    return total_setup, total_run, per_unit_setup, per_unit_run
+
+
+def synthesize_router_csv(router, now=None, totals=None):
+    """Build the full M2M Standard Routing Summary CSV from a router dict (totals computed unless given)"""
+    now = now or datetime.now()
+    quantity = router['quantity']
+    date_text = router.get('date') or f"Date : {now.strftime('%m/%d/%Y')}"
+    time_text = router.get('time') or f"Time : {now.strftime('%I:%M:%S %p')} EST"
+
+    lines = [
+        "MAC,,,,,Standard Routing Summary,,,,,Page : 1 of 1",
+        f",,,,,,,,,{date_text}",
+        f",,,,,,,,,{time_text}",
+        EMPTY_ROW,
+        PART_INFO_HEADER,
+        f"Default,{csv_field(router['part_number'])},{csv_field(router.get('rev') or '0')},"
+        f"{csv_field(router['description'])},EA,{quantity}.00000,,,",
+        EMPTY_ROW,
+        EMPTY_ROW,
+        OPERATIONS_HEADER,
+    ]
+    for op in router['operations']:
+        lines.append(
+            f"{op['op']},{csv_field(op['work_center'])},{csv_field(op['description'])},{quantity}.0000,"
+            f"{op['setup_hours']:.2f},{op['run_hours']:.2f},{op.get('move_hours', 0.0):.2f},0.00,0.00,0.00"
+        )
+        lines.append(f",{csv_field(op.get('instruction') or '')},,,,,,,,,")
+        lines.append(EMPTY_ROW)
+
+    total_setup, total_run, per_unit_setup, per_unit_run = totals or router_totals(router['operations'], quantity)
+    lines += [
+        f"Totals,,,,{total_setup:.2f},{total_run:.2f},0.00,0.00,0.00,0.00",
+        f"Totals per Unit,,,,{per_unit_setup:.2f},{per_unit_run:.2f},0.00,0.00,0.00,0.00",
+        EMPTY_ROW,
+        ",,,,,,End of Report,,,",
+        EMPTY_ROW,
+        ",,,,,,This report was requested by MAC ROUTER GENERATOR,,,",
+    ]
+    return '\n'.join(lines)
@@ -0,0 +1,204 @@
+"""
+MAC Router Generator - Drawing Packages
+Splits a multi-part PDF package at title-block part number changes and generates each part's router in parallel
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import io
+import os
+import re
+import tempfile
+import time
+import zipfile
+
+from router_deps import load_pypdf
+from router_intake import DrawingBudgetExceeded, SpooledDrawing, spool_drawing
+from router_pipeline import generate_router_with_gemini
+
+# Parts of one package generating at once
+PACKAGE_WORKERS = int(os.environ.get("ROUTER_PACKAGE_WORKERS", "4"))
+
+# "PART NO: X", "P/N X", "DWG NO. X" in the title block
+_LABELLED_PART_NUMBER = re.compile(
+    r'\b(?:PART\s*(?:NO|NUMBER|#)|P/N|DWG\s*(?:NO|NUMBER|#)|DRAWING\s*(?:NO|NUMBER))\.?\s*[:#]?\s*'
+    r'([A-Z0-9][A-Z0-9._/-]{3,})',
+    re.IGNORECASE
+)
+# Title-block headings that can sit right after a part-number label in extracted text
+_LABEL_WORDS = frozenset((
+    'DESCRIPTION', 'TITLE', 'REV', 'REVISION', 'MATERIAL', 'QTY', 'QUANTITY', 'SCALE', 'SHEET', 'SIZE',
+    'DATE', 'DRAWN', 'CHECKED', 'APPROVED', 'FINISH', 'NUMBER', 'PART', 'DWG', 'DRAWING', 'NAME', 'NONE', 'N/A',
+))
+# MAC numbering, e.g. Z110001B045
+_MAC_PART_NUMBER = re.compile(r'\b[A-Z]\d{6}[A-Z]\d{3}\b')
+
+
+_package_pool = ThreadPoolExecutor(max_workers=PACKAGE_WORKERS, thread_name_prefix="router-package")
+
+
+def page_part_number(text):
+    """Part number from a page's extracted text, or None for continuation sheets / unreadable pages"""
+    if not text:
+        return None
+    for match in _LABELLED_PART_NUMBER.finditer(text):
+        part_number = match.group(1).upper().rstrip('.')
+        # A label followed by another heading ("PART NUMBER  DESCRIPTION") captured the heading, not a number
+        if part_number not in _LABEL_WORDS and any(c.isdigit() for c in part_number):
+            return part_number
+    match = _MAC_PART_NUMBER.search(text)
+    return match.group(0) if match else None
+
+
+def group_pages(page_numbers):
+    """
+    Group consecutive pages by part number: [(part_number, [page indexes]), ...]
+    Pages with no part number stay with the part before them (sheet 2 of 3 etc.)
+    """
+    groups = []
+    for index, part_number in enumerate(page_numbers):
+        if groups and (part_number is None or part_number == groups[-1][0]):
+            groups[-1][1].append(index)
+        elif groups and groups[-1][0] is None:
+            # Leading pages with no number belong to the first identified part
+            groups[-1] = (part_number, groups[-1][1] + [index])
+        else:
+            groups.append((part_number, [index]))
+    return groups
+
+
+def _package_groups(drawing):
+    """(pypdf reader, page groups) for a spooled drawing; (None, []) when it can't be split"""
+    # The drawing's own reader and page text - parsed once, shared with pre-flight and similarity matching
+    texts = drawing.page_texts()
+    if len(texts) < 2:
+        # A single sheet, or a PDF pypdf can't parse - it goes to the model whole
+        return None, []
+    return drawing.pdf(), group_pages([page_part_number(text) for text in texts])
+
+
+def is_drawing_package(drawing):
+    """True when a spooled drawing holds more than one part"""
+    return len(_package_groups(drawing)[1]) > 1
+
+
+def split_drawing_package(drawing):
+    """
+    Split a spooled drawing into per-part PDFs: [{'part_number', 'pages', 'drawing'}, ...]
+    Each part is spooled as it's written, against the same session byte budget; the caller closes them
+    Returns [] when the drawing is a single part (or can't be split), so callers use it whole
+    """
+    pypdf = load_pypdf()
+    reader, groups = _package_groups(drawing)
+    if len(groups) < 2:
+        return []
+
+    parts = []
+    try:
+        for part_number, indexes in groups:
+            part_number = part_number or f"PART {len(parts) + 1}"
+            writer = pypdf.PdfWriter()
+            for index in indexes:
+                writer.add_page(reader.pages[index])
+            # Written to disk and streamed into the spool - never more than one part's pages in memory
+            with tempfile.TemporaryFile(prefix="router_part_") as buffer:
+                writer.write(buffer)
+                part_drawing = spool_drawing(buffer, drawing.session_id, name=f"{part_number}.pdf",
+                                             budget=drawing.budget)
+            parts.append({
+                'part_number': part_number,
+                'pages': [index + 1 for index in indexes],
+                'drawing': part_drawing,
+            })
+    except BaseException:
+        for part in parts:
+            part['drawing'].close()
+        raise
+    return parts
+
+
+def _single_result(router_csv, split_seconds, elapsed, scan=None):
+    return {
+        'parts': [{'part_number': None, 'pages': [], 'router_csv': router_csv,
+                   'queued_seconds': 0.0, 'seconds': elapsed - split_seconds}],
+        'split_seconds': split_seconds,
+        'total_seconds': elapsed,
+        'scan': scan,
+    }
+
+
+def generate_package_routers(pdf_file, quantity, api_key, model_name="gemini-3-flash-preview",
+                             hedge_model=None, hedge_policy=None, session_id="default", backend=None):
+    """
+    Generate one router per part of a drawing package, parts in parallel
+    Returns {'parts': [...], 'split_seconds', 'total_seconds', 'scan'}; a single-part drawing gives one entry
+    ('scan' is the preprocessing report when the drawing was an image scan)
+    """
+    t0 = time.perf_counter()
+    # A drawing the caller already spooled (and pre-flighted) is used as is
+    if isinstance(pdf_file, SpooledDrawing):
+        drawing = pdf_file
+    else:
+        try:
+            drawing = spool_drawing(pdf_file, session_id, name=getattr(pdf_file, 'name', None))
+        except DrawingBudgetExceeded as e:
+            return _single_result(f"Error: {e}", 0.0, time.perf_counter() - t0)
+    with drawing:
+        try:
+            parts = split_drawing_package(drawing)
+        except DrawingBudgetExceeded as e:
+            return _single_result(f"Error: {e}", time.perf_counter() - t0, time.perf_counter() - t0)
+        split_seconds = time.perf_counter() - t0
+        if not parts:
+            report = {}
+            # Handed over as the spooled drawing itself - no second copy counted against the byte budget
+            router_csv = generate_router_with_gemini(
+                drawing, quantity, api_key, model_name,
+                hedge_model=hedge_model, hedge_policy=hedge_policy, session_id=session_id, backend=backend,
+                report=report
+            )
+            return _single_result(router_csv, split_seconds, time.perf_counter() - t0, report.get('scan'))
+
+    def run_part(part, submitted):
+        started = time.perf_counter()
+        part['queued_seconds'] = started - submitted
+        # The pipeline takes the part's spool as is and closes it when done
+        part['router_csv'] = generate_router_with_gemini(
+            part.pop('drawing'), quantity, api_key, model_name,
+            hedge_model=hedge_model, hedge_policy=hedge_policy, session_id=session_id, backend=backend
+        )
+        part['seconds'] = time.perf_counter() - started
+        return part
+
+    futures = [_package_pool.submit(run_part, part, time.perf_counter()) for part in parts]
+    return {
+        'parts': [future.result() for future in futures],
+        'split_seconds': split_seconds,
+        'total_seconds': time.perf_counter() - t0,
+        'scan': None,
+    }
+
+
+def package_timing_rows(result):
+    """Per-part timing breakdown for display"""
+    rows = []
+    for part in result['parts']:
+        rows.append({
+            'Part Number': part['part_number'] or "",
+            'Pages': ", ".join(str(p) for p in part['pages']),
+            'Queued (s)': round(part['queued_seconds'], 2),
+            'Generation (s)': round(part['seconds'], 2),
+            'Status': "Error" if part['router_csv'].startswith('Error:') else "OK",
+        })
+    return rows
+
+
+def package_routers_to_zip(parts):
+    """One CSV per part in a zip archive"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for n, part in enumerate(parts):
+            if part['router_csv'].startswith('Error:'):
+                continue
+            name = re.sub(r'[^A-Za-z0-9_-]', '_', part['part_number'] or f"part_{n + 1}")
+            archive.writestr(f"router_{name}.csv", part['router_csv'])
+    return buffer.getvalue()
@@ -0,0 +1,890 @@
+"""
+MAC Router Generator - Router Generation Pipeline
+Prompt construction, Gemini calls and CSV cleanup shared by the app
+"""
+
+from datetime import datetime
+import json
+import os
+import re
+
+from router_breaker import CircuitOpen, get_breaker, route_models
+from router_clients import ClientPool
+from router_hedging import HedgeCancelled, run_hedged
+from router_model import csv_field, default_instruction, synthesize_router_csv
+from router_profiling import profile_request
+from router_ratelimit import get_rate_limiter
+from router_replay import backend_for_mode
+from router_singleflight import generation_flights
+from router_intake import SpooledDrawing, spool_drawing
+from router_preflight import PreflightRejected, preflight_drawing
+from router_scans import preprocess_drawing, scan_stats
+from router_validation import (REPAIR_ATTEMPTS, apply_repair, build_repair_prompt, describe_defects,
+                               find_defects, payload_from_csv)
+
+# compact: model returns a small JSON payload and the M2M CSV is synthesized locally
+# csv: model writes the whole M2M CSV (the original prompt)
+OUTPUT_FORMAT = os.environ.get("ROUTER_OUTPUT_FORMAT", "compact").strip().lower()
+
+# Bump whenever a prompt or the knowledge base changes so recordings from different prompts don't mix
+PROMPT_VERSIONS = {'csv': "1", 'compact': "2"}
+PROMPT_VERSION = PROMPT_VERSIONS.get(OUTPUT_FORMAT, PROMPT_VERSIONS['csv'])
+
+# Seconds to wait on a single generate_content call
+REQUEST_TIMEOUT = 60
+
+# Everything the compact output carries - headers, op numbers, run hours and totals are added locally
+ROUTER_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "part_number": {"type": "STRING"},
+        "rev": {"type": "STRING"},
+        "description": {"type": "STRING"},
+        "operations": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "work_center": {"type": "STRING"},
+                    "description": {"type": "STRING"},
+                    "setup_hours": {"type": "NUMBER"},
+                    "minutes_per_piece": {"type": "NUMBER"},
+                    "instruction": {"type": "STRING"},
+                },
+                "required": ["work_center", "description", "setup_hours", "minutes_per_piece", "instruction"],
+            },
+        },
+    },
+    "required": ["part_number", "description", "operations"],
+}
+
+CSV_GENERATION_CONFIG = {
+    "temperature": 0.1,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 8192,
+}
+
+# A few hundred tokens of JSON instead of a full report
+COMPACT_GENERATION_CONFIG = {
+    "temperature": 0.1,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 2048,
+    "response_mime_type": "application/json",
+    "response_schema": ROUTER_SCHEMA,
+}
+
+GENERATION_CONFIG = COMPACT_GENERATION_CONFIG if OUTPUT_FORMAT == "compact" else CSV_GENERATION_CONFIG
+
+# Repair answers carry only the corrected operations, each with the index it replaces
+REPAIR_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "part_number": {"type": "STRING"},
+        "operations": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": dict(ROUTER_SCHEMA["properties"]["operations"]["items"]["properties"],
+                                   index={"type": "INTEGER"}),
+                "required": ["index"],
+            },
+        },
+    },
+    "required": ["operations"],
+}
+
+# Used for repair calls in both output formats - the repair prompt always asks for JSON
+REPAIR_GENERATION_CONFIG = dict(COMPACT_GENERATION_CONFIG, response_schema=REPAIR_SCHEMA)
+
+# Models offered in the app (first is the default) and measured by the golden-set benchmark
+GEMINI_MODELS = [
+    "gemini-3-flash-preview",
+    "gemini-3-pro",
+    "gemini-2.0-flash-exp",
+    "gemini-2.0-flash",
+    "gemini-1.5-pro",
+    "gemini-1.5-flash",
+]
+
+# Gemini clients shared by every session and rerun in this process
+client_pool = ClientPool(GENERATION_CONFIG)
+
+
+# ==========================================
+# Knowledge Base
+# ==========================================
+KNOWLEDGE_BASE = """
+⚠️ CRITICAL: MOST MAC PARTS USE ONLY 2 OPERATIONS ⚠️
+Review the 14 real examples below - notice that simple parts rarely need more than 2 operations!
+
+REAL ROUTER EXAMPLES FROM THE SHOP:
+
+MACHINED PARTS (Simple Lathe - THE BASELINE):
+1. Z110001B045 - Sleeve Wiping Cap (115 pcs) - 2 OPERATIONS
+   Op 10: SAW - Setup: 0.25 hrs, Run: 0.03 hrs (0.5 min/pc)
+   Op 20: CNC-L - Setup: 2.00 hrs, Run: 3.83 hrs (2 min/pc)
+   Instruction: "CUT MATERIAL TO 36" / "MACHINE PART PER THE DWG AND DEBURR."
+
+2. Z110001B046 - Sleeve Wiping Tube (23 pcs) - 2 OPERATIONS
+   Op 10: SAW - Setup: 0.25 hrs, Run: 0.77 hrs (2 min/pc)
+   Op 20: CNC-L - Setup: 2.00 hrs, Run: 0.77 hrs (2 min/pc)
+   Instruction: "CUT MATERIAL TO LENGTH PER THE DWG." / "MACHINE PART PER THE DWG AND DEBURR."
+
+3. Z110001B037 - Sleeve Disc (550 pcs) - 3 OPERATIONS (Complex with plating)
+   Op 10: SAW - Setup: 0.25 hrs, Run: 4.58 hrs (0.5 min/pc)
+   Op 20: CNC-L - Setup: 2.00 hrs, Run: 18.33 hrs (2 min/pc)
+   Op 30: SUB-PL - "SUB PLATING" - Setup: 0.00 hrs, Run: 0.00 hrs
+   Instruction: "CUT MATERIAL TO LENGTH PER THE DWG." / "MACHINE PART PER THE DWG AND DEBURR." / "PLATE, OUTSIDE VENDOR, ZINC PLATE"
+
+SHEET METAL (Simple - 2 Operations):
+4. Z005002A019 - Position Holder Bracket (30 pcs) - 2 OPERATIONS
+   Op 10: WATERJT - Setup: 0.50 hrs, Run: 1.50 hrs (3 min/pc)
+   Op 20: BEND - Setup: 0.50 hrs, Run: 0.38 hrs (0.76 min/pc)
+   Instruction: "VETTED S.O. 04/08/25 CUT OUT PER THE DWG AND DEBURR." / "BEND PART TO THE DWG."
+
+5. Z005002C026 - Side Door (10 pcs) - 2 OPERATIONS
+   Op 10: WATERJT - Setup: 0.50 hrs, Run: 2.00 hrs (12 min/pc - larger part)
+   Op 20: BEND - Setup: 2.00 hrs (complex bends), Run: 0.50 hrs (3 min/pc)
+
+6. Z110001D007 - Clamp Swivel (50 pcs) - 2 OPERATIONS
+   Op 10: WATERJT - Setup: 0.50 hrs, Run: 12.50 hrs (15 min/pc - thick stainless)
+   Op 20: CNC-M - Setup: 2.00 hrs, Run: 6.25 hrs (7.5 min/pc)
+
+7. Z110001D005 - Latch Receiver (30 pcs) - 2 OPERATIONS
+   Op 10: WATERJT - Setup: 0.50 hrs, Run: 6.00 hrs (12 min/pc)
+   Op 20: CNC-M - Setup: 1.50 hrs, Run: 2.00 hrs (4 min/pc)
+
+8. TS01000B072-1 - Slide Plate (40 pcs) - 2 OPERATIONS
+   Op 10: WATERJT - Setup: 0.50 hrs, Run: 3.33 hrs (5 min/pc)
+   Op 20: CNC-M - Setup: 1.50 hrs, Run: 3.33 hrs (5 min/pc)
+
+SHEET METAL (Single Operation):
+9. Z005002A017 - Lifting Plate (20 pcs) - 1 OPERATION ONLY
+   Op 10: WATERJT - Setup: 0.50 hrs, Run: 1.00 hrs (3 min/pc)
+   Instruction: "VETTED S.O. 04/08/25 CUT OUT PER THE DWG AND DEBURR."
+
+10. Z110001B034 - Gasket (200 pcs) - 1 OPERATION ONLY
+    Op 10: WATERJT - Setup: 0.50 hrs, Run: 10.00 hrs (3 min/pc)
+
+WELDMENTS (Simple - 2 Operations):
+11. TS01000B086 - Spray Manifold Weldment (12 pcs) - 2 OPERATIONS
+    Op 10: WELD - Setup: 3.00 hrs, Run: 4.00 hrs (20 min/pc)
+    Op 20: SUB-PL - "SUB PLATING" - Setup: 0.00 hrs, Run: 0.00 hrs
+    Instruction: "VETTED S.O. [DATE] WELD PARTS PER DRAWING." / "PLATE, OUTSIDE VENDOR, ZINC PLATE"
+
+12. TS01000C047 - Control Panel Door (6 pcs) - 2 OPERATIONS
+    Op 10: WELD - Setup: 1.00 hrs, Run: 2.00 hrs (20 min/pc)
+    Op 20: PAINT - Setup: 0.50 hrs, Run: 0.00 hrs, Move: 4.00 hrs - PAINT PARTS PER THE DWG.
+
+COMPLEX PARTS (3+ Operations - RARE):
+13. Z110001A030 - Contact Plate (200 pcs) - 3 OPERATIONS
+    Op 10: WATERJT - Setup: 0.50 hrs, Run: 13.33 hrs (4 min/pc)
+    Op 20: ASSY-PP - "ASSY POWER PROP." - Setup: 0.50 hrs, Run: 6.67 hrs (2 min/pc)
+    Op 30: SUB-PL - "SUB PLATING" - Setup: 0.00 hrs, Run: 0.00 hrs
+    Instruction: "VETTED S.O. [DATE] CUT OUT PER THE DWG AND DEBURR." / "TAP HOLES PER THE DWG." / "PLATE, OUTSIDE VENDOR, TIN PLATE"
+
+14. 2651C2858-1 - Complex Weldment Assembly (1 pc) - 4 OPERATIONS
+    Op 10: WELD - Setup: 3.00 hrs, Run: 5.00 hrs (5 hrs for 1 pc)
+    Op 20: CNC-M - Setup: 2.00 hrs, Run: 2.00 hrs (2 hrs for 1 pc)
+    Op 30: WELD - Setup: 3.00 hrs, Run: 3.00 hrs (3 hrs for 1 pc)
+    Op 40: PAINT - Setup: 1.00 hrs, Run: 0.00 hrs, Move: 4.00 hrs
+
+SETUP TIMES (Standard - Use These Exactly):
+- SAW: 0.25 hrs (ALWAYS)
+- WATERJT: 0.50 hrs (ALWAYS)
+- BEND: 0.50 hrs (simple), 2.00 hrs (complex)
+- CNC-L: 2.00 hrs (ALWAYS 2.00, NEVER 1.00)
+- CNC-M: 1.50-2.00 hrs
+- WELD: 0.50-3.00 hrs
+- PAINT: 0.50-1.00 hrs + 4.00 hrs move time (dry time)
+- SUB-PL: 0.00 hrs (outside vendor)
+
+RUN TIMES PER PIECE (Typical):
+- SAW: 0.5-2 min/piece
+- WATERJET (simple flat): 3-5 min/piece
+- WATERJET (complex/thick): 10-15 min/piece
+- BEND (simple): 0.5-1 min/piece
+- BEND (complex): 2-3 min/piece
+- CNC-L (simple turning): 2-3 min/piece ← IF YOU GO OVER 5 MIN, YOU'RE WRONG!
+- CNC-M (drilling/tapping): 2-7.5 min/piece
+- WELD: 5-40 min/piece
+
+INSTRUCTIONS (Copy These Formats Exactly):
+- Waterjet: "VETTED S.O. [DATE] CUT OUT PER THE DWG AND DEBURR."
+- Saw: "CUT MATERIAL TO LENGTH PER THE DWG."
+- CNC-L: "MACHINE PART PER THE DWG AND DEBURR."
+- CNC-M: "MACHINE PART PER THE DWG AND DEBURR."
+- Bend: "BEND PART TO THE DWG."
+- Weld: "VETTED S.O. [DATE] WELD PARTS PER DRAWING."
+- Paint: "PAINT PARTS PER THE DWG."
+- Plating (SUB-PL): Operation Description = "SUB PLATING", Instruction = "PLATE, OUTSIDE VENDOR, [TYPE] PLATE" (e.g., ZINC PLATE, TIN PLATE)
+
+HOW TO SELECT OPERATIONS:
+1. **Simple lathe part?** → SAW + CNC-L (2 operations) - See examples Z110001B045, Z110001B046
+2. **Simple sheet metal?** → WATERJET + BEND (2 operations) - See example Z005002A019
+3. **Flat waterjet only?** → WATERJET (1 operation) - See examples Z005002A017, Z110001B034
+4. **Complex machining?** → WATERJET + CNC-M (2 operations) - See example Z110001D007
+5. **DO NOT add unnecessary operations!** Most parts need 2 or fewer operations.
+"""
+
+# ==========================================
+# Prompt
+# ==========================================
+def _prompt_rules(quantity):
+    """Knowledge base and estimating rules shared by both output formats"""
+    return f"""You are a manufacturing engineer creating a router for Made2Manage ERP.
+
+{KNOWLEDGE_BASE}
+
+TASK: Analyze this drawing and generate a router for {quantity} pieces.
+
+CRITICAL RULES:
+1. **MATCH THE EXAMPLES - MOST PARTS USE ONLY 2 OPERATIONS**
+   - Simple lathe: 2 ops (SAW + CNC-L) - see examples Z110001B045, Z110001B046
+   - Simple sheet metal: 2 ops (WATERJET + BEND) - see example Z005002A019
+   - Only complex weldments or very intricate parts need 3+ operations
+   - DO NOT add extra machining steps unless the drawing clearly shows complex features
+2. CNC-L setup = 2.00 hrs ALWAYS (not 1.00)
+3. Simple lathe parts = 2-3 min/piece MAX (if >5 min YOU'RE WRONG)
+4. Use examples as baseline for times - reference the most similar example in your reasoning
+5. Match instruction templates exactly
+6. DESCRIPTION FORMATTING: Always put the complete description in the Description field (e.g., "SLEEVE WIPING CAP" as one entry, not split)
+"""
+
+
+def _compact_router_prompt(quantity):
+    """Prompt asking only for the structured payload (enforced by ROUTER_SCHEMA)"""
+    return _prompt_rules(quantity) + f"""
+OUTPUT: Return ONLY a JSON object. The app builds the M2M report, op numbers, run hours and totals itself.
+{{
+  "part_number": "[PART# from the drawing title block]",
+  "rev": "[revision from the title block, 0 if none]",
+  "description": "[COMPLETE DESCRIPTION as one string, e.g. SLEEVE WIPING CAP]",
+  "operations": [
+    {{"work_center": "SAW", "description": "CUT TO LENGTH", "setup_hours": 0.25, "minutes_per_piece": 0.5,
+      "instruction": "CUT MATERIAL TO LENGTH PER THE DWG."}},
+    {{"work_center": "CNC-L", "description": "MACHINE PART", "setup_hours": 2.00, "minutes_per_piece": 2.0,
+      "instruction": "MACHINE PART PER THE DWG AND DEBURR."}}
+  ]
+}}
+
+Remember:
+- List operations in routing order - they are numbered 10, 20, 30... for you
+- work_center is one of: SAW, WATERJT, CNC-L, CNC-M, BEND, WELD, PAINT, SUB-PL
+- minutes_per_piece is run time per piece; run hours for {quantity} pieces are calculated for you
+- Match the instruction templates from the examples exactly
+- FOR SUB-PL OPERATIONS: description "SUB PLATING", setup 0, minutes 0, and the full instruction
+  "PLATE, OUTSIDE VENDOR, ZINC PLATE" (or TIN PLATE) - not just "PLATE"
+"""
+
+
+def build_router_prompt(quantity, output_format=None):
+    """Build the router prompt for the requested quantity"""
+    if (output_format or OUTPUT_FORMAT) == "compact":
+        return _compact_router_prompt(quantity)
+    return _prompt_rules(quantity) + f"""
+OUTPUT: Generate M2M Standard Routing Summary in CSV format.
+
+⚠️ CRITICAL CSV OUTPUT RULES - READ CAREFULLY:
+- Output PURE CSV TEXT ONLY - NO CODE, NO HTML, NO XML, NO FORMATTING
+- DO NOT include ANY HTML/XML tags like <td>, <tr>, <strong>, <div>, etc.
+- DO NOT include ANY code operators like <, >, ==, !=, &&, ||
+- DO NOT include ANY programming syntax or logic
+- Each field must contain ONLY: letters, numbers, spaces, periods, dollar signs, hyphens
+- Use ONLY commas to separate fields
+- The last column should contain ONLY "0.00" - nothing else
+- If you accidentally generate code or HTML, the output will be REJECTED
+
+CSV STRUCTURE (output EXACTLY this format):
+Line 1: MAC,,,,,Standard Routing Summary,,,,,Page : 1 of 1
+Line 2: ,,,,,,,,,Date : {datetime.now().strftime('%m/%d/%Y')}
+Line 3: ,,,,,,,,,Time : {datetime.now().strftime('%I:%M:%S %p')} EST
+Line 4: ,,,,,,,,,
+Line 5: Facility,Part Number,Rev,Description,Unit of Measure,Standard Process Qty,,,
+Line 6: Default,[PART# from drawing],0,[COMPLETE DESCRIPTION - combine all description words into single field separated by spaces],EA,{quantity}.00000,,,
+Line 7-8: Empty rows (just commas)
+Line 9: Op,Work Center,Operation Description,Operation Qty,Setup Hours,Production Hours,Move Hours,Sub-Contract Costs,Other Costs,Standard Cost/Operation
+Then for each operation (2 lines):
+  Data row: [OP#],[CODE],[DESC],{quantity}.0000,[SETUP],[RUN],0.00,0.00,0.00,0.00
+  Instruction row: ,[INSTRUCTION],,,,,,,,,
+  Empty row: ,,,,,,,,,
+
+  IMPORTANT FOR SUB-PL OPERATIONS:
+  - Work Center: SUB-PL
+  - Operation Description: "SUB PLATING" (not "PLATE TIN" or "PLATE OUTSIDE VENDOR")
+  - Instruction row (CRITICAL - must be complete): "PLATE, OUTSIDE VENDOR, ZINC PLATE" or "PLATE, OUTSIDE VENDOR, TIN PLATE"
+  - DO NOT abbreviate the instruction - include "PLATE, OUTSIDE VENDOR, [TYPE] PLATE" in full
+After all operations:
+  Totals,,,,[TOTAL SETUP],[TOTAL RUN],0.00,0.00,0.00,0.00
+  Totals per Unit,,,,[SETUP÷{quantity}],[RUN÷{quantity}],0.00,0.00,0.00,0.00
+
+  ⚠️ CRITICAL: TOTALS MUST BE CALCULATED CORRECTLY!
+  - Add up ALL Setup Hours from all operations for [TOTAL SETUP]
+  - Add up ALL Production Hours from all operations for [TOTAL RUN]
+  - Divide totals by quantity for "Totals per Unit"
+  - DO NOT put 0.00 in Totals unless all operations actually have 0 hours!
+
+  Empty rows
+  ,,,,,,End of Report,,,,,
+  Empty row
+  ,,,,,,This report was requested by MAC ROUTER GENERATOR,,,,,
+
+EXAMPLE OPERATION WITH INSTRUCTION (copy this format EXACTLY):
+10,SAW,CUT TO LENGTH,1.0000,0.25,0.01,0.00,0.00,0.00,0.00
+,CUT MATERIAL TO LENGTH PER THE DWG.,,,,,,,,,
+,,,,,,,,,
+20,CNC-L,MACHINE PART,1.0000,2.00,0.05,0.00,0.00,0.00,0.00
+,MACHINE PART PER THE DWG AND DEBURR.,,,,,,,,,
+,,,,,,,,,
+30,SUB-PL,SUB PLATING,1.0000,0.00,0.00,0.00,0.00,0.00,0.00
+,PLATE, OUTSIDE VENDOR, ZINC PLATE,,,,,,,,,
+,,,,,,,,,
+
+EXAMPLE TOTALS ROWS (copy this format EXACTLY - count the commas!):
+Totals,,,,2.25,0.06,0.00,0.00,0.00,0.00
+Totals per Unit,,,,0.03,0.07,0.00,0.00,0.00,0.00
+
+CRITICAL: Both Totals rows MUST have the same number of commas and columns!
+- Start with "Totals" or "Totals per Unit"
+- Then 3 empty fields (,,,)
+- Then 6 numeric values separated by commas
+
+⚠️ CRITICAL STRUCTURE RULES:
+1. EVERY operation row MUST be followed by an instruction row (starts with comma)
+2. EVERY instruction row MUST be followed by an empty row
+3. Pattern: Operation → Instruction → Empty Row → (repeat) → Totals
+
+Remember:
+- Read part number and description from the drawing title block
+- IMPORTANT: The Description field must contain the COMPLETE description as a single entry (e.g., "SLEEVE WIPING CAP" not split across fields)
+- Unit of Measure must be "EA"
+- Standard Process Qty must be the quantity value {quantity}.00000
+- Calculate run hours: (minutes per piece × {quantity}) ÷ 60
+- Keep operations simple and realistic
+- FOR SUB-PL OPERATIONS: Use "SUB PLATING" in description, and full instruction "PLATE, OUTSIDE VENDOR, ZINC PLATE" (not just "PLATE")
+- Output ONLY the CSV (no markdown, no code blocks, no explanation, NO HTML TAGS)
+"""
+
+# ==========================================
+# CSV Cleanup
+# ==========================================
+def clean_router_csv(raw_text, quantity):
+    """Clean raw Gemini output into a well-formed M2M router CSV"""
+    csv_text = raw_text.strip()
+    if '```' in csv_text:
+        csv_text = csv_text.split('```csv')[-1].split('```')[0].strip()
+
+    # AGGRESSIVE CLEANING - Remove any malformed HTML/XML/code
+    # Step 1: Remove HTML/XML tags
+    csv_text = re.sub(r'<[^>]+>', '', csv_text)
+
+    # Step 2: Remove any lines that contain code-like patterns (but keep valid CSV)
+    lines = csv_text.split('\n')
+    cleaned_lines = []
+    for line in lines:
+        # Skip lines with obvious code patterns: <, >, ==, !=, <=, >=, etc. in operations column
+        # But allow normal CSV commas and decimals
+        if not any([
+            ' < ' in line and ' > ' in line,  # Code comparison operators
+            '<td' in line.lower(),
+            '<tr' in line.lower(),
+            '</td' in line.lower(),
+            '</tr' in line.lower(),
+            '<strong' in line.lower(),
+            'colspan' in line.lower(),
+            '&&' in line,
+            '||' in line,
+            ' == ' in line,
+            ' != ' in line,
+            '</' in line,  # Any closing tag
+            ' />' in line,  # Self-closing tag
+        ]):
+            cleaned_lines.append(line)
+    csv_text = '\n'.join(cleaned_lines)
+
+    # Step 3: Clean up extra whitespace
+    csv_text = re.sub(r'\s{2,}', ' ', csv_text)
+
+    # Step 4: Validate each line has proper CSV structure (but be less aggressive)
+    lines = csv_text.split('\n')
+    validated_lines = []
+    for i, line in enumerate(lines):
+        # Always keep empty lines
+        if not line.strip():
+            validated_lines.append(line)
+            continue
+
+        # Check if line has reasonable structure (not too many problematic characters)
+        # Valid CSV should mostly be: alphanumeric, spaces, commas, periods, $, -, :, /
+        clean_chars = sum(1 for c in line if c.isalnum() or c in ' ,.:-$/()\'\"')
+        total_chars = len(line)
+
+        # Be more permissive - allow 70% valid chars instead of 80%
+        # This helps preserve instruction rows and other valid content
+        if total_chars > 0 and (clean_chars / total_chars) > 0.70:
+            validated_lines.append(line)
+        else:
+            # Only skip lines that are REALLY malformed
+            continue
+
+    csv_text = '\n'.join(validated_lines)
+
+    # Step 5: Fix malformed Totals per Unit rows (ensure same structure as Totals row)
+    lines = csv_text.split('\n')
+    for i in range(len(lines)):
+        # If line starts with "Totals per Unit" but has too few commas
+        if lines[i].startswith('Totals per Unit'):
+            parts = lines[i].split(',')
+            # Should have at least 10 parts (label + 3 empty + 6 values)
+            if len(parts) < 10:
+                # Pad with empty strings to match structure
+                while len(parts) < 10:
+                    parts.insert(1, '')  # Insert empty fields after label
+                lines[i] = ','.join(parts)
+    csv_text = '\n'.join(lines)
+
+    # Step 6: Fix operation rows - ensure all have 10 fields (including final 0.00)
+    lines = csv_text.split('\n')
+    fixed_lines = []
+    for line in lines:
+        # Check if this is an operation data row (starts with a number like "10" or "20")
+        if line and line[0].isdigit() and ',' in line:
+            parts = line.split(',')
+            # Operation rows should have exactly 10 parts: Op, Work Center, Desc, Qty, Setup, Run, Move, Sub, Other, Cost
+            # Ensure it has 10 parts, padding with "0.00" if needed
+            while len(parts) < 10:
+                parts.append('0.00')
+            # Ensure the last 6 columns (hours and costs) are properly formatted
+            for j in range(4, 10):  # Columns 4-9 (Setup through Standard Cost)
+                if not parts[j] or parts[j].strip() == '':
+                    parts[j] = '0.00'
+                else:
+                    # Normalize "0" to "0.00" and ensure proper decimal format
+                    try:
+                        val = float(parts[j].strip())
+                        parts[j] = f'{val:.2f}'
+                    except ValueError:
+                        parts[j] = '0.00'
+            fixed_lines.append(','.join(parts))
+        else:
+            fixed_lines.append(line)
+
+    csv_text = '\n'.join(fixed_lines)
+
+    # Step 6.5: Ensure instruction rows exist after each operation row
+    lines = csv_text.split('\n')
+    operation_fixed_lines = []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        # Check if this is an operation data row (starts with a number)
+        if line and line[0].isdigit() and ',' in line:
+            # Add the operation row
+            operation_fixed_lines.append(line)
+
+            # Parse operation row to check work center
+            parts = line.split(',')
+            work_center = parts[1] if len(parts) > 1 else ""
+
+            # Check if NEXT line is an instruction row (starts with comma and has text)
+            if i + 1 < len(lines):
+                next_line = lines[i + 1]
+                if next_line.startswith(',') and len(next_line.split(',')) > 1 and next_line.split(',')[1].strip():
+                    # Instruction row exists - validate for SUB-PL operations
+                    if work_center.strip() == 'SUB-PL':
+                        # For SUB-PL, check if instruction contains "OUTSIDE VENDOR" in the ENTIRE line (not just first column)
+                        if 'OUTSIDE VENDOR' not in next_line:
+                            # Replace with proper instruction - Gemini generated incomplete instruction
+                            # IMPORTANT: Quote the instruction so comma doesn't split it into multiple cells
+                            operation_fixed_lines.append(',"PLATE, OUTSIDE VENDOR",,,,,,,,,')
+                        else:
+                            # Good instruction exists, but ensure it's properly quoted to prevent CSV splitting
+                            # Extract the instruction text (after first comma)
+                            inst_parts = next_line.split(',', 1)  # Split on first comma only
+                            if len(inst_parts) > 1:
+                                inst_text = inst_parts[1].rstrip(',')  # Get instruction part, remove trailing commas
+                                # If instruction contains commas and isn't already quoted, quote it
+                                if ',' in inst_text and not (inst_text.startswith('"') and inst_text.endswith('"')):
+                                    # Remove existing commas and quote the whole instruction
+                                    operation_fixed_lines.append(f',"{inst_text.strip()}",,,,,,,,,')
+                                else:
+                                    # Already quoted or no commas, keep as-is
+                                    operation_fixed_lines.append(next_line)
+                            else:
+                                operation_fixed_lines.append(next_line)
+                    else:
+                        # Good - instruction row exists for other operations
+                        operation_fixed_lines.append(next_line)
+
+                    i += 2  # Skip both operation and instruction rows
+
+                    # Now ensure empty row after instruction
+                    if i < len(lines) and lines[i].strip() and not lines[i].strip() == ',,,,,,,,,':
+                        operation_fixed_lines.append(',,,,,,,,,')
+                    elif i < len(lines):
+                        operation_fixed_lines.append(lines[i])
+                        i += 1
+                else:
+                    # Missing instruction row - add operation-specific placeholder
+                    # (quoted when it contains a comma so it doesn't split into multiple cells)
+                    operation_fixed_lines.append(f',{csv_field(default_instruction(work_center))},,,,,,,,,')
+                    operation_fixed_lines.append(',,,,,,,,,')
+                    i += 1
+            else:
+                # End of file, add operation-specific placeholder
+                operation_fixed_lines.append(f',{csv_field(default_instruction(work_center))},,,,,,,,,')
+                operation_fixed_lines.append(',,,,,,,,,')
+                i += 1
+        else:
+            # Not an operation row, just add it
+            operation_fixed_lines.append(line)
+            i += 1
+
+    csv_text = '\n'.join(operation_fixed_lines)
+
+    # Step 6.6: Calculate Totals from operations (DETERMINISTIC - don't rely on Gemini)
+    lines = csv_text.split('\n')
+
+    # Extract all operation hours - this is now the SINGLE SOURCE OF TRUTH for totals
+    total_setup = 0.0
+    total_run = 0.0
+    quantity_value = quantity  # Use the quantity parameter
+
+    for line in lines:
+        # Check if line starts with a number (operation row like "10,WATERJT,...")
+        if line and ',' in line:
+            parts = line.split(',')
+            # Check if first part (after strip) looks like an operation number (10, 20, 30, etc.)
+            if len(parts) > 0 and parts[0].strip() and parts[0].strip().isdigit():
+                try:
+                    # Extract setup and run hours from columns 4 and 5
+                    setup_hours = float(parts[4].strip()) if len(parts) > 4 and parts[4].strip() else 0.0
+                    run_hours = float(parts[5].strip()) if len(parts) > 5 and parts[5].strip() else 0.0
+                    total_setup += setup_hours
+                    total_run += run_hours
+                except (ValueError, IndexError) as e:
+                    # Skip malformed rows
+                    continue
+
+    # Calculate per-unit totals
+    per_unit_setup = total_setup / quantity_value if quantity_value > 0 else 0.0
+    per_unit_run = total_run / quantity_value if quantity_value > 0 else 0.0
+
+    # Now find and replace Totals rows if they exist
+    fixed_totals_lines = []
+    for i, line in enumerate(lines):
+        if line.startswith('Totals') and not line.startswith('Totals per Unit'):
+            # Replace with calculated values
+            fixed_totals_lines.append(f'Totals,,,,{total_setup:.2f},{total_run:.2f},0.00,0.00,0.00,0.00')
+        elif line.startswith('Totals per Unit'):
+            # Replace with calculated values
+            fixed_totals_lines.append(f'Totals per Unit,,,,{per_unit_setup:.2f},{per_unit_run:.2f},0.00,0.00,0.00,0.00')
+        else:
+            # Not a totals row, keep as-is
+            fixed_totals_lines.append(line)
+
+    csv_text = '\n'.join(fixed_totals_lines)
+
+    # Step 7: Ensure proper spacing before Totals rows
+    lines = csv_text.split('\n')
+    spaced_lines = []
+    for i, line in enumerate(lines):
+        # Check if NEXT line is Totals and current line is NOT already empty
+        if i < len(lines) - 1 and lines[i + 1].startswith('Totals'):
+            # Add current line
+            spaced_lines.append(line)
+            # If current line is NOT empty (more robust check), add empty row for spacing
+            # Consider a line empty if it's blank or contains only commas
+            stripped = line.strip().replace(',', '')
+            if stripped:  # If there's ANY content beyond commas
+                spaced_lines.append(',,,,,,,,,')
+        else:
+            # Normal line - just add it
+            spaced_lines.append(line)
+
+    csv_text = '\n'.join(spaced_lines)
+
+    # Step 8: Final validation - ensure we have ALL critical sections
+    # Check each required section individually and add if missing
+    lines = csv_text.split('\n')
+
+    # Check for "Totals" row (must appear first)
+    # Use the CALCULATED totals from Step 6.6 (not 0.00!)
+    has_totals = any('Totals' in line and not 'Totals per Unit' in line for line in lines)
+    if not has_totals:
+        csv_text += f'\n,,,,,,,,,\nTotals,,,,{total_setup:.2f},{total_run:.2f},0.00,0.00,0.00,0.00'
+
+    # Check for "Totals per Unit" row
+    has_totals_per_unit = any('Totals per Unit' in line for line in lines)
+    if not has_totals_per_unit:
+        csv_text += f'\nTotals per Unit,,,,{per_unit_setup:.2f},{per_unit_run:.2f},0.00,0.00,0.00,0.00'
+
+    # Check for "End of Report"
+    has_end_of_report = any('End of Report' in line for line in lines)
+    if not has_end_of_report:
+        csv_text += '\n,,,,,,,,,\n,,,,,,End of Report,,,'
+
+    # Check for footer message
+    has_footer = any('MAC ROUTER GENERATOR' in line or 'This report was requested' in line for line in lines)
+    if not has_footer:
+        csv_text += '\n,,,,,,,,,\n,,,,,,This report was requested by MAC ROUTER GENERATOR,,,'
+
+    return csv_text
+
+
+def _text(value):
+    """Single-line field text from a JSON value"""
+    return re.sub(r'\s+', ' ', re.sub(r'<[^>]+>', '', str(value or ''))).strip()
+
+
+def _hours(value):
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def parse_compact_response(raw_text):
+    """The compact JSON payload from a response, or None if the response is CSV text"""
+    text = raw_text.strip()
+    if text.startswith('```'):
+        text = text.split('\n', 1)[-1].rsplit('```', 1)[0].strip()
+    if not text.startswith('{'):
+        return None
+    try:
+        payload = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(payload, dict) or not isinstance(payload.get('operations'), list):
+        return None
+    return payload
+
+
+def compact_to_router_csv(payload, quantity, now=None):
+    """Synthesize the full M2M router CSV from a compact payload"""
+    operations = []
+    for op in payload['operations']:
+        if not isinstance(op, dict):
+            continue
+        work_center = _text(op.get('work_center')).upper()
+        instruction = _text(op.get('instruction'))
+        # Same SUB-PL rule as the CSV cleanup: the vendor instruction must be complete
+        if work_center == 'SUB-PL' and 'OUTSIDE VENDOR' not in instruction.upper():
+            instruction = "PLATE, OUTSIDE VENDOR"
+        operations.append({
+            'op': (len(operations) + 1) * 10,
+            'work_center': work_center,
+            'description': _text(op.get('description')),
+            # Rounded as the CSV shows them, so totals match the rows
+            'setup_hours': round(_hours(op.get('setup_hours')), 2),
+            'run_hours': round(_hours(op.get('minutes_per_piece')) * quantity / 60.0, 2),
+            'move_hours': 0.0,
+            'instruction': instruction or default_instruction(work_center),
+        })
+    router = {
+        'part_number': _text(payload.get('part_number')),
+        'rev': _text(payload.get('rev')) or '0',
+        'description': _text(payload.get('description')),
+        'quantity': quantity,
+        'operations': operations,
+    }
+    return synthesize_router_csv(router, now=now)
+
+
+def router_csv_from_response(raw_text, quantity):
+    """Router CSV from a model response in either output format"""
+    payload = parse_compact_response(raw_text)
+    if payload is not None:
+        return compact_to_router_csv(payload, quantity)
+    # Full CSV responses (csv format, older recordings) go through the cleanup steps
+    return clean_router_csv(raw_text, quantity)
+
+
+def repair_router_response(raw_text, quantity, request_repair, attempts=REPAIR_ATTEMPTS):
+    """
+    Router CSV from a response, re-prompting for just the defective rows first
+    request_repair(prompt, defect_lines) returns the raw repair response; a failed repair keeps what we had
+    """
+    payload = parse_compact_response(raw_text)
+    if payload is None:
+        payload = payload_from_csv(raw_text, quantity)
+    if payload is None:
+        return clean_router_csv(raw_text, quantity)
+
+    repaired = False
+    defects = find_defects(payload, quantity)
+    for _ in range(attempts):
+        if not defects:
+            break
+        try:
+            repair_text = request_repair(build_repair_prompt(payload, defects, quantity), describe_defects(defects))
+        except HedgeCancelled:
+            # The attempt lost its hedge race - it ends here rather than returning a half-repaired router
+            raise
+        except Exception:
+            break
+        fixed = apply_repair(payload, repair_text)
+        if fixed == payload:
+            # Nothing usable came back - asking the same question again won't help
+            break
+        payload = fixed
+        defects = find_defects(payload, quantity)
+        repaired = True
+
+    if repaired:
+        return compact_to_router_csv(payload, quantity)
+    return router_csv_from_response(raw_text, quantity)
+
+
+def is_valid_router(csv_text):
+    """Check a cleaned router has an operations table with at least one operation row"""
+    if not csv_text or csv_text.startswith('Error:'):
+        return False
+    lines = csv_text.split('\n')
+    has_operations_header = any('Op' in line and 'Work Center' in line for line in lines)
+    has_operation = any(line and line[0].isdigit() and ',' in line for line in lines)
+    return has_operations_header and has_operation
+
+# ==========================================
+# Gemini Calls
+# ==========================================
+def upload_drawing(drawing, api_key):
+    """Upload the drawing once so every attempt (primary and hedge) can reuse it; returns the upload handle"""
+    client = client_pool.for_key(api_key)
+    # Streams from the spooled file handle - no extra in-memory copy of the drawing
+    uploaded_file = client.upload(drawing.reader(), mime_type=drawing.mime_type, display_name=drawing.name)
+    return {'file': uploaded_file, 'client': client}
+
+def _usage_from_response(response):
+    """Token counts from a Gemini response (zeros if the SDK didn't report them)"""
+    usage = getattr(response, 'usage_metadata', None)
+    return {
+        'prompt_tokens': getattr(usage, 'prompt_token_count', 0) or 0,
+        'output_tokens': getattr(usage, 'candidates_token_count', 0) or 0,
+        'total_tokens': getattr(usage, 'total_token_count', 0) or 0,
+    }
+
+def request_router_text(uploaded, prompt, model_name, session_id="default", generation_config=None):
+    """
+    Run a single generate_content call and return (raw response text, token usage)
+    generation_config, if given, replaces the pooled model's configuration for this call
+    """
+    limiter = get_rate_limiter(model_name)
+    # Wait for a shared request slot so concurrent sessions don't all hit 429s
+    limiter.acquire(session_id, timeout=REQUEST_TIMEOUT)
+    # Pooled per key + model - no reconfiguring or rebuilding per call
+    model = uploaded['client'].model(model_name)
+    try:
+        response = model.generate_content([uploaded['file'], prompt], generation_config=generation_config,
+                                          request_options={"timeout": REQUEST_TIMEOUT})
+    except Exception as e:
+        # Provider says we're over quota - drain the shared bucket so every session backs off
+        if type(e).__name__ == 'ResourceExhausted' or '429' in str(e):
+            limiter.throttle()
+        raise
+    return response.text, _usage_from_response(response)
+
+class GeminiBackend:
+    """Live Gemini backend - the default model backend for generation"""
+
+    name = "gemini"
+
+    def upload(self, drawing, api_key):
+        return upload_drawing(drawing, api_key)
+
+    def generate(self, uploaded, prompt, model_name, session_id, fingerprint):
+        # Repairs need the schema with operation indexes, not the full router schema
+        generation_config = REPAIR_GENERATION_CONFIG if fingerprint.get('repair') else None
+        return request_router_text(uploaded, prompt, model_name, session_id, generation_config)
+
+def request_fingerprint(digest, quantity, model_name):
+    """Identity of a generation request - what a recording is stored and replayed under"""
+    return {
+        'drawing_hash': digest,
+        'quantity': quantity,
+        'model': model_name,
+        'prompt_version': PROMPT_VERSION,
+    }
+
+def get_backend():
+    """Model backend for this process - live Gemini, or recording/replaying per ROUTER_RECORD_MODE"""
+    return backend_for_mode(GeminiBackend())
+
+# ==========================================
+# Router Generation Function
+# ==========================================
+def generate_router_with_gemini(pdf_file, quantity, api_key, model_name="gemini-3-flash-preview",
+                                hedge_model=None, hedge_policy=None, session_id="default", backend=None, report=None):
+    """
+    Call Gemini API to generate router, optionally hedging a slow primary with a backup model
+    report, if given, is a dict filled with per-request details ('scan': preprocessing of an image drawing)
+    """
+    try:
+        backend = backend or get_backend()
+        # Stream the upload into a spooled temp file (hashed on the way in) instead of holding copies in RAM;
+        # a drawing the caller already spooled is used as is (and closed here) rather than copied again
+        if isinstance(pdf_file, SpooledDrawing):
+            drawing = pdf_file
+        else:
+            drawing = spool_drawing(pdf_file, session_id)
+        # Encrypted, corrupt, empty or oversize files are turned away here, in milliseconds, not after an upload
+        if drawing.preflight is None:
+            try:
+                drawing, _ = preflight_drawing(drawing)
+            except PreflightRejected:
+                drawing.close()
+                raise
+        # Image scans are cleaned up and shrunk locally so far fewer bytes go up to the model
+        drawing, scan = preprocess_drawing(drawing)
+        if scan is not None:
+            scan_stats.record(scan)
+            if report is not None:
+                report['scan'] = scan
+        digest = drawing.digest
+
+        def generate():
+            tags = request_fingerprint(digest, quantity, model_name)
+            with profile_request('generate', tags) as profile:
+                # A degraded model is skipped for a healthy fallback (or refused outright) before anything is sent
+                primary_model, backup_model = route_models(model_name, hedge_model)
+                prompt = build_router_prompt(quantity)
+                with profile.stage('upload'):
+                    uploaded = backend.upload(drawing, api_key)
+
+                def attempt(attempt_model, checkpoint):
+                    fingerprint = request_fingerprint(digest, quantity, attempt_model)
+                    breaker = get_breaker(attempt_model)
+                    # Refused immediately while the model's circuit is open instead of waiting out the timeout
+                    with profile.stage(f'model:{attempt_model}'), breaker.call():
+                        raw_text, usage = backend.generate(uploaded, prompt, attempt_model, session_id, fingerprint)
+                    # Lost the hedge race while the call was in flight - nothing more is spent on this attempt
+                    checkpoint()
+
+                    def request_repair(repair_prompt, defect_lines):
+                        checkpoint()
+                        # Same uploaded drawing, a prompt of a few hundred tokens, only the bad rows back
+                        repair_fingerprint = dict(fingerprint, repair=defect_lines)
+                        with profile.stage(f'repair:{attempt_model}'), breaker.call():
+                            repair_text, _ = backend.generate(uploaded, repair_prompt, attempt_model, session_id,
+                                                              repair_fingerprint)
+                        return repair_text
+
+                    with profile.stage('cleanup'):
+                        return repair_router_response(raw_text, quantity, request_repair)
+
+                # Attempts run on the hedging pool, so they're wrapped to be profiled on their own threads
+                return run_hedged(profile.wrap(attempt), primary_model, backup_model, hedge_policy, is_valid_router)
+
+        # Identical drawing + quantity + model already generating (double Enter, two planners) - share it
+        flight_key = (digest, quantity, model_name)
+        with drawing:
+            return generation_flights.do(flight_key, generate)
+
+    except PreflightRejected as e:
+        return f"Error: {str(e)}"
+    except CircuitOpen as e:
+        return f"Error: {str(e)}\n\nThe model provider is having problems - try again shortly or pick another model."
+    except Exception as e:
+        return f"Error: {str(e)}\n\nPlease check:\n- API key is valid\n- PDF is readable\n- Network connection is stable"
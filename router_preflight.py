@@ -0,0 +1,211 @@
+"""
+MAC Router Generator - Drawing Pre-flight
+Local checks on a spooled drawing (type, size, pages, encryption, content) that reject bad files before any upload
+"""
+
+from collections import Counter
+import io
+import os
+import threading
+import time
+
+from router_deps import load_pypdf
+from router_intake import sniff_mime_type, spool_drawing
+from router_scans import MAX_PIXELS, is_scan, load_pil
+
+# The model's own PDF limits are 50 MB / 1000 pages; routers never need anywhere near that
+MAX_DRAWING_BYTES = int(float(os.environ.get("ROUTER_MAX_DRAWING_MB", "50")) * 1024 * 1024)
+MAX_PAGES = int(os.environ.get("ROUTER_MAX_PAGES", "100"))
+# Pages inspected for drawable content - a drawing with blank first sheets is not worth sending
+CONTENT_PAGES = 3
+# Content streams shorter than this can't draw anything useful
+MIN_CONTENT_BYTES = 64
+# The PDF spec allows junk before the header within the first kilobyte
+_HEADER_WINDOW = 1024
+
+# Message shown to the user for each rejection reason
+REJECTION_MESSAGES = {
+    'empty': "The file is empty",
+    'unsupported-type': "This isn't a PDF or a TIFF/PNG/JPEG scan",
+    'too-large': "The drawing is over {limit} MB - export it at a lower resolution or split the package",
+    'corrupt': "The file is damaged and can't be read - re-export or re-scan it",
+    'encrypted': "The PDF is password-protected - remove the password and upload it again",
+    'no-pages': "The PDF has no pages",
+    'too-many-pages': "The PDF has {pages} pages (limit {limit}) - split the package",
+    'blank': "The drawing has no visible content on its first pages",
+    'too-many-pixels': "The scan is over {limit:,} pixels - scan it at a lower DPI",
+}
+
+
+class PreflightRejected(Exception):
+    """The drawing failed a pre-flight check; reason is one of REJECTION_MESSAGES"""
+
+    def __init__(self, reason, **details):
+        self.reason = reason
+        super().__init__(REJECTION_MESSAGES[reason].format(limit=_limit_for(reason), **details))
+
+
+def _limit_for(reason):
+    if reason == 'too-large':
+        return MAX_DRAWING_BYTES // (1024 * 1024)
+    if reason == 'too-many-pixels':
+        return MAX_PIXELS
+    return MAX_PAGES
+
+
+class PreflightStats:
+    """Process-wide counts of drawings checked, rejected (by reason) and fixed (by fix)"""
+
+    def __init__(self):
+        self.checked = 0
+        self.rejected = Counter()
+        self.fixed = Counter()
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds, reason=None, fixes=()):
+        with self._lock:
+            self.checked += 1
+            self.seconds += seconds
+            if reason:
+                self.rejected[reason] += 1
+            for fix in fixes:
+                self.fixed[fix] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'checked': self.checked,
+                'rejected': dict(self.rejected),
+                'rejected_total': sum(self.rejected.values()),
+                'fixed': dict(self.fixed),
+                'avg_ms': self.seconds * 1000.0 / self.checked if self.checked else 0.0,
+            }
+
+
+preflight_stats = PreflightStats()
+
+
+def _page_has_content(page):
+    if (page.extract_text() or "").strip():
+        return True
+    resources = page.get('/Resources') or {}
+    if '/XObject' in resources:
+        return True
+    contents = page.get_contents()
+    return contents is not None and len(contents.get_data()) >= MIN_CONTENT_BYTES
+
+
+def _check_pdf(drawing, head, fixes):
+    """Checks (and fixes) for a PDF; returns (fixed bytes to upload or None, page count, pypdf reader or None)"""
+    source = drawing.reader()
+    data = None
+    offset = head.find(b'%PDF')
+    if offset > 0:
+        # Header preceded by junk (some plotter drivers prepend a job header) - trim it
+        data = drawing.read_bytes()[offset:]
+        source = io.BytesIO(data)
+        fixes.append('trimmed-header')
+
+    pypdf = load_pypdf()
+    if pypdf is None:
+        # Without pypdf only the header and size can be checked
+        return data, None, None
+    try:
+        reader = pypdf.PdfReader(source)
+        rewrite = False
+        if reader.is_encrypted:
+            # Owner-password-only PDFs (print/copy restrictions) open with an empty password
+            try:
+                opened = reader.decrypt("")
+            except Exception:
+                opened = False
+            if not opened:
+                raise PreflightRejected('encrypted')
+            fixes.append('decrypted')
+            rewrite = True
+        pages = len(reader.pages)
+        if pages == 0:
+            raise PreflightRejected('no-pages')
+        if pages > MAX_PAGES:
+            raise PreflightRejected('too-many-pages', pages=pages)
+        if not any(_page_has_content(reader.pages[i]) for i in range(min(pages, CONTENT_PAGES))):
+            raise PreflightRejected('blank')
+        if rewrite:
+            writer = pypdf.PdfWriter()
+            for page in reader.pages:
+                writer.add_page(page)
+            buffer = io.BytesIO()
+            writer.write(buffer)
+            data = buffer.getvalue()
+    except PreflightRejected:
+        raise
+    except Exception:
+        raise PreflightRejected('corrupt')
+    return data, pages, reader
+
+
+def _check_image(handle):
+    """Header-only checks for a scan; returns its frame count"""
+    Image = load_pil()
+    if Image is None:
+        return None
+    try:
+        image = Image.open(handle)
+        width, height = image.size
+        frames = getattr(image, 'n_frames', 1)
+        # verify() walks the file structure without decoding pixels
+        image.verify()
+    except Image.DecompressionBombError:
+        raise PreflightRejected('too-many-pixels')
+    except Exception:
+        raise PreflightRejected('corrupt')
+    if not width or not height:
+        raise PreflightRejected('corrupt')
+    if width * height > MAX_PIXELS:
+        raise PreflightRejected('too-many-pixels')
+    return frames
+
+
+def preflight_drawing(drawing):
+    """
+    Check a spooled drawing before anything leaves the machine; returns (drawing to use, report)
+    report is {'mime_type', 'pages', 'fixes', 'ms'}. Fixed drawings are re-spooled (the original is
+    closed). Raises PreflightRejected, recorded in preflight_stats by reason
+    """
+    t0 = time.perf_counter()
+    fixes = []
+    try:
+        if drawing.size == 0:
+            raise PreflightRejected('empty')
+        head = drawing.reader().read(_HEADER_WINDOW)
+        mime_type = sniff_mime_type(head, default=None)
+        if mime_type is None and b'%PDF' in head:
+            mime_type = 'application/pdf'
+        if mime_type is None:
+            raise PreflightRejected('unsupported-type')
+
+        pages = None
+        if is_scan(mime_type):
+            # Scans are shrunk before upload, so their size limit is in pixels rather than bytes
+            pages = _check_image(drawing.reader())
+        else:
+            if drawing.size > MAX_DRAWING_BYTES:
+                raise PreflightRejected('too-large')
+            data, pages, reader = _check_pdf(drawing, head, fixes)
+            if data is None:
+                # Opened over the drawing's own handle - later steps reuse it rather than parsing again
+                drawing.keep_pdf(reader)
+            else:
+                fixed = spool_drawing(data, drawing.session_id, name=drawing.name, mime_type=mime_type,
+                                      budget=drawing.budget)
+                drawing.close()
+                drawing = fixed
+        drawing.mime_type = mime_type
+    except PreflightRejected as e:
+        preflight_stats.record(time.perf_counter() - t0, reason=e.reason)
+        raise
+    seconds = time.perf_counter() - t0
+    preflight_stats.record(seconds, fixes=fixes)
+    drawing.preflight = {'mime_type': mime_type, 'pages': pages, 'fixes': fixes, 'ms': seconds * 1000.0}
+    return drawing, drawing.preflight
@@ -0,0 +1,138 @@
+"""
+MAC Router Generator - Price-Break Routers
+One generation, every requested quantity derived locally (run hours, Totals, Totals per Unit)
+"""
+
+import re
+
+from router_model import parse_router, router_totals, synthesize_router_csv, csv_field
+
+# More than this many quantities in one message is almost certainly not a price-break request
+MAX_QUANTITIES = 12
+
+# A number standing on its own - not part of a part number (TS01000B072-1), date (2024-01) or decimal (1.5)
+# A unit glued on the end (50pcs, 50ea, 50x) still ends it
+_START = r'(?<![\w.-])'
+_END = r'(?=(?:pcs?|pieces?|ea|units?|x)\b|(?!\w|[.-]\w))'
+# "qty 50", "qty50", "quantity: 10/50/100", "qty 10-50 step 10" - whatever follows the label is the quantity
+_LABEL = re.compile(r'(?<![\w.-])(?:qty|quantity|quantities|q)(?![a-z])\s*[:=#]?\s*', re.IGNORECASE)
+
+
+def _patterns(start):
+    """(list, range, lone number) patterns, in the order they win a tie"""
+    return (
+        re.compile(start + r'\d+(?:\s*(?:[/,;]|and)\s*\d+)+' + _END, re.IGNORECASE),
+        re.compile(start + r'(\d+)\s*(?:-|to)\s*(\d+)' + _END + r'(?:\s*(?:step|by|every)\s*(\d+))?',
+                   re.IGNORECASE),
+        re.compile(start + r'\d+' + _END, re.IGNORECASE),
+    )
+
+
+_STANDALONE = _patterns(_START)
+# Right after a label the number may be glued on (qty50)
+_LABELLED = _patterns('')
+
+
+def _range_quantities(match):
+    low, high = sorted((int(match.group(1)), int(match.group(2))))
+    step = int(match.group(3)) if match.group(3) else 0
+    if step <= 0:
+        return [low, high]
+    # range() is lazy - '1-1000000000 step 1' never builds a billion-element list
+    values = range(low, high + 1, step)
+    # Both ends are always kept; past MAX_QUANTITIES the steps between them are thinned evenly
+    count = MAX_QUANTITIES - (values[-1] != high)
+    if len(values) > count:
+        values = [values[round(i * (len(values) - 1) / (count - 1))] for i in range(count)]
+    quantities = list(values)
+    if quantities[-1] != high:
+        quantities.append(high)
+    return quantities
+
+
+def _quantities_at(text, pos=0, anchored=False):
+    """
+    Quantities from the earliest list, range or lone number in text (exactly at pos when anchored)
+    An explicit list beats a range, and a range a lone number, when they start at the same place
+    """
+    found = []
+    for priority, pattern in enumerate(_LABELLED if anchored else _STANDALONE):
+        match = pattern.match(text, pos) if anchored else pattern.search(text, pos)
+        if match:
+            found.append((match.start(), priority, match))
+    if not found:
+        return []
+    _, priority, match = min(found, key=lambda item: item[:2])
+    if priority == 1:
+        return _range_quantities(match)
+    return [int(n) for n in re.findall(r'\d+', match.group(0))]
+
+
+def parse_quantities(user_text):
+    """
+    Quantities requested in a chat message, in ascending order
+    '10/50/100/500', '10, 50 and 100', '10-50 step 10', '10 to 500' (endpoints only) or a single number
+    Numbers labelled qty/quantity win; numbers inside part numbers and dates are never quantities
+    """
+    text = user_text or ""
+    quantities = []
+    for label in _LABEL.finditer(text):
+        quantities = _quantities_at(text, label.end(), anchored=True)
+        if quantities:
+            break
+    if not quantities:
+        quantities = _quantities_at(text)
+    quantities = sorted(set(q for q in quantities if q > 0))
+    return quantities[:MAX_QUANTITIES]
+
+
+def rescale_router(router, quantity):
+    """Copy of a parsed router with run hours scaled linearly to a new quantity (setup unchanged)"""
+    base_quantity = router['quantity'] or 1
+    scaled = dict(router)
+    scaled['quantity'] = quantity
+    scaled['operations'] = [
+        dict(op, run_hours=op['run_hours'] * quantity / base_quantity)
+        for op in router['operations']
+    ]
+    return scaled
+
+
+def derive_price_breaks(csv_text, quantities):
+    """{quantity: router CSV} for every quantity, all derived from one generated router"""
+    router = parse_router(csv_text)
+    return {quantity: synthesize_router_csv(rescale_router(router, quantity)) for quantity in quantities}
+
+
+def price_break_rows(price_breaks):
+    """Summary rows (one per quantity) of the price-break comparison"""
+    rows = []
+    for quantity, csv_text in price_breaks.items():
+        router = parse_router(csv_text)
+        total_setup, total_run, per_unit_setup, per_unit_run = router_totals(router['operations'], quantity)
+        rows.append({
+            'quantity': quantity,
+            'part_number': router['part_number'],
+            'total_setup': total_setup,
+            'total_run': total_run,
+            'per_unit_setup': per_unit_setup,
+            'per_unit_run': per_unit_run,
+            'per_unit_total': per_unit_setup + per_unit_run,
+            'operations': router['operations'],
+        })
+    return rows
+
+
+def price_breaks_to_csv(price_breaks):
+    """Single export: the comparison summary followed by each quantity's full router"""
+    rows = price_break_rows(price_breaks)
+    lines = ["Price Break Summary,,,,,,,",
+             "Quantity,Part Number,Total Setup Hours,Total Run Hours,Setup per Unit,Run per Unit,Hours per Unit,"]
+    for row in rows:
+        lines.append(
+            f"{row['quantity']},{csv_field(row['part_number'])},{row['total_setup']:.2f},{row['total_run']:.2f},"
+            f"{row['per_unit_setup']:.4f},{row['per_unit_run']:.4f},{row['per_unit_total']:.4f},"
+        )
+    for quantity, csv_text in price_breaks.items():
+        lines += ["", f"Router for Quantity {quantity},,,,,,,", csv_text]
+    return '\n'.join(lines)
@@ -0,0 +1,254 @@
+"""
+MAC Router Generator - Opt-in Profiling
+cProfile, tracemalloc and a stack sampler around each generation and render, written to disk per request
+"""
+
+from contextlib import contextmanager
+from datetime import datetime
+import cProfile
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+
+# ROUTER_PROFILE=1 turns profiling on at startup; the sidebar can flip it at runtime
+_enabled = os.environ.get("ROUTER_PROFILE", "") == "1"
+PROFILE_DIR = os.environ.get("ROUTER_PROFILE_DIR", "profiles")
+# Seconds between stack samples for the collapsed-stack (flamegraph) output
+SAMPLE_INTERVAL = float(os.environ.get("ROUTER_PROFILE_INTERVAL", "0.005"))
+TOP_ALLOCATIONS = 25
+
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+
+
+def _enable(profiler):
+    """Start a profiler; False if another profiler already owns this interpreter (3.12+)"""
+    try:
+        profiler.enable()
+        return True
+    except ValueError:
+        return False
+
+
+def profiling_enabled():
+    return _enabled
+
+
+def set_profiling_enabled(enabled):
+    """Process-wide switch (used by the sidebar toggle)"""
+    global _enabled
+    _enabled = bool(enabled)
+
+
+class _NullRecord:
+    """Stand-in when profiling is off - every hook is a no-op"""
+
+    def stage(self, name):
+        return _NULL_STAGE
+
+    def wrap(self, fn):
+        return fn
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _NullProfile:
+    def __enter__(self):
+        return _NULL_RECORD
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+_NULL_RECORD = _NullRecord()
+_NULL_PROFILE = _NullProfile()
+
+
+class _StackSampler(threading.Thread):
+    """Samples the stacks of the request's threads into collapsed-stack counts"""
+
+    def __init__(self, interval):
+        super().__init__(name="router-profile-sampler", daemon=True)
+        self.interval = interval
+        self.thread_ids = set()
+        self.counts = {}
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def watch(self, thread_id):
+        with self._lock:
+            self.thread_ids.add(thread_id)
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            with self._lock:
+                watched = set(self.thread_ids)
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id not in watched:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                key = ";".join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class ProfileRecord:
+    """Profiles, allocations, samples and stage timings for one request"""
+
+    def __init__(self, kind, tags):
+        self.kind = kind
+        self.tags = dict(tags)
+        self.stages = {}
+        self._stats = None
+        self._lock = threading.Lock()
+        self.sampler = _StackSampler(SAMPLE_INTERVAL)
+
+    @contextmanager
+    def stage(self, name):
+        """Time a named stage (may run on any thread)"""
+        t0 = time.perf_counter()
+        try:
+            yield self
+        finally:
+            elapsed = time.perf_counter() - t0
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def _add_profile(self, profiler):
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profiler)
+            else:
+                self._stats.add(profiler)
+
+    def run_profiled(self, fn, *args, **kwargs):
+        """Run fn under cProfile on the current thread and merge the result into this record"""
+        self.sampler.watch(threading.get_ident())
+        profiler = cProfile.Profile()
+        active = _enable(profiler)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if active:
+                profiler.disable()
+                self._add_profile(profiler)
+
+    def wrap(self, fn):
+        """Wrap a function handed to worker threads so its work is profiled too"""
+        def profiled(*args, **kwargs):
+            return self.run_profiled(fn, *args, **kwargs)
+        return profiled
+
+    def write(self, wall_time, memory_current, memory_peak, snapshot):
+        """Write pstats, top allocations, collapsed stacks and metadata; returns the artifact directory"""
+        tag = self.tags.get('drawing_hash') or self.tags.get('router_hash') or 'request'
+        tag = re.sub(r'[^A-Za-z0-9_-]', '', str(tag))[:16]
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        directory = os.path.join(PROFILE_DIR, f"{stamp}_{self.kind}_{tag}")
+        os.makedirs(directory, exist_ok=True)
+
+        if self._stats is not None:
+            self._stats.dump_stats(os.path.join(directory, "profile.pstats"))
+
+        with open(os.path.join(directory, "allocations.txt"), "w", encoding="utf-8") as f:
+            # tracemalloc counts every thread - concurrent requests' allocations are included
+            f.write(f"Current traced memory (process-wide): {memory_current / 1024:.1f} KiB\n")
+            f.write(f"Peak traced memory (process-wide, since the latest profile started): "
+                    f"{memory_peak / 1024:.1f} KiB\n\n")
+            if snapshot is not None:
+                for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+                    f.write(f"{stat}\n")
+
+        # Collapsed stacks - feed straight into flamegraph.pl or speedscope
+        with open(os.path.join(directory, "stacks.collapsed"), "w", encoding="utf-8") as f:
+            for stack, count in sorted(self.sampler.counts.items()):
+                f.write(f"{stack} {count}\n")
+
+        meta = {
+            'kind': self.kind,
+            'tags': self.tags,
+            'wall_time': wall_time,
+            'stages': self.stages,
+            'memory_peak_bytes': memory_peak,
+            'memory_scope': 'process',
+            'samples': sum(self.sampler.counts.values()),
+        }
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2, default=str)
+        return directory
+
+
+def _start_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        else:
+            # The peak would otherwise be the highest since tracing began, not during this request
+            tracemalloc.reset_peak()
+        _tracemalloc_users += 1
+
+
+def _stop_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if _tracemalloc_users == 0:
+            tracemalloc.stop()
+    return snapshot, current, peak
+
+
+def profile_request(kind, tags=None):
+    """
+    Profile one generation or render; the context yields a record with stage() and wrap() hooks
+    When profiling is off this returns a shared no-op context and does nothing else
+    """
+    if not _enabled:
+        return _NULL_PROFILE
+    return _profile_request(kind, tags)
+
+
+@contextmanager
+def _profile_request(kind, tags):
+    record = ProfileRecord(kind, tags or {})
+    _start_tracemalloc()
+    record.sampler.watch(threading.get_ident())
+    record.sampler.start()
+    profiler = cProfile.Profile()
+    t0 = time.perf_counter()
+    active = _enable(profiler)
+    try:
+        yield record
+    finally:
+        if active:
+            profiler.disable()
+            record._add_profile(profiler)
+        wall_time = time.perf_counter() - t0
+        record.sampler.stop()
+        snapshot, current, peak = _stop_tracemalloc()
+        try:
+            record.write(wall_time, current, peak, snapshot)
+        except OSError:
+            # Profiling must never break a generation
+            pass
@@ -0,0 +1,206 @@
+"""
+MAC Router Generator - Shared Rate Limiter
+Process-wide token bucket and daily quota for Gemini calls, fair across sessions
+"""
+
+from collections import deque
+from datetime import datetime
+import os
+import sqlite3
+import threading
+import time
+
+# Free tier defaults - override with ROUTER_RPM / ROUTER_RPD
+DEFAULT_REQUESTS_PER_MINUTE = int(os.environ.get("ROUTER_RPM", "15"))
+DEFAULT_REQUESTS_PER_DAY = int(os.environ.get("ROUTER_RPD", "1500"))
+
+# Optional SQLite file so several server workers share one quota
+QUOTA_DB_PATH = os.environ.get("ROUTER_QUOTA_DB", "")
+
+
+class QuotaExceeded(Exception):
+    """Daily request quota is used up"""
+
+
+class RateLimitTimeout(Exception):
+    """Waited too long in the queue for a request slot"""
+
+
+def _today():
+    return datetime.now().strftime('%Y-%m-%d')
+
+
+class _MemoryStore:
+    """Bucket state held in this process only"""
+
+    def __init__(self):
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def transact(self, bucket, update):
+        """Apply update(state) -> (new_state, result) atomically and return result"""
+        with self._lock:
+            new_state, result = update(self._rows.get(bucket))
+            self._rows[bucket] = new_state
+            return result
+
+
+class _SqliteStore:
+    """Bucket state in a SQLite file shared by every worker process"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS quota ("
+                "bucket TEXT PRIMARY KEY, tokens REAL, updated REAL, day TEXT, used INTEGER)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def transact(self, bucket, update):
+        """Apply update(state) -> (new_state, result) inside an exclusive transaction"""
+        with self._lock:
+            conn = self._connect()
+            conn.isolation_level = None
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute(
+                    "SELECT tokens, updated, day, used FROM quota WHERE bucket = ?", (bucket,)
+                ).fetchone()
+                state = None
+                if row:
+                    state = {'tokens': row[0], 'updated': row[1], 'day': row[2], 'used': row[3]}
+                new_state, result = update(state)
+                conn.execute(
+                    "INSERT OR REPLACE INTO quota (bucket, tokens, updated, day, used) VALUES (?, ?, ?, ?, ?)",
+                    (bucket, new_state['tokens'], new_state['updated'], new_state['day'], new_state['used'])
+                )
+                conn.execute("COMMIT")
+                return result
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+
+
+class RateLimiter:
+    """Token bucket (requests/minute) plus daily counter, with round-robin queuing per session"""
+
+    def __init__(self, bucket, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                 requests_per_day=DEFAULT_REQUESTS_PER_DAY, store=None):
+        self.bucket = bucket
+        self.requests_per_minute = requests_per_minute
+        self.requests_per_day = requests_per_day
+        self.store = store or _MemoryStore()
+        # Fair queue - each session waits in its own FIFO, sessions take turns
+        self._cond = threading.Condition()
+        self._waiting = {}
+        self._rotation = deque()
+
+    def _refill(self, state, now):
+        """Bring a bucket state up to date (new day resets the daily counter)"""
+        if state is None:
+            state = {'tokens': float(self.requests_per_minute), 'updated': now, 'day': _today(), 'used': 0}
+        state = dict(state)
+        elapsed = max(now - state['updated'], 0.0)
+        state['tokens'] = min(self.requests_per_minute, state['tokens'] + elapsed * self.requests_per_minute / 60.0)
+        state['updated'] = now
+        if state['day'] != _today():
+            state['day'] = _today()
+            state['used'] = 0
+        return state
+
+    def _try_take(self):
+        """Take one token if available; returns seconds to wait (0 when taken)"""
+        def update(state):
+            state = self._refill(state, time.time())
+            if state['used'] >= self.requests_per_day:
+                raise QuotaExceeded(f"Daily quota of {self.requests_per_day} requests used for {self.bucket}")
+            if state['tokens'] >= 1.0:
+                state['tokens'] -= 1.0
+                state['used'] += 1
+                return state, 0.0
+            return state, (1.0 - state['tokens']) * 60.0 / self.requests_per_minute
+        return self.store.transact(self.bucket, update)
+
+    def acquire(self, session_id="default", timeout=None):
+        """Block until this session's turn comes up and a request slot is free"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        ticket = object()
+        with self._cond:
+            if session_id not in self._waiting:
+                self._waiting[session_id] = deque()
+                self._rotation.append(session_id)
+            self._waiting[session_id].append(ticket)
+            try:
+                while True:
+                    my_turn = self._rotation[0] == session_id and self._waiting[session_id][0] is ticket
+                    if my_turn:
+                        wait_seconds = self._try_take()
+                        if wait_seconds == 0.0:
+                            return
+                    else:
+                        # Another session is up - re-check shortly in case it was served by another worker
+                        wait_seconds = 1.0
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise RateLimitTimeout(f"Timed out waiting for a {self.bucket} request slot")
+                        wait_seconds = min(wait_seconds, remaining)
+                    self._cond.wait(min(wait_seconds, 1.0))
+            finally:
+                self._leave(session_id, ticket)
+                self._cond.notify_all()
+
+    def _leave(self, session_id, ticket):
+        """Remove a ticket and pass the turn to the next waiting session"""
+        queue = self._waiting[session_id]
+        queue.remove(ticket)
+        was_up = self._rotation[0] == session_id
+        if not queue:
+            del self._waiting[session_id]
+            self._rotation.remove(session_id)
+        elif was_up:
+            self._rotation.rotate(-1)
+
+    def throttle(self):
+        """Drain the bucket after the provider returns 429 so every session backs off"""
+        def update(state):
+            state = self._refill(state, time.time())
+            state['tokens'] = 0.0
+            return state, None
+        self.store.transact(self.bucket, update)
+        with self._cond:
+            self._cond.notify_all()
+
+    def remaining_today(self):
+        """Requests left in today's quota"""
+        def update(state):
+            state = self._refill(state, time.time())
+            return state, max(self.requests_per_day - state['used'], 0)
+        return self.store.transact(self.bucket, update)
+
+    def queue_depth(self):
+        """Number of requests currently waiting for a slot in this process"""
+        with self._cond:
+            return sum(len(q) for q in self._waiting.values())
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+_store = None
+
+
+def get_rate_limiter(model_name):
+    """Process-wide limiter for a model (Gemini quotas are per model)"""
+    global _store
+    with _limiters_lock:
+        if _store is None:
+            _store = _SqliteStore(QUOTA_DB_PATH) if QUOTA_DB_PATH else _MemoryStore()
+        if model_name not in _limiters:
+            _limiters[model_name] = RateLimiter(model_name, store=_store)
+        return _limiters[model_name]
@@ -0,0 +1,189 @@
+"""
+MAC Router Generator - Router HTML Rendering
+M2M layout templates compiled once, output built with joins and memoized by content hash
+"""
+
+from collections import OrderedDict
+import csv
+import hashlib
+import html
+import threading
+
+from router_profiling import profile_request
+
+OPERATION_COLUMNS = 11
+PART_INFO_COLUMNS = 6
+
+# ==========================================
+# M2M Layout Templates (built once at import)
+# ==========================================
+_HEADER = '''
+            <div class="router-header">
+                <div class="router-logo">{logo}</div>
+                <div class="router-title">{title}</div>
+                <div class="router-info">{page}<br>{date}<br>{time}</div>
+            </div>
+            '''.format
+_PART_INFO_OPEN = '<table class="part-info-table"><thead><tr>'
+_OPERATIONS_OPEN = '</tbody></table><table class="operations-table"><thead><tr>'
+_HEAD_CLOSE = '</tr></thead><tbody>'
+_TH = '<th>{}</th>'.format
+_TD = '<td>{}</td>'.format
+_TD_STRONG = '<td><strong>{}</strong></td>'.format
+_TD_EMPTY = '<td></td>'
+_INSTRUCTION_ROW = '<tr class="instruction-row"><td colspan="{colspan}">{text}</td></tr>'.format
+_END_OF_REPORT = ('</tbody></table>'
+                  '<div class="footer-line"></div>'
+                  '<div class="footer"><strong>End of Report</strong></div>')
+_FOOTER_TEXT = '<div class="footer-text">{}</div>'.format
+
+# Rendered HTML keyed by router content hash (LRU)
+_CACHE_SIZE = 256
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cell(parts, index):
+    return parts[index] if len(parts) > index else ""
+
+
+def _render(csv_text):
+    """Build the M2M router HTML (uncached)"""
+    esc = html.escape
+    lines_raw = csv_text.strip().split('\n')
+    # Use csv.reader to properly parse quoted fields
+    lines = list(csv.reader(lines_raw))
+    last = len(lines) - 1
+
+    out = ['<div class="router-output">']
+    append = out.append
+    in_operations_table = False
+
+    for i, parts in enumerate(lines):
+        line_str = lines_raw[i]
+
+        # Header line - MAC logo, title, page info (date and time come from lines 1 and 2)
+        if i == 0:
+            page_info = parts[10] if len(parts) > 10 else _cell(parts, 9)
+            date_info = lines[1][9] if len(lines) > 1 and len(lines[1]) > 9 else ""
+            time_info = lines[2][9] if len(lines) > 2 and len(lines[2]) > 9 else ""
+            append(_HEADER(
+                logo=esc(_cell(parts, 0)),
+                title=esc(_cell(parts, 5)),
+                page=esc(page_info),
+                date=esc(date_info),
+                time=esc(time_info),
+            ))
+            continue
+        # Date and time lines are already in the header
+        if i in (1, 2):
+            continue
+
+        leading_comma = line_str.startswith(',')
+
+        # Table headers only ever start with text, so skip the substring tests for comma rows
+        if not leading_comma and 'Facility' in line_str and 'Part Number' in line_str:
+            append(_PART_INFO_OPEN)
+            append(''.join(_TH(esc(cell)) for cell in parts[:PART_INFO_COLUMNS] if cell.strip()))
+            append(_HEAD_CLOSE)
+
+        elif not leading_comma and 'Op' in line_str and 'Work Center' in line_str:
+            append(_OPERATIONS_OPEN)
+            append(''.join(_TH(esc(cell)) for cell in parts[:OPERATION_COLUMNS] if cell.strip()))
+            append(_HEAD_CLOSE)
+            in_operations_table = True
+
+        # Totals rows - always 11 columns, padded with empty cells
+        elif line_str.startswith('Totals'):
+            padded = parts + [''] * (OPERATION_COLUMNS - len(parts))
+            append('<tr class="totals-row">')
+            append(''.join(
+                _TD_STRONG(esc(cell)) if cell.strip() else _TD_EMPTY
+                for cell in padded[:OPERATION_COLUMNS]
+            ))
+            append('</tr>')
+
+        elif 'End of Report' in line_str:
+            append(_END_OF_REPORT)
+
+        # Footer message (last line)
+        elif i == last and len(parts) > 5:
+            if parts[5]:
+                append(_FOOTER_TEXT(esc(parts[5])))
+
+        # Data rows
+        elif not leading_comma and parts and parts[0].strip():
+            columns = OPERATION_COLUMNS if in_operations_table else PART_INFO_COLUMNS
+            append('<tr>')
+            append(''.join(_TD(esc(cell)) for cell in parts[:columns]))
+            append('</tr>')
+
+        # Instruction rows (start with comma)
+        elif leading_comma and len(parts) > 1 and parts[1].strip():
+            colspan = OPERATION_COLUMNS if in_operations_table else PART_INFO_COLUMNS
+            append(_INSTRUCTION_ROW(colspan=colspan, text=esc(parts[1])))
+
+    append('</div>')
+    return ''.join(out)
+
+
+def router_hash(csv_text):
+    """Content hash used as the render cache key"""
+    return hashlib.sha1(csv_text.encode('utf-8')).hexdigest()
+
+
+def csv_to_html(csv_text):
+    """Convert CSV to HTML table for display - M2M Format (memoized)"""
+    key = router_hash(csv_text)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            return cached
+
+    with profile_request('render', {'router_hash': key}):
+        rendered = _render(csv_text)
+
+    with _cache_lock:
+        _cache[key] = rendered
+        if len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return rendered
+
+
+def clear_render_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def price_breaks_to_html(rows):
+    """Side-by-side price-break comparison from price_break_rows() output"""
+    esc = html.escape
+    if not rows:
+        return ''
+    quantities = [row['quantity'] for row in rows]
+    out = ['<div class="router-output"><table class="operations-table"><thead><tr>',
+           _TH('Op'), _TH('Work Center'), _TH('Setup Hours')]
+    out += [_TH(f'Run Hours @ {quantity}') for quantity in quantities]
+    out.append(_HEAD_CLOSE)
+
+    # Every quantity comes from the same generated router, so the operations line up
+    for index, op in enumerate(rows[0]['operations']):
+        out.append('<tr>')
+        out += [_TD(esc(str(op['op']))), _TD(esc(op['work_center'])), _TD(f"{op['setup_hours']:.2f}")]
+        out += [_TD(f"{row['operations'][index]['run_hours']:.2f}") for row in rows]
+        out.append('</tr>')
+
+    summary = [
+        ('Totals', 'total_run', '{:.2f}'),
+        ('Totals per Unit', 'per_unit_run', '{:.4f}'),
+        ('Hours per Unit', 'per_unit_total', '{:.4f}'),
+    ]
+    for label, key, fmt in summary:
+        out.append('<tr class="totals-row">')
+        setup = rows[0]['total_setup'] if key == 'total_run' else None
+        out += [_TD_STRONG(label), _TD_EMPTY, _TD_STRONG(f'{setup:.2f}') if setup is not None else _TD_EMPTY]
+        out += [_TD_STRONG(fmt.format(row[key])) for row in rows]
+        out.append('</tr>')
+    out.append('</tbody></table></div>')
+    return ''.join(out)
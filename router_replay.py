@@ -0,0 +1,122 @@
+"""
+MAC Router Generator - Record / Replay
+Saves raw model responses by request fingerprint and serves them back without the network
+"""
+
+from datetime import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+
+# off | record | replay
+RECORD_MODE = os.environ.get("ROUTER_RECORD_MODE", "off").strip().lower()
+FIXTURE_DIR = os.environ.get("ROUTER_FIXTURE_DIR", os.path.join("fixtures", "recordings"))
+
+
+class ReplayMiss(Exception):
+    """No recording exists for a request fingerprint"""
+
+
+def fingerprint_key(fingerprint):
+    """Stable file key for a fingerprint dict"""
+    payload = json.dumps(fingerprint, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+class FixtureStore:
+    """One JSON file per request fingerprint in a local directory"""
+
+    def __init__(self, directory=FIXTURE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def _path(self, fingerprint):
+        return os.path.join(self.directory, fingerprint_key(fingerprint) + ".json")
+
+    def save(self, fingerprint, raw_text, latency, usage):
+        record = {
+            'fingerprint': fingerprint,
+            'raw_text': raw_text,
+            'latency': latency,
+            'usage': usage,
+            'recorded_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        path = self._path(fingerprint)
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            # Write then rename so a replaying reader never sees half a file
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(record, f, indent=2)
+            os.replace(tmp_path, path)
+        return path
+
+    def load(self, fingerprint):
+        path = self._path(fingerprint)
+        if not os.path.exists(path):
+            raise ReplayMiss(f"No recording for {fingerprint}")
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def records(self):
+        """Every recording in the store"""
+        if not os.path.isdir(self.directory):
+            return []
+        found = []
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(".json"):
+                with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                    found.append(json.load(f))
+        return found
+
+
+class RecordingBackend:
+    """Wraps a live backend and saves every raw response it returns"""
+
+    name = "record"
+
+    def __init__(self, inner, store):
+        self.inner = inner
+        self.store = store
+
+    def upload(self, drawing, api_key):
+        return self.inner.upload(drawing, api_key)
+
+    def generate(self, uploaded, prompt, model_name, session_id, fingerprint):
+        t0 = time.monotonic()
+        raw_text, usage = self.inner.generate(uploaded, prompt, model_name, session_id, fingerprint)
+        self.store.save(fingerprint, raw_text, time.monotonic() - t0, usage)
+        return raw_text, usage
+
+
+class ReplayBackend:
+    """Serves recorded responses back through the generation path - no network, no quota"""
+
+    name = "replay"
+
+    def __init__(self, store, simulate_latency=False):
+        self.store = store
+        # Sleep for the recorded latency so timing benchmarks see realistic waits
+        self.simulate_latency = simulate_latency
+
+    def upload(self, drawing, api_key):
+        return None
+
+    def generate(self, uploaded, prompt, model_name, session_id, fingerprint):
+        record = self.store.load(fingerprint)
+        if self.simulate_latency:
+            time.sleep(record.get('latency', 0.0))
+        return record['raw_text'], record.get('usage', {})
+
+
+def backend_for_mode(live_backend, mode=None, store=None):
+    """Wrap or replace the live backend according to the record mode"""
+    mode = mode or RECORD_MODE
+    if mode == "record":
+        return RecordingBackend(live_backend, store or FixtureStore())
+    if mode == "replay":
+        return ReplayBackend(store or FixtureStore(),
+                             simulate_latency=os.environ.get("ROUTER_REPLAY_LATENCY") == "1")
+    return live_backend
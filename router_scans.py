@@ -0,0 +1,209 @@
+"""
+MAC Router Generator - Scanned Drawings
+Image drawings (TIFF/PNG/JPEG scans) deskewed, cropped, converted to grayscale and downscaled locally before upload
+"""
+
+import io
+import os
+import threading
+
+from router_intake import spool_drawing
+
+# Resolution drawings are sent at - plenty for title blocks and dimensions
+TARGET_DPI = int(os.environ.get("ROUTER_SCAN_DPI", "200"))
+# Longest edge in pixels when a scan carries no DPI (or an implausible one)
+MAX_EDGE = int(os.environ.get("ROUTER_SCAN_MAX_EDGE", "4096"))
+# Large-format plotter scans are legitimately bigger than Pillow's decompression-bomb default
+MAX_PIXELS = int(os.environ.get("ROUTER_SCAN_MAX_PIXELS", str(400 * 1000 * 1000)))
+# Skew search range and the smallest correction worth resampling for, in degrees
+MAX_SKEW = 5.0
+MIN_SKEW = 0.2
+# Pixels darker than this count as ink when cropping
+INK_THRESHOLD = 200
+
+IMAGE_MIME_TYPES = {'image/tiff', 'image/png', 'image/jpeg'}
+# Types the model accepts as they are; TIFF always has to be converted
+_UPLOADABLE = {'image/png', 'image/jpeg'}
+
+
+def load_pil():
+    """Pillow's Image module, imported on first use; None when it isn't installed (scans go up as is)"""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+    return Image
+
+
+def is_scan(mime_type):
+    return mime_type in IMAGE_MIME_TYPES
+
+
+def _row_profile_score(image, Image):
+    """Variance of per-row ink - highest when text lines and borders are level"""
+    rows = list(image.resize((1, image.height), resample=Image.BOX).getdata())
+    mean = sum(rows) / len(rows)
+    return sum((value - mean) ** 2 for value in rows)
+
+
+def estimate_skew(gray, Image):
+    """Rotation in degrees that levels the drawing, found on a small thresholded copy"""
+    small = gray.copy()
+    small.thumbnail((800, 800))
+    ink = small.point(lambda value: 255 if value < 128 else 0)
+
+    def score(angle):
+        return _row_profile_score(ink.rotate(angle, resample=Image.BILINEAR, fillcolor=0), Image)
+
+    # Coarse pass in whole degrees, then tenths around the best
+    best = max((score(a), a) for a in range(-int(MAX_SKEW), int(MAX_SKEW) + 1))[1]
+    fine = [best + tenth / 10.0 for tenth in range(-9, 10)]
+    return max((score(a), a) for a in fine)[1]
+
+
+def _scale_for(image):
+    """Downscale factor to TARGET_DPI (or MAX_EDGE when the DPI is unknown)"""
+    dpi = image.info.get('dpi')
+    source_dpi = float(dpi[0]) if dpi and dpi[0] else 0.0
+    if 72 <= source_dpi <= 2400:
+        scale = TARGET_DPI / source_dpi
+    else:
+        scale = 1.0
+    scale = min(scale, MAX_EDGE / max(image.size))
+    return min(scale, 1.0)
+
+
+def clean_page(image, Image):
+    """One page: grayscale, downscale, deskew and crop to the drawn area; returns (image, skew degrees)"""
+    scale = _scale_for(image)
+    target = (max(int(image.width * scale), 1), max(int(image.height * scale), 1))
+    if image.format == 'JPEG' and scale < 1.0:
+        # Decode straight at (at least) the target size - much faster than a full decode and resize
+        image.draft('L', target)
+    gray = image.convert('L')
+    if gray.width > target[0]:
+        gray = gray.resize(target, resample=Image.LANCZOS)
+
+    skew = estimate_skew(gray, Image)
+    if abs(skew) >= MIN_SKEW:
+        gray = gray.rotate(skew, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    else:
+        skew = 0.0
+
+    bbox = gray.point(lambda value: 255 if value < INK_THRESHOLD else 0).getbbox()
+    if bbox:
+        margin = max(gray.width, gray.height) // 100
+        left, top, right, bottom = bbox
+        gray = gray.crop((max(left - margin, 0), max(top - margin, 0),
+                          min(right + margin, gray.width), min(bottom + margin, gray.height)))
+    return gray, skew
+
+
+def _encode(pages, dpi):
+    """Smallest encoding the model accepts: (bytes, mime type); several pages become one PDF"""
+    if len(pages) > 1:
+        buffer = io.BytesIO()
+        pages[0].save(buffer, format='PDF', save_all=True, append_images=pages[1:], resolution=dpi)
+        return buffer.getvalue(), 'application/pdf'
+    candidates = []
+    for fmt, mime_type, options in (('PNG', 'image/png', {'compress_level': 9}),
+                                    ('JPEG', 'image/jpeg', {'quality': 85})):
+        buffer = io.BytesIO()
+        pages[0].save(buffer, format=fmt, dpi=(dpi, dpi), **options)
+        candidates.append((len(buffer.getvalue()), buffer.getvalue(), mime_type))
+    _, data, mime_type = min(candidates)
+    return data, mime_type
+
+
+def preprocess_scan(handle):
+    """
+    Clean up a scanned drawing: returns (bytes, mime type, info) where info has the page count,
+    pixel sizes and skew corrected per page
+    """
+    Image = load_pil()
+    image = Image.open(handle)
+    original_size = image.size
+    pages = []
+    skews = []
+    for index in range(getattr(image, 'n_frames', 1)):
+        image.seek(index)
+        page, skew = clean_page(image, Image)
+        pages.append(page)
+        skews.append(round(skew, 1))
+    data, mime_type = _encode(pages, TARGET_DPI)
+    info = {
+        'pages': len(pages),
+        'original_pixels': original_size,
+        'processed_pixels': pages[0].size,
+        'skew': skews,
+    }
+    return data, mime_type, info
+
+
+def preprocess_drawing(drawing):
+    """
+    (drawing to upload, info) for a spooled drawing - image scans are cleaned into a new spooled drawing
+    (the original is closed); PDFs and anything Pillow can't read come back unchanged with info None
+    """
+    if not is_scan(drawing.mime_type) or load_pil() is None:
+        return drawing, None
+    try:
+        data, mime_type, info = preprocess_scan(drawing.reader())
+    except Exception:
+        # An unreadable image still goes to the model (PNG/JPEG) or fails there with its own error
+        return drawing, None
+    if mime_type == drawing.mime_type and len(data) >= drawing.size and drawing.mime_type in _UPLOADABLE:
+        # Already a compact scan - cleanup would only add bytes
+        info.update(original_bytes=drawing.size, processed_bytes=drawing.size, mime_type=drawing.mime_type)
+        return drawing, info
+
+    stem = os.path.splitext(drawing.name or "drawing")[0]
+    extension = {'image/png': ".png", 'image/jpeg': ".jpg", 'application/pdf': ".pdf"}[mime_type]
+    processed = spool_drawing(data, drawing.session_id, name=stem + extension, mime_type=mime_type,
+                              budget=drawing.budget)
+    info.update(original_bytes=drawing.size, processed_bytes=processed.size, mime_type=mime_type)
+    drawing.close()
+    return processed, info
+
+
+def savings_text(info):
+    """'24.1 MB -> 410 KB (98% smaller)' style summary of one preprocessed scan"""
+    def size(nbytes):
+        if nbytes >= 1024 * 1024:
+            return f"{nbytes / (1024 * 1024):.1f} MB"
+        return f"{nbytes / 1024:.0f} KB"
+    saved = 1 - info['processed_bytes'] / info['original_bytes'] if info['original_bytes'] else 0.0
+    text = f"{size(info['original_bytes'])} -> {size(info['processed_bytes'])} ({saved:.0%} smaller)"
+    skews = [s for s in info['skew'] if s]
+    if skews:
+        text += f", deskewed {', '.join(f'{s:+.1f}' for s in skews)} deg"
+    return text
+
+
+class ScanStats:
+    """Process-wide byte savings from scan preprocessing"""
+
+    def __init__(self):
+        self.files = 0
+        self.original_bytes = 0
+        self.processed_bytes = 0
+        self._lock = threading.Lock()
+
+    def record(self, info):
+        with self._lock:
+            self.files += 1
+            self.original_bytes += info['original_bytes']
+            self.processed_bytes += info['processed_bytes']
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'files': self.files,
+                'original_bytes': self.original_bytes,
+                'processed_bytes': self.processed_bytes,
+                'saved_bytes': self.original_bytes - self.processed_bytes,
+            }
+
+
+scan_stats = ScanStats()
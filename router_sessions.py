@@ -0,0 +1,275 @@
+"""
+MAC Router Generator - Session Store
+Chat history and router state persisted in SQLite per session, read back a page at a time
+
+A session id is a bearer token and the only thing protecting a conversation: anyone holding the URL with it
+can read the full router history. Ids are random (secrets.token_urlsafe), never derived from anything
+predictable, and must never be logged. A conversation is only reopened from an id this store issued.
+"""
+
+from datetime import datetime, timedelta
+import json
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+
+SESSION_DB = os.environ.get("ROUTER_SESSION_DB", "router_sessions.db")
+# Sessions untouched for this many days are deleted
+RETENTION_DAYS = int(os.environ.get("ROUTER_SESSION_RETENTION_DAYS", "30"))
+# Messages shown per "page" of chat history
+PAGE_SIZE = 20
+# Seconds between retention sweeps
+_PRUNE_INTERVAL = 3600
+# Random bytes per session id (URL-safe base64: 43 characters)
+SESSION_TOKEN_BYTES = 32
+_SESSION_TOKEN = re.compile(r'[A-Za-z0-9_-]{43}')
+
+
+def new_session_id():
+    """Fresh, unguessable session id"""
+    return secrets.token_urlsafe(SESSION_TOKEN_BYTES)
+
+
+class SessionStore:
+    """Sessions and their messages in one SQLite file shared by every worker process"""
+
+    def __init__(self, path=SESSION_DB, retention_days=RETENTION_DAYS):
+        self.path = path
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, created_at TEXT, updated_at TEXT, state TEXT)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "session_id TEXT, seq INTEGER, role TEXT, content TEXT, routers TEXT, created_at TEXT, "
+                "PRIMARY KEY (session_id, seq))"
+            )
+        self.prune()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def _touch(self, conn, session_id):
+        now = datetime.now().isoformat(timespec='seconds')
+        conn.execute(
+            "INSERT INTO sessions (session_id, created_at, updated_at, state) VALUES (?, ?, ?, NULL) "
+            "ON CONFLICT(session_id) DO UPDATE SET updated_at = excluded.updated_at",
+            (session_id, now, now)
+        )
+
+    def history(self, session_id):
+        return ChatHistory(self, session_id)
+
+    def has_session(self, session_id):
+        """True for an id this store issued and still holds - anything else must not open a conversation"""
+        if not session_id or not _SESSION_TOKEN.fullmatch(session_id):
+            return False
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        finally:
+            conn.close()
+        return row is not None
+
+    def append_message(self, session_id, message):
+        """Store a message at the end of the session; returns its index"""
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    self._touch(conn, session_id)
+                    seq = conn.execute(
+                        "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE session_id = ?", (session_id,)
+                    ).fetchone()[0]
+                    conn.execute(
+                        "INSERT INTO messages (session_id, seq, role, content, routers, created_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (session_id, seq, message['role'], message['content'],
+                         json.dumps(message.get('routers', [])), datetime.now().isoformat(timespec='seconds'))
+                    )
+                return seq
+            finally:
+                conn.close()
+
+    def update_message(self, session_id, seq, message):
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    self._touch(conn, session_id)
+                    conn.execute(
+                        "UPDATE messages SET role = ?, content = ?, routers = ? WHERE session_id = ? AND seq = ?",
+                        (message['role'], message['content'], json.dumps(message.get('routers', [])),
+                         session_id, seq)
+                    )
+            finally:
+                conn.close()
+
+    def messages(self, session_id, start, stop):
+        """Messages with start <= index < stop, oldest first"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT role, content, routers FROM messages WHERE session_id = ? AND seq >= ? AND seq < ? "
+                "ORDER BY seq", (session_id, start, stop)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [{'role': role, 'content': content, 'routers': json.loads(routers or "[]")}
+                for role, content, routers in rows]
+
+    def message_count(self, session_id, role=None):
+        conn = self._connect()
+        try:
+            if role is None:
+                row = conn.execute("SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)).fetchone()
+            else:
+                row = conn.execute(
+                    "SELECT COUNT(*) FROM messages WHERE session_id = ? AND role = ?", (session_id, role)
+                ).fetchone()
+        finally:
+            conn.close()
+        return row[0]
+
+    def routers(self, session_id):
+        """Every router CSV attached to the session's messages"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT routers FROM messages WHERE session_id = ? AND routers != '[]' ORDER BY seq", (session_id,)
+            ).fetchall()
+        finally:
+            conn.close()
+        found = []
+        for (routers,) in rows:
+            found.extend(json.loads(routers))
+        return found
+
+    def clear_messages(self, session_id):
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            finally:
+                conn.close()
+
+    def save_state(self, session_id, state):
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    self._touch(conn, session_id)
+                    conn.execute("UPDATE sessions SET state = ? WHERE session_id = ?",
+                                 (json.dumps(state), session_id))
+            finally:
+                conn.close()
+        if time.monotonic() - self._last_prune > _PRUNE_INTERVAL:
+            self.prune()
+
+    def load_state(self, session_id):
+        """The session's saved state dict, or None for a new session"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT state FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        finally:
+            conn.close()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def prune(self):
+        """Delete sessions (and their messages) not updated within the retention period"""
+        self._last_prune = time.monotonic()
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).isoformat(timespec='seconds')
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(
+                        "DELETE FROM messages WHERE session_id IN "
+                        "(SELECT session_id FROM sessions WHERE updated_at < ?)", (cutoff,)
+                    )
+                    deleted = conn.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,)).rowcount
+            finally:
+                conn.close()
+        return deleted
+
+
+class ChatHistory:
+    """
+    List-like view of one session's messages backed by the store - nothing is held in memory
+    Supports append, len, indexing and item assignment like the plain list it replaces
+    """
+
+    def __init__(self, store, session_id):
+        self.store = store
+        self.session_id = session_id
+
+    def append(self, message):
+        self.store.append_message(self.session_id, message)
+
+    def __len__(self):
+        return self.store.message_count(self.session_id)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        found = self.store.messages(self.session_id, index, index + 1)
+        if not found:
+            raise IndexError("message index out of range")
+        return found[0]
+
+    def __setitem__(self, index, message):
+        if index < 0:
+            index += len(self)
+        self.store.update_message(self.session_id, index, message)
+
+    def __iter__(self):
+        # Page through rather than loading the whole conversation
+        start = 0
+        while True:
+            page = self.store.messages(self.session_id, start, start + PAGE_SIZE)
+            yield from page
+            if len(page) < PAGE_SIZE:
+                return
+            start += PAGE_SIZE
+
+    def tail(self, count):
+        """The last count messages, oldest first"""
+        total = len(self)
+        return self.store.messages(self.session_id, max(total - count, 0), total)
+
+    def count_role(self, role):
+        return self.store.message_count(self.session_id, role)
+
+    def routers(self):
+        return self.store.routers(self.session_id)
+
+    def clear(self):
+        self.store.clear_messages(self.session_id)
+
+    def save_state(self, state):
+        self.store.save_state(self.session_id, state)
+
+    def load_state(self):
+        return self.store.load_state(self.session_id)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """Process-wide session store (opened, and swept for expired sessions, on first use)"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SessionStore()
+        return _store
@@ -0,0 +1,216 @@
+"""
+MAC Router Generator - Near-Duplicate Drawings
+Perceptual hashes of rendered pages plus title-block text, matched against previously generated routers
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+import os
+import re
+import sqlite3
+import threading
+
+from router_deps import load_pdfium
+from router_packages import page_part_number
+from router_scans import is_scan, load_pil
+
+SIMILARITY_ENABLED = os.environ.get("ROUTER_SIMILARITY", "1") != "0"
+SIMILARITY_DB = os.environ.get("ROUTER_SIMILARITY_DB", "router_history.db")
+# Minimum score for a prior router to be offered instead of generating
+MATCH_THRESHOLD = float(os.environ.get("ROUTER_SIMILARITY_THRESHOLD", "0.85"))
+# Only the first few sheets are hashed - later sheets are usually details and sections
+HASH_PAGES = 4
+# dHash grid size: 16 gives 256-bit hashes, fine enough to tell apart parts drawn on the same template
+HASH_SIZE = 16
+# Page width in pixels before hashing - low resolution keeps rendering cheap
+RENDER_WIDTH = 256
+IMAGE_WEIGHT = 0.6
+# Drawings kept in memory for matching; the least recently routed or matched are dropped first
+MAX_ENTRIES = int(os.environ.get("ROUTER_SIMILARITY_MAX_ENTRIES", "5000"))
+
+_TOKEN = re.compile(r'[A-Z0-9][A-Z0-9./-]*[A-Z][A-Z0-9./-]*|[A-Z]{3,}')
+
+
+def dhash(image, size=HASH_SIZE):
+    """Difference hash of a PIL image: one bit per horizontally adjacent pixel pair"""
+    pixels = list(image.convert("L").resize((size + 1, size)).getdata())
+    bits = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+
+def drawing_features(drawing):
+    """
+    {'digest', 'part_number', 'tokens', 'phashes'} for a spooled, pre-flighted drawing
+    tokens are the words of the first sheet (title block included); phashes one per hashed page
+    Everything is read from the spooled handle - the hash is the one taken while spooling
+    """
+    features = {
+        'digest': drawing.digest,
+        'part_number': None,
+        'tokens': [],
+        'phashes': [],
+    }
+    if is_scan(drawing.mime_type):
+        # Image scans hash the picture itself
+        Image = load_pil()
+        if Image is not None:
+            try:
+                image = Image.open(drawing.reader())
+                image.draft('L', (RENDER_WIDTH, RENDER_WIDTH))
+                image.thumbnail((RENDER_WIDTH, RENDER_WIDTH))
+                features['phashes'].append(dhash(image))
+            except Exception:
+                pass
+        return features
+
+    # Rendering and text extraction are optional - with neither installed only exact duplicates match
+    # The page text is the drawing's own, extracted once and shared with package splitting
+    texts = drawing.page_texts()
+    if texts:
+        features['part_number'] = page_part_number(texts[0])
+        features['tokens'] = sorted(set(_TOKEN.findall(texts[0])))
+    pdfium = load_pdfium()
+    if pdfium is not None:
+        try:
+            pdf = pdfium.PdfDocument(drawing.reader())
+            try:
+                for index in range(min(len(pdf), HASH_PAGES)):
+                    page = pdf[index]
+                    image = page.render(scale=RENDER_WIDTH / max(page.get_width(), 1)).to_pil()
+                    features['phashes'].append(dhash(image))
+            finally:
+                pdf.close()
+        except Exception:
+            pass
+    return features
+
+
+def similarity(a, b):
+    """0..1 match score between two feature dicts"""
+    if a['digest'] == b['digest']:
+        return 1.0
+    text_score = None
+    if a['tokens'] and b['tokens']:
+        ta, tb = set(a['tokens']), set(b['tokens'])
+        text_score = len(ta & tb) / len(ta | tb)
+        # A reissued revision keeps its part number even when notes and dimensions change
+        if a['part_number'] and a['part_number'] == b['part_number']:
+            text_score = max(text_score, 0.95)
+    image_score = None
+    pages = min(len(a['phashes']), len(b['phashes']))
+    if pages:
+        bits = HASH_SIZE * HASH_SIZE
+        image_score = sum(
+            1.0 - (a['phashes'][i] ^ b['phashes'][i]).bit_count() / bits for i in range(pages)
+        ) / pages
+    if text_score is not None and image_score is not None:
+        return IMAGE_WEIGHT * image_score + (1.0 - IMAGE_WEIGHT) * text_score
+    if image_score is not None:
+        return image_score
+    return text_score or 0.0
+
+
+class DrawingIndex:
+    """Features and routers of previously generated drawings in SQLite, the most recent scanned in memory"""
+
+    def __init__(self, path=SIMILARITY_DB, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._last_rowid = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS drawings ("
+                "digest TEXT PRIMARY KEY, part_number TEXT, tokens TEXT, phashes TEXT, "
+                "router_csv TEXT, quantity INTEGER, model TEXT, created_at TEXT)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def _refresh(self):
+        """Pull in rows added since the last scan (other workers share the file)"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT rowid, digest, part_number, tokens, phashes, router_csv, quantity, model, created_at "
+                "FROM drawings WHERE rowid > ? ORDER BY rowid", (self._last_rowid,)
+            ).fetchall()
+        finally:
+            conn.close()
+        for rowid, digest, part_number, tokens, phashes, router_csv, quantity, model, created_at in rows:
+            # A re-routed drawing comes back under a new rowid - it moves to the most recent end
+            self._entries.pop(digest, None)
+            self._entries[digest] = {
+                'digest': digest,
+                'part_number': part_number,
+                'tokens': tokens.split() if tokens else [],
+                'phashes': [int(h, 16) for h in phashes.split(',')] if phashes else [],
+                'router_csv': router_csv,
+                'quantity': quantity,
+                'model': model,
+                'created_at': created_at,
+            }
+            self._last_rowid = rowid
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def add(self, features, router_csv, quantity, model_name):
+        """Remember a generated router under its drawing's features"""
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    # Taken before the delete: a re-routed drawing that was the newest row would otherwise get
+                    # its old rowid back, and _refresh() (rowid > last seen) would never pick up the new router
+                    rowid = conn.execute("SELECT COALESCE(MAX(rowid), 0) + 1 FROM drawings").fetchone()[0]
+                    conn.execute("DELETE FROM drawings WHERE digest = ?", (features['digest'],))
+                    conn.execute(
+                        "INSERT INTO drawings (rowid, digest, part_number, tokens, phashes, router_csv, quantity, "
+                        "model, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (rowid, features['digest'], features['part_number'], " ".join(features['tokens']),
+                         ",".join(f"{h:x}" for h in features['phashes']), router_csv, quantity, model_name,
+                         datetime.now().isoformat(timespec='seconds'))
+                    )
+            finally:
+                conn.close()
+
+    def find(self, features, threshold=MATCH_THRESHOLD):
+        """Best prior drawing scoring at least threshold, as its entry plus 'score'; None if no match"""
+        with self._lock:
+            self._refresh()
+            entries = list(self._entries.values())
+        best, best_score = None, threshold
+        for entry in entries:
+            score = similarity(features, entry)
+            if score >= best_score:
+                best, best_score = entry, score
+        if best is None:
+            return None
+        with self._lock:
+            if best['digest'] in self._entries:
+                self._entries.move_to_end(best['digest'])
+        return dict(best, score=best_score)
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._entries)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_drawing_index():
+    """Process-wide drawing index (opened on first use)"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = DrawingIndex()
+        return _index
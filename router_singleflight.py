@@ -0,0 +1,53 @@
+"""
+MAC Router Generator - Single-Flight Deduplication
+Identical generations already in flight share one model call and one result
+"""
+
+from concurrent.futures import Future
+import threading
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key onto the first caller's future"""
+
+    def __init__(self):
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """Run fn() once per key at a time; concurrent callers wait and get the same result"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = Future()
+                self._inflight[key] = future
+                self.leaders += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._inflight)
+
+
+# Process-wide instance shared by every session
+generation_flights = SingleFlight()
@@ -0,0 +1,207 @@
+"""
+MAC Router Generator - Router Validation
+Row-level checks on a model response and the small follow-up prompt that repairs only the defective rows
+"""
+
+import csv
+import json
+import os
+import re
+
+from router_model import MISSING_INSTRUCTION, default_instruction
+
+# Repair round trips per generation before falling back to the cleanup defaults
+REPAIR_ATTEMPTS = int(os.environ.get("ROUTER_REPAIR_ATTEMPTS", "1"))
+
+# Plausible minutes per piece per work center - a little wider than the knowledge base ranges,
+# so only clearly wrong rows (a 40 min/pc lathe op, a SUB-PL with run time) go back to the model
+MINUTES_RANGES = {
+    # A bar-stock cutoff on a long run can be a second or two a piece (Z110001B045: 0.03 hrs for 115)
+    'SAW': (0.0, 5.0),
+    'WATERJT': (0.5, 30.0),
+    'BEND': (0.1, 10.0),
+    'CNC-L': (0.5, 5.0),
+    'CNC-M': (0.5, 15.0),
+    'WELD': (2.0, 300.0),
+    'PAINT': (0.0, 30.0),
+    'SUB-PL': (0.0, 0.0),
+    'ASSY-PP': (0.5, 15.0),
+}
+KNOWN_WORK_CENTERS = set(MINUTES_RANGES)
+# Below this quantity run time isn't checked against the ranges - one-offs and prototypes carry the
+# fixturing and fitting a production run spreads out (2651C2858-1: 2 hrs of CNC-M for 1 pc)
+MIN_RANGE_QUANTITY = int(os.environ.get("ROUTER_MIN_RANGE_QUANTITY", "5"))
+# Setup hours above this are a misplaced decimal, not a real setup
+MAX_SETUP_HOURS = 8.0
+
+# Title-block text the model sometimes echoes back instead of a part number
+_PLACEHOLDER = re.compile(r'^\[.*\]$|^(?:UNKNOWN|N/?A|NONE|TBD|PART\s*#?)$', re.IGNORECASE)
+
+
+def _number(value):
+    """float for a numeric value or numeric string, None otherwise"""
+    if isinstance(value, bool):
+        return None
+    try:
+        number = float(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+    return None if number != number else number
+
+
+def _text(value):
+    return re.sub(r'\s+', ' ', str(value or '')).strip()
+
+
+def payload_from_csv(raw_text, quantity):
+    """
+    Compact-style payload read from a full CSV response, keeping every operation row as written
+    (nothing dropped, nothing defaulted) so the validator sees what the model actually said
+    Returns None when no operation rows are found
+    """
+    text = raw_text.strip()
+    if '```' in text:
+        text = text.split('```csv')[-1].split('```')[0].strip()
+    rows = list(csv.reader(text.split('\n')))
+    payload = {'part_number': '', 'rev': '0', 'description': '', 'operations': []}
+    last_op_index = -2
+    for i, parts in enumerate(rows):
+        if not parts:
+            continue
+        first = parts[0].strip()
+        if first == 'Facility' and i + 1 < len(rows):
+            info = rows[i + 1] + [''] * 6
+            payload['part_number'] = _text(info[1])
+            payload['rev'] = _text(info[2]) or '0'
+            payload['description'] = _text(info[3])
+        elif first.isdigit():
+            fields = parts + [''] * 10
+            run_hours = _number(fields[5])
+            payload['operations'].append({
+                'work_center': _text(fields[1]).upper(),
+                'description': _text(fields[2]),
+                'setup_hours': fields[4].strip(),
+                # Back to per-piece minutes so the range check is the same for both formats
+                'minutes_per_piece': run_hours * 60.0 / quantity if run_hours is not None and quantity
+                else fields[5].strip(),
+                'instruction': '',
+            })
+            last_op_index = i
+        elif i == last_op_index + 1 and first == '' and len(parts) > 1:
+            payload['operations'][-1]['instruction'] = _text(parts[1])
+    return payload if payload['operations'] else None
+
+
+def find_defects(payload, quantity=None):
+    """
+    Defective fields of a payload: [{'row': operation index or None for the header, 'field', 'problem'}]
+    An empty list means the router can be used as is
+    """
+    # Run hours in a CSV carry two decimals, so min/pc read back from them is only this close
+    tolerance = 0.3 / quantity if quantity else 0.0
+    defects = []
+    part_number = _text(payload.get('part_number'))
+    if not part_number or _PLACEHOLDER.match(part_number):
+        defects.append({'row': None, 'field': 'part_number', 'problem': "missing part number"})
+
+    for index, op in enumerate(payload.get('operations') or []):
+        if not isinstance(op, dict):
+            defects.append({'row': index, 'field': 'operation', 'problem': "not an operation object"})
+            continue
+        work_center = _text(op.get('work_center')).upper()
+        if work_center not in KNOWN_WORK_CENTERS:
+            defects.append({'row': index, 'field': 'work_center',
+                            'problem': f"unknown work center {work_center or '(blank)'}"})
+
+        setup = _number(op.get('setup_hours'))
+        if setup is None:
+            defects.append({'row': index, 'field': 'setup_hours',
+                            'problem': f"non-numeric setup hours {op.get('setup_hours')!r}"})
+        elif not 0 <= setup <= MAX_SETUP_HOURS:
+            defects.append({'row': index, 'field': 'setup_hours', 'problem': f"setup hours {setup:g} out of range"})
+
+        minutes = _number(op.get('minutes_per_piece'))
+        if minutes is None:
+            defects.append({'row': index, 'field': 'minutes_per_piece',
+                            'problem': f"non-numeric run time {op.get('minutes_per_piece')!r}"})
+        elif minutes < 0:
+            defects.append({'row': index, 'field': 'minutes_per_piece', 'problem': f"negative run time {minutes:g}"})
+        elif work_center in MINUTES_RANGES and (quantity is None or quantity >= MIN_RANGE_QUANTITY):
+            low, high = MINUTES_RANGES[work_center]
+            if not low - tolerance <= minutes <= high + tolerance:
+                defects.append({'row': index, 'field': 'minutes_per_piece',
+                                'problem': f"{minutes:g} min/pc outside {low:g}-{high:g} for {work_center}"})
+
+        # Work centers with a template get it filled in locally; others would show a placeholder
+        if not _text(op.get('instruction')) and default_instruction(work_center) == MISSING_INSTRUCTION:
+            defects.append({'row': index, 'field': 'instruction', 'problem': "missing instruction"})
+    return defects
+
+
+def describe_defects(defects):
+    """One line per defect, for logs and the repair prompt"""
+    lines = []
+    for defect in defects:
+        where = "Header" if defect['row'] is None else f"Operation {(defect['row'] + 1) * 10}"
+        lines.append(f"{where}: {defect['problem']}")
+    return lines
+
+
+def build_repair_prompt(payload, defects, quantity):
+    """Follow-up prompt that asks for corrected versions of only the defective rows"""
+    rows = sorted({d['row'] for d in defects if d['row'] is not None})
+    current = {
+        'part_number': payload.get('part_number', ''),
+        'operations': [dict(op, index=index) for index, op in enumerate(payload.get('operations') or [])
+                       if isinstance(op, dict)],
+    }
+    problems = "\n".join(f"- {line}" for line in describe_defects(defects))
+    ranges = ", ".join(f"{wc} {low:g}-{high:g}" for wc, (low, high) in MINUTES_RANGES.items())
+    return f"""You produced this router for {quantity} pieces of the attached drawing:
+{json.dumps(current, indent=1)}
+
+These fields are wrong:
+{problems}
+
+Look at the drawing again and fix ONLY these problems. Return ONLY a JSON object:
+{{"part_number": "[PART# from the title block]",
+ "operations": [{{"index": [index of the corrected operation], "work_center": "...", "description": "...",
+   "setup_hours": 0.0, "minutes_per_piece": 0.0, "instruction": "..."}}]}}
+
+Rules:
+- Include only the operations listed above ({', '.join(str(r) for r in rows) or 'none'}), keeping their index
+- work_center is one of: {', '.join(sorted(KNOWN_WORK_CENTERS))}
+- setup_hours and minutes_per_piece are plain numbers; typical min/pc: {ranges}
+- Use the instruction templates from the examples
+"""
+
+
+def apply_repair(payload, raw_text):
+    """
+    Merge a repair response into the payload; returns the repaired copy (the original if the
+    response can't be read)
+    """
+    text = raw_text.strip()
+    if text.startswith('```'):
+        text = text.split('\n', 1)[-1].rsplit('```', 1)[0].strip()
+    try:
+        fix = json.loads(text)
+    except ValueError:
+        return payload
+    if not isinstance(fix, dict):
+        return payload
+
+    repaired = dict(payload, operations=[dict(op) if isinstance(op, dict) else op
+                                         for op in payload.get('operations') or []])
+    part_number = _text(fix.get('part_number'))
+    if part_number and not _PLACEHOLDER.match(part_number):
+        repaired['part_number'] = part_number
+    for op in fix.get('operations') or []:
+        index = _number(op.get('index')) if isinstance(op, dict) else None
+        if index is None or not 0 <= int(index) < len(repaired['operations']):
+            continue
+        current = repaired['operations'][int(index)]
+        current = dict(current) if isinstance(current, dict) else {}
+        current.update({key: value for key, value in op.items() if key != 'index'})
+        repaired['operations'][int(index)] = current
+    return repaired
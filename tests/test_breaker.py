@@ -0,0 +1,84 @@
+import pytest
+
+from router_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen, get_breaker, route_models
+from router_hedging import HedgeCancelled
+from router_ratelimit import QuotaExceeded
+
+
+def _fail(breaker, times, error=RuntimeError):
+    for _ in range(times):
+        with pytest.raises(error):
+            with breaker.call():
+                raise error("boom")
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("model", failure_threshold=3, open_seconds=60)
+    _fail(breaker, 2)
+    assert breaker.state == CLOSED
+    _fail(breaker, 1)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen, match="RuntimeError"):
+        with breaker.call():
+            pass
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker("model", failure_threshold=2, open_seconds=60)
+    _fail(breaker, 1)
+    with breaker.call():
+        pass
+    _fail(breaker, 1)
+    assert breaker.state == CLOSED
+
+
+def test_slow_calls_count_as_failures():
+    breaker = CircuitBreaker("model", failure_threshold=2, slow_call_seconds=5, open_seconds=60)
+    breaker.record_success(10)
+    breaker.record_success(10)
+    assert breaker.state == OPEN
+    assert breaker.last_error == "slow response (10s)"
+
+
+@pytest.mark.parametrize("error", [QuotaExceeded, HedgeCancelled])
+def test_neutral_errors_leave_health_alone(error):
+    breaker = CircuitBreaker("model", failure_threshold=1, open_seconds=60)
+    _fail(breaker, 3, error)
+    assert breaker.state == CLOSED
+    assert breaker.consecutive_failures == 0
+
+
+def test_half_open_admits_one_probe():
+    breaker = CircuitBreaker("model", failure_threshold=1, open_seconds=0)
+    _fail(breaker, 1)
+    assert breaker.allow() is True
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpen, match="probe is in progress"):
+        breaker.allow()
+    breaker.record_success(0.1, probe=True)
+    assert breaker.state == CLOSED
+    assert breaker.allow() is False
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker("model", failure_threshold=3, open_seconds=0)
+    _fail(breaker, 3)
+    _fail(breaker, 1)
+    assert breaker.state == OPEN
+    assert breaker.times_opened == 2
+
+
+def test_probe_slot_freed_when_call_is_interrupted():
+    breaker = CircuitBreaker("model", failure_threshold=1, open_seconds=0)
+    _fail(breaker, 1)
+    _fail(breaker, 1, HedgeCancelled)
+    assert breaker.available()
+    assert breaker.allow() is True
+
+
+def test_route_models_falls_back_past_open_circuit():
+    _fail(get_breaker("test-route-primary"), 3)
+    assert route_models("test-route-primary", fallbacks=["test-route-fallback"]) == ("test-route-fallback", None)
+    assert route_models("test-route-healthy", "test-route-primary") == ("test-route-healthy", None)
+    with pytest.raises(CircuitOpen):
+        route_models("test-route-primary", fallbacks=[])
@@ -0,0 +1,68 @@
+import pytest
+
+from router_editor import MINUTES, SEQ, SETUP, WORK_CENTER, RouterEditor
+from router_model import parse_router, synthesize_router_csv
+
+
+def _editor():
+    return RouterEditor(synthesize_router_csv({
+        'part_number': 'Z110001B045',
+        'description': 'BRACKET',
+        'quantity': 100,
+        'operations': [
+            {'op': 10, 'work_center': 'SAW', 'description': 'CUT', 'setup_hours': 0.25, 'run_hours': 0.03,
+             'move_hours': 0.0, 'instruction': 'CUT TO LENGTH'},
+            {'op': 20, 'work_center': 'CNC-L', 'description': 'TURN', 'setup_hours': 2.0, 'run_hours': 3.83,
+             'move_hours': 0.0, 'instruction': 'TURN PER PRINT'},
+        ],
+    }))
+
+
+def test_totals_from_generated_router():
+    assert _editor().totals() == pytest.approx((2.25, 3.86, 0.0225, 0.0386))
+
+
+def test_unchanged_grid_returns_same_csv():
+    editor = _editor()
+    csv_text = editor.csv_text
+    assert editor.apply(editor.base_rows()) is csv_text
+    assert editor.rows_changed == 0
+
+
+def test_edited_row_updates_totals_in_cents():
+    editor = _editor()
+    rows = editor.base_rows()
+    rows[1][SETUP] = 1.5
+    rows[1][MINUTES] = 3.0
+    router = parse_router(editor.apply(rows))
+    assert editor.rows_changed == 2
+    assert editor.totals() == pytest.approx((1.75, 5.03, 0.0175, 0.0503))
+    assert router['operations'][1]['run_hours'] == 5.0
+    # The untouched row keeps its generated hours rather than a value rounded through min/pc
+    assert router['operations'][0]['run_hours'] == 0.03
+
+
+def test_many_edits_never_drift():
+    editor = _editor()
+    rows = editor.base_rows()
+    for minutes in [0.1, 0.2, 0.3, 0.7, 1.1, 2.3, 0.1]:
+        rows[0][MINUTES] = minutes
+        editor.apply(rows)
+    setup, run, _, _ = editor.totals()
+    assert (setup, run) == (2.25, 4.0)
+
+
+def test_removed_and_reordered_rows_renumber():
+    editor = _editor()
+    rows = editor.base_rows()
+    rows[0][SEQ] = 30
+    rows.append({SEQ: 5, WORK_CENTER: 'PAINT', SETUP: 0.5, MINUTES: 0.6})
+    rows.append({SEQ: 40, WORK_CENTER: ''})
+    router = parse_router(editor.apply(rows))
+    assert [(op['op'], op['work_center']) for op in router['operations']] == [
+        (10, 'PAINT'), (20, 'CNC-L'), (30, 'SAW')]
+    assert editor.totals()[:2] == pytest.approx((2.75, 4.86))
+
+    router = parse_router(editor.apply(rows[1:2]))
+    assert [op['work_center'] for op in router['operations']] == ['CNC-L']
+    assert editor.totals()[:2] == pytest.approx((2.0, 3.83))
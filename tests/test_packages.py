@@ -0,0 +1,30 @@
+import pytest
+
+from router_packages import group_pages, page_part_number
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("TITLE: BRACKET  PART NO: TS01000B072-1  REV A", "TS01000B072-1"),
+    ("P/N 2651C2858-1 SHEET 1 OF 2", "2651C2858-1"),
+    ("DWG NO. Z110001B045", "Z110001B045"),
+    ("part number: ab-1234.", "AB-1234"),
+    ("SLEEVE WIPING CAP Z110001B046 SCALE 1:1", "Z110001B046"),
+    ("PART NUMBER  DESCRIPTION  Z110001B047", "Z110001B047"),
+    ("SHEET 2 OF 3  SECTION A-A", None),
+    ("", None),
+    (None, None),
+])
+def test_page_part_number(text, expected):
+    assert page_part_number(text) == expected
+
+
+@pytest.mark.parametrize("numbers, expected", [
+    (["A1", "A1", "B2"], [("A1", [0, 1]), ("B2", [2])]),
+    (["A1", None, "B2", None, None], [("A1", [0, 1]), ("B2", [2, 3, 4])]),
+    ([None, None, "A1", "B2"], [("A1", [0, 1, 2]), ("B2", [3])]),
+    (["A1", "B2", "A1"], [("A1", [0]), ("B2", [1]), ("A1", [2])]),
+    ([None, None], [(None, [0, 1])]),
+    ([], []),
+])
+def test_group_pages(numbers, expected):
+    assert group_pages(numbers) == expected
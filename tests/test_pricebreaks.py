@@ -0,0 +1,90 @@
+import pytest
+
+from router_model import parse_router, synthesize_router_csv
+from router_pricebreaks import MAX_QUANTITIES, derive_price_breaks, parse_quantities, rescale_router
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Generate router for 50 pieces", [50]),
+    ("10/50/100/500", [10, 50, 100, 500]),
+    ("10, 50 and 100", [10, 50, 100]),
+    ("10-50 step 10", [10, 20, 30, 40, 50]),
+    ("10 to 500", [10, 500]),
+    ("qty: 10/50/100", [10, 50, 100]),
+])
+def test_quantity_forms(text, expected):
+    assert parse_quantities(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("50pcs", [50]),
+    ("50pc", [50]),
+    ("50ea", [50]),
+    ("50x", [50]),
+    ("50units", [50]),
+    ("10/50/100pcs", [10, 50, 100]),
+])
+def test_unit_suffix_ends_a_number(text, expected):
+    assert parse_quantities(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("qty50", [50]),
+    ("QTY:50", [50]),
+    ("quantity10/50", [10, 50]),
+    ("q25", [25]),
+])
+def test_glued_label(text, expected):
+    assert parse_quantities(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("TS01000B072-1 for 25", [25]),
+    ("due 2024-01-15, 40 pieces", [40]),
+    ("1.5 inch stock, 30 units", [30]),
+    ("4x8 sheet, 12 pcs", [12]),
+    ("TS01000B072-1", []),
+])
+def test_part_numbers_dates_and_decimals_are_not_quantities(text, expected):
+    assert parse_quantities(text) == expected
+
+
+def test_label_beats_earlier_number():
+    assert parse_quantities("rev 3 drawing, qty 75") == [75]
+
+
+def test_huge_stepped_range_keeps_both_ends():
+    quantities = parse_quantities("1-1000000000 step 1")
+    assert len(quantities) == MAX_QUANTITIES
+    assert quantities[0] == 1
+    assert quantities[-1] == 1000000000
+    assert quantities == sorted(quantities)
+
+
+def test_thinned_range_keeps_unaligned_upper_end():
+    quantities = parse_quantities("1-100 step 7")
+    assert len(quantities) == MAX_QUANTITIES
+    assert (quantities[0], quantities[-1]) == (1, 100)
+
+
+def test_rescale_scales_run_hours_only():
+    router = {'quantity': 10, 'operations': [{'setup_hours': 1.0, 'run_hours': 2.0}]}
+    scaled = rescale_router(router, 50)
+    assert scaled['quantity'] == 50
+    assert scaled['operations'][0] == {'setup_hours': 1.0, 'run_hours': 10.0}
+    assert router['operations'][0]['run_hours'] == 2.0
+
+
+def test_derive_price_breaks_from_one_router():
+    csv_text = synthesize_router_csv({
+        'part_number': 'Z110001B045',
+        'description': 'BRACKET',
+        'quantity': 100,
+        'operations': [{'op': 10, 'work_center': 'SAW', 'description': 'CUT', 'setup_hours': 0.25,
+                        'run_hours': 5.0, 'move_hours': 0.0, 'instruction': 'CUT TO LENGTH'}],
+    })
+    breaks = derive_price_breaks(csv_text, [10, 100])
+    assert sorted(breaks) == [10, 100]
+    small, large = parse_router(breaks[10]), parse_router(breaks[100])
+    assert small['operations'][0]['setup_hours'] == large['operations'][0]['setup_hours']
+    assert large['operations'][0]['run_hours'] == pytest.approx(small['operations'][0]['run_hours'] * 10)
@@ -0,0 +1,67 @@
+import threading
+import time
+
+import pytest
+
+from router_ratelimit import QuotaExceeded, RateLimiter, RateLimitTimeout, _SqliteStore
+
+
+def test_bucket_allows_a_minutes_worth_then_waits():
+    limiter = RateLimiter("model", requests_per_minute=3, requests_per_day=100)
+    for _ in range(3):
+        limiter.acquire(timeout=0.05)
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire(timeout=0.05)
+    assert limiter.queue_depth() == 0
+
+
+def test_daily_quota():
+    limiter = RateLimiter("model", requests_per_minute=60, requests_per_day=2)
+    limiter.acquire()
+    assert limiter.remaining_today() == 1
+    limiter.acquire()
+    with pytest.raises(QuotaExceeded):
+        limiter.acquire()
+
+
+def test_throttle_drains_the_bucket():
+    limiter = RateLimiter("model", requests_per_minute=60, requests_per_day=100)
+    limiter.throttle()
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire(timeout=0.05)
+
+
+def test_sqlite_store_shares_quota_between_limiters(tmp_path):
+    path = str(tmp_path / "quota.db")
+    first = RateLimiter("model", requests_per_minute=60, requests_per_day=2, store=_SqliteStore(path))
+    second = RateLimiter("model", requests_per_minute=60, requests_per_day=2, store=_SqliteStore(path))
+    first.acquire()
+    first.acquire()
+    assert second.remaining_today() == 0
+    with pytest.raises(QuotaExceeded):
+        second.acquire()
+
+
+def test_sessions_take_turns():
+    # One token every 0.1s, starting empty
+    limiter = RateLimiter("model", requests_per_minute=600, requests_per_day=100)
+    limiter.throttle()
+    served = []
+    lock = threading.Lock()
+
+    def request(name, session_id):
+        limiter.acquire(session_id, timeout=5)
+        with lock:
+            served.append(name)
+
+    threads = []
+    for name, session_id in [("a1", "a"), ("a2", "a"), ("a3", "a"), ("b1", "b")]:
+        thread = threading.Thread(target=request, args=(name, session_id))
+        thread.start()
+        threads.append(thread)
+        # Queue in a known order
+        while limiter.queue_depth() < len(threads) and thread.is_alive():
+            time.sleep(0.001)
+    for thread in threads:
+        thread.join()
+    assert served == ["a1", "b1", "a2", "a3"]
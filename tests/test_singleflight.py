@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+import pytest
+
+from router_singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def generate():
+        calls.append(1)
+        release.wait(5)
+        return "router"
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        leader = pool.submit(flights.do, "drawing", generate)
+        while flights.in_flight() == 0:
+            pass
+        followers = [pool.submit(flights.do, "drawing", generate) for _ in range(3)]
+        while flights.coalesced < 3:
+            pass
+        release.set()
+        results = [leader.result()] + [f.result() for f in followers]
+
+    assert results == ["router"] * 4
+    assert len(calls) == 1
+    assert (flights.leaders, flights.coalesced, flights.in_flight()) == (1, 3, 0)
+
+
+def test_followers_get_the_leaders_error():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def generate():
+        release.wait(5)
+        raise RuntimeError("model unavailable")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(flights.do, "drawing", generate)
+        while flights.in_flight() == 0:
+            pass
+        follower = pool.submit(flights.do, "drawing", generate)
+        while flights.coalesced < 1:
+            pass
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(RuntimeError, match="model unavailable"):
+                future.result()
+    assert flights.in_flight() == 0
+
+
+def test_finished_key_runs_again():
+    flights = SingleFlight()
+    assert flights.do("drawing", lambda: 1) == 1
+    assert flights.do("drawing", lambda: 2) == 2
+    assert flights.do("other", lambda: 3) == 3
+    assert (flights.leaders, flights.coalesced) == (3, 0)
@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from router_hedging import HedgeCancelled
+from router_model import parse_router
+from router_pipeline import repair_router_response
+from router_validation import apply_repair, find_defects, payload_from_csv
+
+
+def _payload(**op):
+    operation = {'work_center': 'SAW', 'description': 'CUT', 'setup_hours': 0.25, 'minutes_per_piece': 1.0,
+                 'instruction': 'CUT TO LENGTH'}
+    operation.update(op)
+    return {'part_number': 'Z110001B045', 'operations': [operation]}
+
+
+def test_clean_payload_has_no_defects():
+    assert find_defects(_payload(), quantity=50) == []
+
+
+@pytest.mark.parametrize("op, field", [
+    ({'work_center': 'LASER'}, 'work_center'),
+    ({'setup_hours': 'two'}, 'setup_hours'),
+    ({'setup_hours': 20}, 'setup_hours'),
+    ({'minutes_per_piece': -1}, 'minutes_per_piece'),
+    ({'minutes_per_piece': 40}, 'minutes_per_piece'),
+])
+def test_defective_operation_field(op, field):
+    assert [(d['row'], d['field']) for d in find_defects(_payload(**op), quantity=50)] == [(0, field)]
+
+
+@pytest.mark.parametrize("part_number", ["", "[PART#]", "UNKNOWN", "N/A"])
+def test_placeholder_part_number_is_a_header_defect(part_number):
+    payload = dict(_payload(), part_number=part_number)
+    assert find_defects(payload, quantity=50) == [
+        {'row': None, 'field': 'part_number', 'problem': "missing part number"}]
+
+
+def test_small_quantity_skips_run_time_range():
+    assert find_defects(_payload(minutes_per_piece=40), quantity=1) == []
+
+
+def test_csv_payload_reads_run_hours_back_to_minutes():
+    csv_text = ("Facility,Part Number,Rev,Description\n"
+                "Default,Z110001B045,A,BRACKET\n"
+                "10,SAW,CUT,50.0000,0.25,0.83,0.00,0.00,0.00,0.00\n"
+                ",CUT TO LENGTH,,,,,,,,,\n")
+    payload = payload_from_csv(csv_text, 50)
+    assert payload['part_number'] == 'Z110001B045'
+    assert payload['operations'][0]['minutes_per_piece'] == pytest.approx(0.996)
+    assert payload['operations'][0]['instruction'] == 'CUT TO LENGTH'
+
+
+def test_apply_repair_replaces_only_indexed_rows():
+    payload = _payload()
+    payload['operations'].append(dict(payload['operations'][0], work_center='LASER'))
+    repair = json.dumps({'part_number': 'UNKNOWN',
+                         'operations': [{'index': 1, 'work_center': 'WATERJT'}, {'index': 7, 'work_center': 'X'}]})
+    repaired = apply_repair(payload, f"```json\n{repair}\n```")
+    assert [op['work_center'] for op in repaired['operations']] == ['SAW', 'WATERJT']
+    assert repaired['part_number'] == 'Z110001B045'
+    assert payload['operations'][1]['work_center'] == 'LASER'
+
+
+def test_unreadable_repair_keeps_payload():
+    payload = _payload()
+    assert apply_repair(payload, "sorry, I can't do that") is payload
+
+
+def test_repair_round_trip_fixes_defective_row():
+    raw_text = json.dumps(_payload(work_center='LASER'))
+    prompts = []
+
+    def request_repair(prompt, defect_lines):
+        prompts.append(defect_lines)
+        return json.dumps({'operations': [{'index': 0, 'work_center': 'SAW'}]})
+
+    router = parse_router(repair_router_response(raw_text, 50, request_repair, attempts=1))
+    assert prompts == [["Operation 10: unknown work center LASER"]]
+    assert [op['work_center'] for op in router['operations']] == ['SAW']
+
+
+def test_clean_response_is_not_repaired():
+    def request_repair(prompt, defect_lines):
+        raise AssertionError("no repair expected")
+
+    router = parse_router(repair_router_response(json.dumps(_payload()), 50, request_repair))
+    assert router['part_number'] == 'Z110001B045'
+
+
+def test_failed_repair_keeps_response():
+    def request_repair(prompt, defect_lines):
+        raise RuntimeError("model unavailable")
+
+    router = parse_router(repair_router_response(json.dumps(_payload(work_center='LASER')), 50, request_repair))
+    assert [op['work_center'] for op in router['operations']] == ['LASER']
+
+
+def test_cancelled_hedge_attempt_stops_before_repair():
+    def request_repair(prompt, defect_lines):
+        raise HedgeCancelled()
+
+    with pytest.raises(HedgeCancelled):
+        repair_router_response(json.dumps(_payload(work_center='LASER')), 50, request_repair)